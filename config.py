@@ -48,3 +48,13 @@ preload_app = FLASK_ENV != 'development'
 workers = int(os.getenv('GUNICORN_WORKERS', 1))
 timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
 graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', timeout))
+
+
+def post_worker_init(worker):
+    # Tower template cache is local to the process, warm it up in each API
+    # worker, not in the (preloaded) master, CLI commands or Celery workers.
+    from rhub.lab import utils as lab_utils
+
+    app = worker.wsgi
+    if app.config['LAB_TOWER_TEMPLATE_CACHE_WARMUP']:
+        lab_utils.warm_tower_template_cache_in_background(app)
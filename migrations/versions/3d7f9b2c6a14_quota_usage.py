@@ -0,0 +1,53 @@
+"""
+quota usage
+
+Revision ID: 3d7f9b2c6a14
+Revises: 8c4e2a7d1f90
+Create Date: 2026-10-18 15:42:09.511204
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3d7f9b2c6a14'
+down_revision = '8c4e2a7d1f90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'lab_quota_usage',
+        sa.Column('region_id', sa.Integer(), nullable=False),
+        sa.Column('owner_id', sa.Integer(), nullable=False),
+        sa.Column('num_vcpus', sa.Integer(), nullable=False),
+        sa.Column('ram_mb', sa.Integer(), nullable=False),
+        sa.Column('num_volumes', sa.Integer(), nullable=False),
+        sa.Column('volumes_gb', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True),
+                  server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['owner_id'], ['auth_user.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['region_id'], ['lab_region.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('region_id', 'owner_id')
+    )
+    op.execute("""
+        INSERT INTO lab_quota_usage
+            (region_id, owner_id, num_vcpus, ram_mb, num_volumes, volumes_gb)
+        SELECT
+            lab_cluster.region_id,
+            openstack_project.owner_id,
+            coalesce(sum(lab_cluster_host.num_vcpus), 0),
+            coalesce(sum(lab_cluster_host.ram_mb), 0),
+            coalesce(sum(lab_cluster_host.num_volumes), 0),
+            coalesce(sum(lab_cluster_host.volumes_gb), 0)
+        FROM lab_cluster_host
+        JOIN lab_cluster ON lab_cluster_host.cluster_id = lab_cluster.id
+        JOIN openstack_project ON lab_cluster.project_id = openstack_project.id
+        GROUP BY lab_cluster.region_id, openstack_project.owner_id
+    """)
+
+
+def downgrade():
+    op.drop_table('lab_quota_usage')
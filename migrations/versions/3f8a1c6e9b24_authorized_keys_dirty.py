@@ -0,0 +1,28 @@
+"""
+authorized keys dirty
+
+Revision ID: 3f8a1c6e9b24
+Revises: 9e4b7d2a6c58
+Create Date: 2026-10-18 23:12:08.547310
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f8a1c6e9b24'
+down_revision = '9e4b7d2a6c58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        'auth_authorized_keys',
+        sa.Column('dirty', sa.Boolean(), server_default='FALSE', nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_column('auth_authorized_keys', 'dirty')
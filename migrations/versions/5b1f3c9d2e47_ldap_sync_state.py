@@ -0,0 +1,32 @@
+"""
+ldap sync state
+
+Revision ID: 5b1f3c9d2e47
+Revises: 03e16ed62a16
+Create Date: 2026-10-18 09:12:41.502318
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1f3c9d2e47'
+down_revision = '03e16ed62a16'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'auth_ldap_sync_state',
+        sa.Column('server', sa.String(length=256), nullable=False),
+        sa.Column('users_modify_timestamp', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('groups_modify_timestamp', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('last_full_sync', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('server')
+    )
+
+
+def downgrade():
+    op.drop_table('auth_ldap_sync_state')
@@ -0,0 +1,35 @@
+"""
+tower webhook notification
+
+Revision ID: 5b8e1c9d2f37
+Revises: 3d7f9b2c6a14
+Create Date: 2026-10-18 19:12:31.184502
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b8e1c9d2f37'
+down_revision = '3d7f9b2c6a14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'tower_webhook_notification',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('received_at', sa.DateTime(timezone=True),
+                  server_default=sa.text('now()'), nullable=False),
+        sa.Column('tower_job_id', sa.Integer(), nullable=False),
+        sa.Column('job_status', sa.String(length=32), nullable=False),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('processed_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('tower_webhook_notification')
@@ -0,0 +1,34 @@
+"""
+tower processed notification
+
+Revision ID: 7c2a4e6f1b93
+Revises: 5b8e1c9d2f37
+Create Date: 2026-10-18 20:41:07.527316
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c2a4e6f1b93'
+down_revision = '5b8e1c9d2f37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'tower_processed_notification',
+        sa.Column('tower_id', sa.Integer(), nullable=False),
+        sa.Column('tower_job_id', sa.Integer(), nullable=False),
+        sa.Column('job_status', sa.String(length=32), nullable=False),
+        sa.Column('processed_at', sa.DateTime(timezone=True),
+                  server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['tower_id'], ['tower_server.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('tower_id', 'tower_job_id', 'job_status')
+    )
+
+
+def downgrade():
+    op.drop_table('tower_processed_notification')
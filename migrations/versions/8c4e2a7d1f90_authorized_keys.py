@@ -0,0 +1,33 @@
+"""
+authorized keys
+
+Revision ID: 8c4e2a7d1f90
+Revises: 5b1f3c9d2e47
+Create Date: 2026-10-18 11:04:27.918533
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '8c4e2a7d1f90'
+down_revision = '5b1f3c9d2e47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'auth_authorized_keys',
+        sa.Column('scope', sa.String(length=64), nullable=False),
+        sa.Column('keys', postgresql.ARRAY(sa.Text()), server_default='{}', nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True),
+                  server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('scope')
+    )
+
+
+def downgrade():
+    op.drop_table('auth_authorized_keys')
@@ -0,0 +1,42 @@
+"""
+tower notification processed_at index
+
+Revision ID: 9e4b7d2a6c58
+Revises: 7c2a4e6f1b93
+Create Date: 2026-10-18 22:05:43.318260
+"""
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '9e4b7d2a6c58'
+down_revision = '7c2a4e6f1b93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        op.f('ix_tower_webhook_notification_processed_at'),
+        'tower_webhook_notification',
+        ['processed_at'],
+        unique=False
+    )
+    op.create_index(
+        op.f('ix_tower_processed_notification_processed_at'),
+        'tower_processed_notification',
+        ['processed_at'],
+        unique=False
+    )
+
+
+def downgrade():
+    op.drop_index(
+        op.f('ix_tower_processed_notification_processed_at'),
+        table_name='tower_processed_notification',
+    )
+    op.drop_index(
+        op.f('ix_tower_webhook_notification_processed_at'),
+        table_name='tower_webhook_notification',
+    )
@@ -24,6 +24,7 @@ from werkzeug import Response
 from rhub import ROOT_PKG_PATH
 from rhub.api.vault import VaultModule
 from rhub.auth.ldap import LdapModule
+from rhub.auth.oidc import OidcModule
 from rhub.messaging import MessagingModule
 from rhub.scheduler import SchedulerModule
 from rhub.worker import celery
@@ -246,6 +247,38 @@ def create_app(extra_config=None):
 
     db.init_app(flask_app)
     migrate.init_app(flask_app, db)
+
+    from rhub.auth import model as auth_model
+    auth_model.token_cache.configure(
+        maxsize=flask_app.config['AUTH_TOKEN_CACHE_SIZE'],
+        ttl=flask_app.config['AUTH_TOKEN_CACHE_TTL'],
+    )
+
+    from rhub.api import utils as api_utils
+    api_utils.count_cache.configure(
+        maxsize=flask_app.config['COUNT_CACHE_SIZE'],
+        ttl=flask_app.config['COUNT_CACHE_TTL'],
+    )
+
+    from rhub.lab import utils as lab_utils
+    lab_utils.tower_template_cache.configure(
+        maxsize=flask_app.config['LAB_TOWER_TEMPLATE_CACHE_SIZE'],
+        ttl=flask_app.config['LAB_TOWER_TEMPLATE_CACHE_TTL'],
+    )
+
+    from rhub.tower import model as tower_model
+    tower_model.tower_clients.configure(
+        pool_connections=flask_app.config['TOWER_CLIENT_POOL_CONNECTIONS'],
+        pool_maxsize=flask_app.config['TOWER_CLIENT_POOL_MAXSIZE'],
+        credentials_ttl=flask_app.config['TOWER_CLIENT_CREDENTIALS_TTL'],
+    )
+
+    from rhub.tower import output_cache
+    output_cache.job_output_cache.configure(
+        directory=flask_app.config['TOWER_JOB_OUTPUT_CACHE_DIR'],
+        max_size=flask_app.config['TOWER_JOB_OUTPUT_CACHE_SIZE'] * 1024 * 1024,
+    )
+
     celery.init_app(flask_app)
 
     RHUB_RETURN_INITIAL_FLASK_APP = os.getenv('RHUB_RETURN_INITIAL_FLASK_APP', 'False')
@@ -260,6 +293,7 @@ def create_app(extra_config=None):
             SchedulerModule(flask_app),
             MessagingModule(flask_app),
             LdapModule(flask_app),
+            OidcModule(flask_app),
         ],
     )
 
@@ -24,6 +24,73 @@ AUTH_OIDC_ALLOW_ISSUER_MISMATCH = (
     in ['true', 'yes', '1']
 )
 AUTH_OIDC_UUID_ATTR = os.getenv('AUTH_OIDC_UUID_ATTR')
+# Expected `aud` claim in access tokens, not checked if empty.
+AUTH_OIDC_AUDIENCE = os.getenv('AUTH_OIDC_AUDIENCE')
+# Use OIDC userinfo endpoint if token can't be validated locally.
+AUTH_OIDC_USERINFO_FALLBACK = (
+    os.getenv('AUTH_OIDC_USERINFO_FALLBACK', 'true').lower()
+    in ['true', 'yes', '1']
+)
+# How often to refresh OIDC provider metadata and keys, in seconds.
+AUTH_OIDC_REFRESH_INTERVAL = int(os.getenv('AUTH_OIDC_REFRESH_INTERVAL', '3600'))
+# How long to cache validated OIDC token, in seconds.
+AUTH_OIDC_TOKEN_CACHE_TTL = int(os.getenv('AUTH_OIDC_TOKEN_CACHE_TTL', '60'))
+
+# Cache of API tokens, see `rhub.auth.model.token_cache`. TTL is in seconds,
+# set size or TTL to 0 to disable the cache.
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', '1024'))
+AUTH_TOKEN_CACHE_TTL = int(os.getenv('AUTH_TOKEN_CACHE_TTL', '60'))
+
+# Cache of exact counts of unfiltered lists, see `rhub.api.utils.count_cache`.
+# TTL is in seconds, set size or TTL to 0 to disable the cache.
+COUNT_CACHE_SIZE = int(os.getenv('COUNT_CACHE_SIZE', '256'))
+COUNT_CACHE_TTL = int(os.getenv('COUNT_CACHE_TTL', '10'))
+
+# Launch Tower templates of cluster create and delete in Celery task, API
+# responds with 202 without waiting for Tower. Failed launches are retried
+# with exponential backoff, the delay is in seconds.
+LAB_TOWER_LAUNCH_ASYNC = (
+    os.getenv('LAB_TOWER_LAUNCH_ASYNC', '').lower()
+    in ['true', 'yes', '1']
+)
+LAB_TOWER_LAUNCH_MAX_RETRIES = int(os.getenv('LAB_TOWER_LAUNCH_MAX_RETRIES', '5'))
+LAB_TOWER_LAUNCH_RETRY_DELAY = int(os.getenv('LAB_TOWER_LAUNCH_RETRY_DELAY', '30'))
+
+# Cache of Tower templates resolved from product template names, see
+# `rhub.lab.utils.tower_template_cache`. TTL is in seconds, set size or TTL to
+# 0 to disable the cache. If warmup is enabled, templates of all enabled
+# products are loaded to the cache in background on startup of each gunicorn
+# worker (`post_worker_init` hook in gunicorn config.py).
+LAB_TOWER_TEMPLATE_CACHE_SIZE = int(os.getenv('LAB_TOWER_TEMPLATE_CACHE_SIZE', '256'))
+LAB_TOWER_TEMPLATE_CACHE_TTL = int(os.getenv('LAB_TOWER_TEMPLATE_CACHE_TTL', '3600'))
+LAB_TOWER_TEMPLATE_CACHE_WARMUP = (
+    os.getenv('LAB_TOWER_TEMPLATE_CACHE_WARMUP', 'true').lower()
+    in ['true', 'yes', '1']
+)
+
+# Tower clients are reused between requests, see
+# `rhub.tower.model.tower_clients`. Pool sizes are for the HTTP connection pool
+# shared by all clients (number of Tower hosts, connections per host),
+# credentials are re-read from Vault at most once per TTL seconds.
+TOWER_CLIENT_POOL_CONNECTIONS = int(os.getenv('TOWER_CLIENT_POOL_CONNECTIONS', '10'))
+TOWER_CLIENT_POOL_MAXSIZE = int(os.getenv('TOWER_CLIENT_POOL_MAXSIZE', '10'))
+TOWER_CLIENT_CREDENTIALS_TTL = int(os.getenv('TOWER_CLIENT_CREDENTIALS_TTL', '60'))
+
+# Persistent cache of finished Tower job output, see
+# `rhub.tower.output_cache.job_output_cache`. Size is in MiB, set to 0 to
+# disable the cache.
+TOWER_JOB_OUTPUT_CACHE_DIR = os.getenv(
+    'TOWER_JOB_OUTPUT_CACHE_DIR', str(RHUB_DATA_DIR / 'tower_job_output'),
+)
+TOWER_JOB_OUTPUT_CACHE_SIZE = int(os.getenv('TOWER_JOB_OUTPUT_CACHE_SIZE', '1024'))
+
+# Tower webhook notifications are processed in Celery task, `running`
+# notification is checked again in Tower after the delay (seconds). Processing
+# that failed on Tower or DB connection error is retried with exponential
+# backoff, the delay is in seconds.
+TOWER_WEBHOOK_RECHECK_DELAY = int(os.getenv('TOWER_WEBHOOK_RECHECK_DELAY', '5'))
+TOWER_WEBHOOK_MAX_RETRIES = int(os.getenv('TOWER_WEBHOOK_MAX_RETRIES', '5'))
+TOWER_WEBHOOK_RETRY_DELAY = int(os.getenv('TOWER_WEBHOOK_RETRY_DELAY', '30'))
 
 # DB_TYPE can be 'postgresq', 'postgresql+psycopg', ... any postgres
 # implementation.
@@ -50,6 +117,14 @@ VAULT_TYPE = os.getenv('VAULT_TYPE')
 VAULT_ADDR = os.getenv('VAULT_ADDR')
 VAULT_ROLE_ID = os.getenv('VAULT_ROLE_ID')
 VAULT_SECRET_ID = os.getenv('VAULT_SECRET_ID')
+# Secrets are cached for their lease duration but at most for max staleness
+# seconds, 0 disables the cache. AppRole token is renewed in background.
+VAULT_CACHE_MAX_STALENESS = int(os.getenv('VAULT_CACHE_MAX_STALENESS', '60'))
+VAULT_CACHE_SIZE = int(os.getenv('VAULT_CACHE_SIZE', '1024'))
+VAULT_TOKEN_RENEW = (
+    os.getenv('VAULT_TOKEN_RENEW', 'true').lower()
+    in ['true', 'yes', '1']
+)
 # file vault variables
 VAULT_PATH = os.getenv('VAULT_PATH')
 
@@ -81,6 +81,39 @@ def setup():
             job_params=None,
         )
     )
+    create_cronjob(
+        scheduler_model.SchedulerCronJob(
+            name='Verify quota usage',
+            description=(
+                'Compare materialized quota usage with cluster hosts and fix '
+                'mismatched rows.'
+            ),
+            enabled=True,
+            time_expr='30 * * * *',  # hourly
+            job_name=scheduler_jobs.verify_quota_usage.name,
+            job_params=None,
+        )
+    )
+    create_cronjob(
+        scheduler_model.SchedulerCronJob(
+            name='Requeue Tower notifications',
+            description='Queue processing of Tower webhook notifications that were not processed.',
+            enabled=True,
+            time_expr='*/10 * * * *',  # every 10 minutes
+            job_name=scheduler_jobs.requeue_tower_notifications.name,
+            job_params=None,
+        )
+    )
+    create_cronjob(
+        scheduler_model.SchedulerCronJob(
+            name='Cleanup Tower notifications',
+            description='Delete old Tower webhook notifications.',
+            enabled=True,
+            time_expr='0 2 * * *',  # daily
+            job_name=scheduler_jobs.cleanup_tower_notifications.name,
+            job_params=None,
+        )
+    )
 
     # Cleanup invalid cron jobs (renamed or removed functions, etc.)
     scheduler_model.SchedulerCronJob.query.filter(
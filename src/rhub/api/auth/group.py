@@ -4,7 +4,7 @@ from connexion import problem
 from flask import url_for
 
 from rhub.api import DEFAULT_PAGE_LIMIT
-from rhub.api.utils import db_sort
+from rhub.api.utils import db_count, db_paginate
 from rhub.auth import model
 
 
@@ -18,7 +18,7 @@ def _group_href(group):
     }
 
 
-def group_list(filter_, sort=None, page=0, limit=DEFAULT_PAGE_LIMIT):
+def group_list(filter_, sort=None, page=0, limit=DEFAULT_PAGE_LIMIT, cursor=None, total='exact'):
     groups = model.Group.query
 
     if 'name' in filter_:
@@ -33,15 +33,18 @@ def group_list(filter_, sort=None, page=0, limit=DEFAULT_PAGE_LIMIT):
         if 'user_name' in filter_:
             groups = groups.filter(model.User.name == filter_['user_name'])
 
-    if sort:
-        groups = db_sort(groups, sort)
+    paginated = db_paginate(
+        groups, model.Group.id, sort,
+        page=page, limit=limit, cursor=cursor,
+    )
 
     return {
         'data': [
             group.to_dict() | {'_href': _group_href(group)}
-            for group in groups.limit(limit).offset(page * limit)
+            for group in paginated.rows
         ],
-        'total': groups.count(),
+        'total': db_count(groups, total, cache=not filter_),
+        '_href': paginated.href(),
     }
 
 
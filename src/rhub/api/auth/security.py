@@ -2,13 +2,19 @@ import datetime
 import logging
 
 from flask import current_app
-from oic import oic
 from werkzeug.exceptions import Unauthorized
 
 from rhub.api import db, di
 from rhub.api.utils import date_now
-from rhub.auth import ldap
+from rhub.auth import ldap, oidc
 from rhub.auth import model as auth_model
+from rhub.auth import tasks as auth_tasks
+
+
+#: User data older than this are refreshed from LDAP.
+USER_REFRESH_INTERVAL = datetime.timedelta(hours=12)
+#: Time to wait for the refresh task before another one can be queued.
+USER_REFRESH_LEASE = datetime.timedelta(minutes=10)
 
 
 def basic_auth(username, password):
@@ -18,20 +24,20 @@ def basic_auth(username, password):
         logger.error("invalid username, only '__token__' is valid")
         raise Unauthorized()
 
-    token_row = auth_model.Token.find(password)
-    if not token_row:
+    token = auth_model.Token.find_cached(password)
+    if not token:
         logger.error('token does not exist in the DB')
         raise Unauthorized()
 
-    if token_row.is_expired:
-        logger.error(f'token ID={token_row.id} has expired')
+    if token.is_expired:
+        logger.error(f'token ID={token.id} has expired')
         raise Unauthorized('Token has expired.')
 
-    if token_row.user.deleted:
-        logger.error(f'user ID={token_row.user_id} has been deleted')
+    if token.user_deleted:
+        logger.error(f'user ID={token.user_id} has been deleted')
         raise Unauthorized()
 
-    return {'uid': token_row.user_id}
+    return {'uid': token.user_id}
 
 
 def bearer_auth(token):
@@ -42,22 +48,21 @@ def bearer_auth(token):
         logger.warning('OIDC auth is disabled')
         raise Unauthorized()
 
-    try:
-        client = oic.Client()
-        if current_app.config.get('AUTH_OIDC_ALLOW_ISSUER_MISMATCH'):
-            client.allow["issuer_mismatch"] = True
-
-        client.provider_config(oidc_endpoint)
-
-        user_info = client.do_user_info_request(token=token)
-        if 'error' in user_info:
-            logger.error(f'invalid token, {user_info["error_description"]}')
+    # Prefixed to not mix OIDC tokens with API tokens in the cache.
+    token_hash = 'oidc:' + auth_model.Token.hash_token(token)
+    if cached_token := auth_model.token_cache.get(token_hash):
+        if cached_token.is_expired or cached_token.user_deleted:
             raise Unauthorized()
+        return {'uid': cached_token.user_id}
 
+    try:
         external_uuid_attr = current_app.config.get('AUTH_OIDC_UUID_ATTR')
         if not external_uuid_attr:
             external_uuid_attr = 'sub'
 
+        oidc_provider = di.get(oidc.OidcProvider)
+        user_info = _oidc_user_info(oidc_provider, token, external_uuid_attr)
+
         external_uuid = user_info[external_uuid_attr]
 
         user_row = auth_model.User.query.filter(
@@ -77,6 +82,23 @@ def bearer_auth(token):
             logger.error(f'user ID={user_row.id} has been deleted')
             raise Unauthorized()
 
+        expires_at = None
+        if 'exp' in user_info:
+            expires_at = datetime.datetime.fromtimestamp(
+                user_info['exp'], datetime.timezone.utc,
+            )
+
+        auth_model.token_cache.set(
+            token_hash,
+            auth_model.CachedToken(
+                id=None,
+                user_id=user_row.id,
+                expires_at=expires_at,
+                user_deleted=False,
+            ),
+            ttl=current_app.config['AUTH_OIDC_TOKEN_CACHE_TTL'],
+        )
+
         return {'uid': user_row.id}
 
     except Exception:
@@ -84,18 +106,60 @@ def bearer_auth(token):
         raise Unauthorized()
 
 
+def _oidc_user_info(oidc_provider, token, external_uuid_attr):
+    """
+    Get user info from the token claims, token is validated locally. Userinfo
+    endpoint of the OIDC provider is used only if the token is not JWT or
+    claims don't contain user UUID attribute, and the fallback is enabled
+    (`AUTH_OIDC_USERINFO_FALLBACK` config).
+    """
+    logger = logging.getLogger(f'{__name__}.bearer_auth')
+
+    try:
+        claims = oidc_provider.verify_token(token)
+        if external_uuid_attr in claims:
+            return claims
+        logger.debug(f'{external_uuid_attr!r} is missing in token claims')
+    except oidc.OidcError as e:
+        logger.debug(f'token cannot be validated locally, {e!s}')
+
+    if not current_app.config['AUTH_OIDC_USERINFO_FALLBACK']:
+        raise Unauthorized()
+
+    return oidc_provider.user_info(token)
+
+
+def _claim_user_refresh(user_row):
+    """
+    Claim refresh of the stale user, only one request (in any process) gets
+    the claim. `updated_at` is moved so that the user is not considered stale
+    for :data:`USER_REFRESH_LEASE`, if the refresh task fails, it is queued
+    again after the lease expires.
+    """
+    now = date_now()
+    claimed = auth_model.User.query.filter(
+        auth_model.User.id == user_row.id,
+        auth_model.User.updated_at < now - USER_REFRESH_INTERVAL,
+    ).update(
+        {'updated_at': now - USER_REFRESH_INTERVAL + USER_REFRESH_LEASE},
+        synchronize_session=False,
+    )
+    db.session.commit()
+    return claimed == 1
+
+
 def _user_sync(ldap_client, external_uuid, user_row):
     logger = logging.getLogger(f'{__name__}.user_sync')
 
     if user_row:
-        update_threshold = date_now() - datetime.timedelta(hours=12)
-        if user_row.updated_at < update_threshold:
-            logger.info(
-                f'user with {external_uuid=} exists, will try to update data from LDAP'
-            )
-            user_row.update_from_ldap(ldap_client)
-            db.session.commit()
-            logger.info(f'updated user ID={user_row.id} {external_uuid=} in the DB')
+        # Stale-while-revalidate, request is served with data from the DB and
+        # the user is updated from LDAP in Celery task.
+        if user_row.updated_at < date_now() - USER_REFRESH_INTERVAL:
+            if _claim_user_refresh(user_row):
+                logger.info(
+                    f'user with {external_uuid=} exists, queued update of data from LDAP'
+                )
+                auth_tasks.refresh_user.delay(user_row.id)
 
     else:
         logger.info(
@@ -78,5 +78,9 @@ def token_delete(user_id, token_id, user):
             "You don't have permission to delete other users' tokens."
         )
 
+    token_hash = token_row.token
+
     db.session.delete(token_row)
     db.session.commit()
+
+    model.token_cache_invalidate(token_hash=token_hash)
@@ -4,7 +4,7 @@ from connexion import problem
 from flask import url_for
 
 from rhub.api import DEFAULT_PAGE_LIMIT
-from rhub.api.utils import db_sort
+from rhub.api.utils import db_count, db_paginate
 from rhub.auth import model
 
 
@@ -22,7 +22,7 @@ def _user_href(user):
     return href
 
 
-def user_list(filter_, sort=None, page=0, limit=DEFAULT_PAGE_LIMIT):
+def user_list(filter_, sort=None, page=0, limit=DEFAULT_PAGE_LIMIT, cursor=None, total='exact'):
     users = model.User.query.filter(model.User.deleted.is_(False))
 
     if 'name' in filter_:
@@ -37,15 +37,18 @@ def user_list(filter_, sort=None, page=0, limit=DEFAULT_PAGE_LIMIT):
         if 'group_name' in filter_:
             users = users.filter(model.Group.name == filter_['group_name'])
 
-    if sort:
-        users = db_sort(users, sort)
+    paginated = db_paginate(
+        users, model.User.id, sort,
+        page=page, limit=limit, cursor=cursor,
+    )
 
     return {
         'data': [
             user.to_dict() | {'_href': _user_href(user)}
-            for user in users.limit(limit).offset(page * limit)
+            for user in paginated.rows
         ],
-        'total': users.count(),
+        'total': db_count(users, total, cache=not filter_),
+        '_href': paginated.href(),
     }
 
 
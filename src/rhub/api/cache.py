@@ -0,0 +1,111 @@
+import collections
+import threading
+import time
+
+
+class TTLCache:
+    """
+    Thread-safe in-process cache with time-to-live and LRU eviction.
+
+    Entries older than `ttl` seconds are treated as missing, when the cache is
+    full the least recently used entry is evicted. Cache with `maxsize` or
+    `ttl` set to zero is disabled, :meth:`set` does nothing and :meth:`get`
+    always misses.
+
+    Cache is local to the process, other gunicorn workers or Celery workers
+    don't see invalidations, so `ttl` should be short enough to make stale
+    entries acceptable.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.RLock()
+
+    def __repr__(self):
+        return f'<TTLCache maxsize={self.maxsize} ttl={self.ttl} size={len(self)}>'
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def enabled(self):
+        return self.maxsize > 0 and self.ttl > 0
+
+    def configure(self, maxsize=None, ttl=None):
+        """Change cache size or TTL, existing entries are kept."""
+        with self._lock:
+            if maxsize is not None:
+                self.maxsize = maxsize
+            if ttl is not None:
+                self.ttl = ttl
+            self._evict()
+
+    def get(self, key, default=None):
+        """Get value from the cache, `default` if missing or expired."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expires, value = item
+                if expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        """Store value in the cache, optionally with custom `ttl`."""
+        if not self.enabled:
+            return
+        with self._lock:
+            expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            self._evict()
+
+    def delete(self, key):
+        """Remove entry from the cache, missing key is ignored."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_if(self, predicate):
+        """
+        Remove all entries for which `predicate(key, value)` is true.
+
+        :returns: number of removed entries
+        """
+        with self._lock:
+            keys = [k for k, (_, v) in self._data.items() if predicate(k, v)]
+            for k in keys:
+                del self._data[k]
+            return len(keys)
+
+    def clear(self):
+        """Remove all entries and reset statistics."""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Cache statistics, useful for sizing the cache."""
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+    def _evict(self):
+        if not self.enabled:
+            self._data.clear()
+            return
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
@@ -3,14 +3,15 @@ import logging
 
 import sqlalchemy
 from connexion import problem
-from flask import Response, url_for
+from flask import Response, current_app, request, url_for
 
 from rhub.api import DEFAULT_PAGE_LIMIT, db, di
 from rhub.api.lab.region import _user_can_access_region
-from rhub.api.utils import date_now, date_parse, db_sort
+from rhub.api.utils import date_now, date_parse, db_count, db_paginate
 from rhub.auth import model as auth_model
 from rhub.auth import utils as auth_utils
 from rhub.lab import SHAREDCLUSTER_GROUP, model
+from rhub.lab import tasks as lab_tasks
 from rhub.lab import utils as lab_utils
 from rhub.messaging import Messaging
 from rhub.openstack import model as openstack_model
@@ -22,8 +23,7 @@ logger = logging.getLogger(__name__)
 
 def _user_is_cluster_admin(user_id):
     """Check if user is cluster admin."""
-    user = auth_model.User.query.get(user_id)
-    return user.is_admin or auth_model.Role.LAB_CLUSTER_ADMIN in user.roles
+    return auth_utils.get_principal(user_id).is_cluster_admin
 
 
 def _user_can_access_cluster(cluster, user_id):
@@ -133,7 +133,42 @@ def _cluster_host_href(cluster_host):
     return href
 
 
-def list_clusters(user, filter_, sort=None, page=0, limit=DEFAULT_PAGE_LIMIT):
+def _cluster_list_options(selection):
+    """
+    Loader options for lists of clusters, relationships used by
+    :meth:`rhub.lab.model.Cluster.to_dict` and :func:`_cluster_href` are
+    loaded together with the clusters, so the number of queries doesn't
+    depend on the page size. Relationships of attributes that are not in
+    `selection` (:class:`rhub.api.utils.FieldSelection`) are not loaded.
+    Query must be joined with the project.
+    """
+    # Region is always needed by the href (``openstack`` link).
+    region = sqlalchemy.orm.joinedload(model.Cluster.region)
+    # Quota usage is returned only if the user quota is set.
+    if 'quota' in selection or 'quota_usage' in selection:
+        region = region.joinedload(model.Region.user_quota)
+    options = [sqlalchemy.orm.contains_eager(model.Cluster.project), region]
+    if 'owner_name' in selection:
+        options.append(
+            sqlalchemy.orm.contains_eager(model.Cluster.project)
+            .joinedload(openstack_model.Project.owner)
+        )
+    if 'group_name' in selection or 'shared' in selection:
+        options.append(
+            sqlalchemy.orm.contains_eager(model.Cluster.project)
+            .joinedload(openstack_model.Project.group)
+        )
+    if 'product_name' in selection:
+        options.append(sqlalchemy.orm.joinedload(model.Cluster.product))
+    if 'hosts' in selection:
+        options.append(sqlalchemy.orm.selectinload(model.Cluster.hosts))
+    return options
+
+
+def list_clusters(user, filter_, sort=None, page=0, limit=DEFAULT_PAGE_LIMIT, cursor=None,
+                  total='exact', fields=None, expand=None):
+    selection = model.Cluster.field_selection(fields, expand)
+
     if _user_is_cluster_admin(user):
         clusters = model.Cluster.query
     else:
@@ -208,17 +243,23 @@ def list_clusters(user, filter_, sort=None, page=0, limit=DEFAULT_PAGE_LIMIT):
             model.Cluster.status != model.ClusterStatus.DELETED
         )
 
-    if sort:
-        clusters = db_sort(clusters, sort, {
+    paginated = db_paginate(
+        clusters.options(*_cluster_list_options(selection)), model.Cluster.id, sort, {
             'name': 'lab_cluster.name',
-        })
+        },
+        page=page, limit=limit, cursor=cursor,
+    )
+
+    if 'quota_usage' in selection:
+        model.Cluster.load_quota_usage(c for c in paginated.rows if c.quota)
 
     return {
         'data': [
-            cluster.to_dict() | {'_href': _cluster_href(cluster)}
-            for cluster in clusters.limit(limit).offset(page * limit)
+            cluster.to_dict(fields, expand) | {'_href': _cluster_href(cluster)}
+            for cluster in paginated.rows
         ],
-        'total': clusters.count(),
+        'total': db_count(clusters, total, cache=not filter_),
+        '_href': paginated.href(),
     }
 
 
@@ -416,34 +457,26 @@ def create_cluster(body, user):
             return problem(500, 'Internal Server Error',
                            'Failed to calculate cluster usage.')
 
-    try:
-        tower_client = region.tower.create_tower_client()
-        tower_template = tower_client.template_get(
-            template_name=product.tower_template_name_create,
-        )
+    if current_app.config['LAB_TOWER_LAUNCH_ASYNC']:
+        cluster.status = model.ClusterStatus.QUEUED
+        db.session.commit()
+        try:
+            lab_utils.queue_cluster_launch(cluster, lab_tasks.launch_cluster_create,
+                                           model.ClusterStatus.CREATE_FAILED, user)
+        except Exception:
+            return problem(500, 'Internal Server Error',
+                           'Failed to trigger cluster creation.')
 
         logger.info(
-            f'Launching Tower template {tower_template["name"]} '
-            f'(id={tower_template["id"]}), '
-            f'extra_vars={cluster.tower_launch_extra_vars!r}',
-            extra={'user_id': user},
-        )
-        tower_job = tower_client.template_launch(
-            tower_template['id'],
-            {'extra_vars': cluster.tower_launch_extra_vars},
+            f'Cluster {cluster.name} (id {cluster.id}) created by user {user}, '
+            'Tower launch is queued',
+            extra={'user_id': user, 'cluster_id': cluster.id},
         )
 
-        cluster_event = model.ClusterTowerJobEvent(
-            cluster_id=cluster.id,
-            user_id=user,
-            date=date_now(),
-            tower_id=region.tower_id,
-            tower_job_id=tower_job['id'],
-            status=model.ClusterStatus.QUEUED,
-        )
-        db.session.add(cluster_event)
+        return cluster.to_dict() | {'_href': _cluster_href(cluster)}, 202
 
-        cluster.status = model.ClusterStatus.QUEUED
+    try:
+        lab_utils.launch_cluster_create(cluster, user)
 
     except Exception as e:
         db.session.rollback()
@@ -461,7 +494,7 @@ def create_cluster(body, user):
     return cluster.to_dict() | {'_href': _cluster_href(cluster)}
 
 
-def get_cluster(cluster_id, user):
+def get_cluster(cluster_id, user, fields=None, expand=None):
     cluster = model.Cluster.query.get(cluster_id)
     if not cluster:
         return problem(404, 'Not Found', f'Cluster {cluster_id} does not exist')
@@ -469,7 +502,10 @@ def get_cluster(cluster_id, user):
     if not _user_can_access_cluster(cluster, user) and not cluster.shared:
         return problem(403, 'Forbidden', "You don't have access to this cluster.")
 
-    return cluster.to_dict() | {'_href': _cluster_href(cluster)}
+    if cluster.quota and 'quota_usage' in model.Cluster.field_selection(fields, expand):
+        model.Cluster.load_quota_usage([cluster])
+
+    return cluster.to_dict(fields, expand) | {'_href': _cluster_href(cluster)}
 
 
 def update_cluster(cluster_id, body, user):
@@ -641,12 +677,16 @@ def delete_cluster(cluster_id, user):
             'the cluster must be in the Active state or in any of failed states.',
         )
 
+    async_launch = current_app.config['LAB_TOWER_LAUNCH_ASYNC']
     try:
-        lab_utils.delete_cluster(cluster, user)
+        lab_utils.delete_cluster(cluster, user, async_launch=async_launch)
     except Exception:
         return problem(500, 'Internal Server Error',
                        'Failed to trigger cluster deletion.')
 
+    if async_launch:
+        return '', 202
+
 
 def list_cluster_events(cluster_id, user):
     cluster = model.Cluster.query.get(cluster_id)
@@ -673,7 +713,7 @@ def get_cluster_event(event_id, user):
     return event.to_dict() | {'_href': _cluster_event_href(event)}
 
 
-def get_cluster_event_stdout(event_id, user):
+def get_cluster_event_stdout(event_id, user, start_line=None, end_line=None):
     event = model.ClusterTowerJobEvent.query.get(event_id)
     if not event:
         return problem(404, 'Not Found', f'Event {event_id} does not exist')
@@ -682,7 +722,8 @@ def get_cluster_event_stdout(event_id, user):
         return problem(403, 'Forbidden', "You don't have access to related cluster.")
 
     try:
-        return Response(event.get_tower_job_output(), 200, content_type='text/plain')
+        stdout = event.get_tower_job_output_stream(start_line, end_line)
+        return Response(stdout, 200, content_type='text/plain', direct_passthrough=True)
     except TowerError as e:
         logger.exception(f'Failed to get job {event.tower_job_id} stdout, {e}')
         return problem(404, 'Error', 'Failed to get output from Tower')
@@ -801,4 +842,10 @@ def cluster_authorized_keys(cluster_id):
     cluster = model.Cluster.query.get(cluster_id)
     if not cluster:
         return problem(404, 'Not Found', f'Cluster {cluster_id} does not exist')
-    return '\n'.join(cluster.authorized_keys) + '\n'
+
+    response = Response(
+        '\n'.join(cluster.authorized_keys) + '\n',
+        mimetype='text/plain',
+    )
+    response.add_etag()
+    return response.make_conditional(request)
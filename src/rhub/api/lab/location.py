@@ -5,7 +5,7 @@ from flask import url_for
 
 from rhub.api import DEFAULT_PAGE_LIMIT, db
 from rhub.api.lab.region import _region_href
-from rhub.api.utils import db_sort
+from rhub.api.utils import db_count, db_paginate
 from rhub.auth import utils as auth_utils
 from rhub.lab import model
 
@@ -23,18 +23,21 @@ def _location_href(location):
     return href
 
 
-def location_list(sort=None, page=0, limit=DEFAULT_PAGE_LIMIT):
+def location_list(sort=None, page=0, limit=DEFAULT_PAGE_LIMIT, cursor=None, total='exact'):
     locations = model.Location.query
 
-    if sort:
-        locations = db_sort(locations, sort)
+    paginated = db_paginate(
+        locations, model.Location.id, sort,
+        page=page, limit=limit, cursor=cursor,
+    )
 
     return {
         'data': [
             location.to_dict() | {'_href': _location_href(location)}
-            for location in locations.limit(limit).offset(page * limit)
+            for location in paginated.rows
         ],
-        'total': locations.count(),
+        'total': db_count(locations, total, cache=True),
+        '_href': paginated.href(),
     }
 
 
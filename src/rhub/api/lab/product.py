@@ -5,9 +5,10 @@ from connexion import problem
 from flask import url_for
 
 from rhub.api import DEFAULT_PAGE_LIMIT, db
-from rhub.api.utils import db_sort
+from rhub.api.utils import db_count, db_paginate
 from rhub.auth import utils as auth_utils
 from rhub.lab import model
+from rhub.lab import utils as lab_utils
 
 
 logger = logging.getLogger(__name__)
@@ -23,7 +24,8 @@ def _product_href(product):
     return href
 
 
-def list_products(user, filter_, sort=None, page=0, limit=DEFAULT_PAGE_LIMIT):
+def list_products(user, filter_, sort=None, page=0, limit=DEFAULT_PAGE_LIMIT, cursor=None,
+                  total='exact'):
     products = model.Product.query
 
     if 'name' in filter_:
@@ -32,15 +34,18 @@ def list_products(user, filter_, sort=None, page=0, limit=DEFAULT_PAGE_LIMIT):
     if 'enabled' in filter_:
         products = products.filter(model.Product.enabled == filter_['enabled'])
 
-    if sort:
-        products = db_sort(products, sort)
+    paginated = db_paginate(
+        products, model.Product.id, sort,
+        page=page, limit=limit, cursor=cursor,
+    )
 
     return {
         'data': [
             product.to_dict() | {'_href': _product_href(product)}
-            for product in products.limit(limit).offset(page * limit)
+            for product in paginated.rows
         ],
-        'total': products.count(),
+        'total': db_count(products, total, cache=not filter_),
+        '_href': paginated.href(),
     }
 
 
@@ -82,10 +87,17 @@ def update_product(product_id, body, user):
     if not product:
         return problem(404, 'Not Found', f'Product {product_id} does not exist')
 
+    template_names = {product.tower_template_name_create,
+                      product.tower_template_name_delete}
+
     product.update_from_dict(body)
 
     db.session.commit()
 
+    template_names.update([product.tower_template_name_create,
+                           product.tower_template_name_delete])
+    lab_utils.tower_template_cache_invalidate(template_names)
+
     logger.info(
         f'Product {product.name} (id {product.id}) updated by user {user}',
         extra={'user_id': user, 'product_id': product.id},
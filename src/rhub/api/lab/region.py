@@ -7,7 +7,7 @@ from flask import request, url_for
 from werkzeug.exceptions import Forbidden
 
 from rhub.api import DEFAULT_PAGE_LIMIT, db
-from rhub.api.utils import db_sort
+from rhub.api.utils import db_count, db_paginate
 from rhub.api.vault import Vault
 from rhub.auth import model as auth_model
 from rhub.auth import utils as auth_utils
@@ -44,6 +44,24 @@ def _region_href(region):
     return href
 
 
+def _region_list_options(selection):
+    """
+    Loader options for lists of regions, embedded objects and groups used by
+    :meth:`rhub.lab.model.Region.to_dict` are loaded together with the
+    regions only if they are in `selection`
+    (:class:`rhub.api.utils.FieldSelection`).
+    """
+    options = []
+    for name in model.Region.__embedded__ + model.Region.__embedded_ro__:
+        if name in selection:
+            options.append(sqlalchemy.orm.joinedload(getattr(model.Region, name)))
+    if 'owner_group_name' in selection:
+        options.append(sqlalchemy.orm.joinedload(model.Region.owner_group))
+    if 'users_group_name' in selection:
+        options.append(sqlalchemy.orm.joinedload(model.Region.users_group))
+    return options
+
+
 def _user_can_access_region(region, user_id):
     """Check if user can access region."""
     if auth_utils.user_is_admin(user_id):
@@ -73,7 +91,8 @@ def _query_regions_with_permissions(user):
         ))
 
 
-def list_regions(user, filter_, sort=None, page=0, limit=DEFAULT_PAGE_LIMIT):
+def list_regions(user, filter_, sort=None, page=0, limit=DEFAULT_PAGE_LIMIT, cursor=None,
+                 total='exact', fields=None, expand=None):
     regions = _query_regions_with_permissions(user)
 
     regions = regions.outerjoin(
@@ -121,18 +140,22 @@ def list_regions(user, filter_, sort=None, page=0, limit=DEFAULT_PAGE_LIMIT):
         )
         regions = regions.filter(users_group.name == filter_['users_group_name'])
 
-    if sort:
-        regions = db_sort(regions, sort, {
+    selection = model.Region.field_selection(fields, expand)
+    paginated = db_paginate(
+        regions.options(*_region_list_options(selection)), model.Region.id, sort, {
             'name': 'lab_region.name',
             'location': 'lab_location.name',
-        })
+        },
+        page=page, limit=limit, cursor=cursor,
+    )
 
     return {
         'data': [
-            region.to_dict() | {'_href': _region_href(region)}
-            for region in regions.limit(limit).offset(page * limit)
+            region.to_dict(fields, expand) | {'_href': _region_href(region)}
+            for region in paginated.rows
         ],
-        'total': regions.count(),
+        'total': db_count(regions, total, cache=not filter_),
+        '_href': paginated.href(),
     }
 
 
@@ -150,7 +173,7 @@ def create_region(vault: Vault, body, user):
     return region.to_dict() | {'_href': _region_href(region)}
 
 
-def get_region(region_id, user):
+def get_region(region_id, user, fields=None, expand=None):
     region = model.Region.query.get(region_id)
     if not region:
         return problem(404, 'Not Found', f'Region {region_id} does not exist')
@@ -158,7 +181,7 @@ def get_region(region_id, user):
     if not _user_can_access_region(region, user):
         raise Forbidden("You don't have access to this region.")
 
-    return region.to_dict() | {'_href': _region_href(region)}
+    return region.to_dict(fields, expand) | {'_href': _region_href(region)}
 
 
 def update_region(vault: Vault, region_id, body, user):
@@ -326,35 +349,89 @@ def get_usage(region_id, user, with_openstack_limits=None):
     return data
 
 
+def _query_all_usage(regions, user):
+    """
+    Query quotas and usage of `regions` (query of :class:`model.Region`) in
+    one pass. Rows are grouped by ``ROLLUP`` of region ID, so the last row
+    with ``region_id`` `None` is the sum of all regions.
+
+    Columns are ``region_id``, ``user_quota_id``, ``total_quota_id`` and
+    ``<prefix>_<field>`` for prefixes ``user_quota``, ``user_quota_usage``,
+    ``total_quota``, ``total_quota_usage`` and :attr:`model.Quota.FIELDS`.
+    """
+    user_quota = sqlalchemy.orm.aliased(model.Quota)
+    total_quota = sqlalchemy.orm.aliased(model.Quota)
+    QuotaUsage = model.QuotaUsage
+
+    usage = db.session.query(
+        QuotaUsage.region_id,
+        *(
+            sqlalchemy.func.sum(
+                sqlalchemy.case(
+                    (QuotaUsage.owner_id == user, getattr(QuotaUsage, k)),
+                    else_=0,
+                )
+            ).label(f'user_{k}')
+            for k in model.Quota.FIELDS
+        ),
+        *(
+            sqlalchemy.func.sum(getattr(QuotaUsage, k)).label(f'total_{k}')
+            for k in model.Quota.FIELDS
+        ),
+    ).group_by(QuotaUsage.region_id).subquery()
+
+    def usage_sum(column):
+        # SUM of bigint is numeric in Postgres, cast it back to get int.
+        return sqlalchemy.cast(
+            sqlalchemy.func.coalesce(sqlalchemy.func.sum(column), 0),
+            sqlalchemy.BigInteger,
+        )
+
+    columns = [
+        model.Region.id.label('region_id'),
+        sqlalchemy.func.max(user_quota.id).label('user_quota_id'),
+        sqlalchemy.func.max(total_quota.id).label('total_quota_id'),
+    ]
+    for k in model.Quota.FIELDS:
+        columns += [
+            sqlalchemy.func.sum(getattr(user_quota, k)).label(f'user_quota_{k}'),
+            usage_sum(usage.c[f'user_{k}']).label(f'user_quota_usage_{k}'),
+            sqlalchemy.func.sum(getattr(total_quota, k)).label(f'total_quota_{k}'),
+            usage_sum(usage.c[f'total_{k}']).label(f'total_quota_usage_{k}'),
+        ]
+
+    return (
+        db.session.query(*columns)
+        .select_from(model.Region)
+        .outerjoin(user_quota, user_quota.id == model.Region.user_quota_id)
+        .outerjoin(total_quota, total_quota.id == model.Region.total_quota_id)
+        .outerjoin(usage, usage.c.region_id == model.Region.id)
+        .filter(model.Region.id.in_(regions.with_entities(model.Region.id)))
+        .group_by(sqlalchemy.func.rollup(model.Region.id))
+    )
+
+
 def get_all_usage(user):
-    regions = list(_query_regions_with_permissions(user))
-    if not regions:
+    rows = _query_all_usage(_query_regions_with_permissions(user), user).all()
+    # ROLLUP returns the total row even if there are no regions.
+    if len(rows) < 2:
         return problem(404, 'Not Found', 'No regions exist')
 
-    data = {"all": region_to_usage(regions[0], user)}
-    data[str(regions[0].id)] = region_to_usage(regions[0], user)
-
-    def add_usage(usage1, usage2):
-        if not usage1:
-            usage1 = {}
-        if not usage2:
-            usage2 = {}
-        result = {}
-        for key in model.Quota.FIELDS:
-            result[key] = (usage1.get(key) or 0) + (usage2.get(key) or 0)
-        return result
-
-    for i in range(1, len(regions)):
-        current_region_usage = region_to_usage(regions[i], user)
-        data[str(regions[i].id)] = current_region_usage
-        current_usage_all_region = {}
-        current_usage_all_region['user_quota'] = add_usage(
-            data['all']['user_quota'], current_region_usage['user_quota'])
-        current_usage_all_region['user_quota_usage'] = add_usage(
-            data['all']['user_quota_usage'], current_region_usage['user_quota_usage'])
-        current_usage_all_region['total_quota'] = add_usage(
-            data['all']['total_quota'], current_region_usage['total_quota'])
-        current_usage_all_region['total_quota_usage'] = add_usage(
-            data['all']['total_quota_usage'], current_region_usage['total_quota_usage'])
-        data['all'] = current_usage_all_region
-    return data
+    def quota(row, prefix):
+        values = {k: getattr(row, f'{prefix}_{k}') for k in model.Quota.FIELDS}
+        if row.region_id is None:
+            # Sum of all regions, unlimited (NULL) quotas are counted as 0.
+            return {k: v or 0 for k, v in values.items()}
+        if prefix in ('user_quota', 'total_quota') and getattr(row, f'{prefix}_id') is None:
+            return None
+        return values
+
+    return {
+        str(row.region_id or 'all'): {
+            'user_quota': quota(row, 'user_quota'),
+            'user_quota_usage': quota(row, 'user_quota_usage'),
+            'total_quota': quota(row, 'total_quota'),
+            'total_quota_usage': quota(row, 'total_quota_usage'),
+        }
+        for row in rows
+    }
@@ -7,7 +7,7 @@ from werkzeug.exceptions import Forbidden
 
 from rhub import auth
 from rhub.api import DEFAULT_PAGE_LIMIT, db
-from rhub.api.utils import db_sort
+from rhub.api.utils import db_count, db_paginate
 from rhub.api.vault import Vault
 from rhub.auth import model as auth_model
 from rhub.openstack import model
@@ -57,7 +57,7 @@ def _user_can_access_project(project, user_id):
     return False
 
 
-def cloud_list(filter_, sort=None, page=0, limit=DEFAULT_PAGE_LIMIT):
+def cloud_list(filter_, sort=None, page=0, limit=DEFAULT_PAGE_LIMIT, cursor=None, total='exact'):
     clouds = model.Cloud.query
 
     if 'name' in filter_:
@@ -73,18 +73,18 @@ def cloud_list(filter_, sort=None, page=0, limit=DEFAULT_PAGE_LIMIT):
         )
         clouds = clouds.filter(auth_model.Group.name == filter_['owner_group_name'])
 
-    if sort:
-        clouds = db_sort(clouds, sort)
-
-    if sort:
-        clouds = db_sort(clouds, sort)
+    paginated = db_paginate(
+        clouds, model.Cloud.id, sort,
+        page=page, limit=limit, cursor=cursor,
+    )
 
     return {
         'data': [
             cloud.to_dict() | {'_href': _cloud_href(cloud)}
-            for cloud in clouds.limit(limit).offset(page * limit)
+            for cloud in paginated.rows
         ],
-        'total': clouds.count(),
+        'total': db_count(clouds, total, cache=not filter_),
+        '_href': paginated.href(),
     }
 
 
@@ -170,7 +170,8 @@ def cloud_delete(cloud_id, user):
     )
 
 
-def project_list(user, filter_, sort=None, page=0, limit=DEFAULT_PAGE_LIMIT):
+def project_list(user, filter_, sort=None, page=0, limit=DEFAULT_PAGE_LIMIT, cursor=None,
+                 total='exact'):
     if auth.utils.user_is_admin(user):
         projects = model.Project.query
     else:
@@ -204,17 +205,20 @@ def project_list(user, filter_, sort=None, page=0, limit=DEFAULT_PAGE_LIMIT):
         projects = projects.outerjoin(group, group.id == model.Project.group_id)
         projects = projects.filter(group.name == filter_['group_name'])
 
-    if sort:
-        projects = db_sort(projects, sort, {
+    paginated = db_paginate(
+        projects, model.Project.id, sort, {
             'name': 'openstack_project.name'
-        })
+        },
+        page=page, limit=limit, cursor=cursor,
+    )
 
     return {
         'data': [
             project.to_dict() | {'_href': _project_href(project)}
-            for project in projects.limit(limit).offset(page * limit)
+            for project in paginated.rows
         ],
-        'total': projects.count(),
+        'total': db_count(projects, total, cache=not filter_),
+        '_href': paginated.href(),
     }
 
 
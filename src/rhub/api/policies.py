@@ -3,7 +3,7 @@ import logging
 from connexion import problem
 
 from rhub.api import DEFAULT_PAGE_LIMIT, db
-from rhub.api.utils import db_sort
+from rhub.api.utils import db_count, db_paginate
 from rhub.auth import utils as auth_utils
 from rhub.policies import model
 
@@ -39,7 +39,8 @@ def _user_can_modify_policy(policy, user_id):
     return policy.owner_group_id in auth_utils.user_group_ids(user_id)
 
 
-def list_policies(user, filter_, sort=None, page=0, limit=DEFAULT_PAGE_LIMIT):
+def list_policies(user, filter_, sort=None, page=0, limit=DEFAULT_PAGE_LIMIT, cursor=None,
+                  total='exact'):
     """
     API endpoint to provide a list of policies
     """
@@ -56,14 +57,17 @@ def list_policies(user, filter_, sort=None, page=0, limit=DEFAULT_PAGE_LIMIT):
     if 'department' in filter_:
         policies = policies.filter(model.Policy.department.ilike(filter_['department']))
 
-    if sort:
-        policies = db_sort(policies, sort)
+    paginated = db_paginate(
+        policies, model.Policy.id, sort,
+        page=page, limit=limit, cursor=cursor,
+    )
 
     return {
         'data': [
-            policy._asdict() for policy in policies.limit(limit).offset(page * limit)
+            policy._asdict() for policy in paginated.rows
         ],
-        'total': policies.count(),
+        'total': db_count(policies, total, cache=not filter_),
+        '_href': paginated.href(),
     }
 
 
@@ -6,7 +6,7 @@ from werkzeug.exceptions import Forbidden
 
 from rhub import auth
 from rhub.api import DEFAULT_PAGE_LIMIT, db
-from rhub.api.utils import db_sort
+from rhub.api.utils import db_count, db_paginate
 from rhub.api.vault import Vault
 from rhub.auth import model as auth_model
 from rhub.satellite import model
@@ -29,7 +29,7 @@ def _server_href(server):
     return href
 
 
-def server_list(filter_, sort=None, page=0, limit=DEFAULT_PAGE_LIMIT):
+def server_list(filter_, sort=None, page=0, limit=DEFAULT_PAGE_LIMIT, cursor=None, total='exact'):
     servers = model.SatelliteServer.query
 
     if 'name' in filter_:
@@ -47,15 +47,18 @@ def server_list(filter_, sort=None, page=0, limit=DEFAULT_PAGE_LIMIT):
         )
         servers = servers.filter(auth_model.Group.name == filter_['owner_group_name'])
 
-    if sort:
-        servers = db_sort(servers, sort)
+    paginated = db_paginate(
+        servers, model.SatelliteServer.id, sort,
+        page=page, limit=limit, cursor=cursor,
+    )
 
     return {
         'data': [
             server.to_dict() | {'_href': _server_href(server)}
-            for server in servers.limit(limit).offset(page * limit)
+            for server in paginated.rows
         ],
-        'total': servers.count(),
+        'total': db_count(servers, total, cache=not filter_),
+        '_href': paginated.href(),
     }
 
 
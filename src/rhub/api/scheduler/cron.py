@@ -3,7 +3,7 @@ import logging
 from connexion import problem
 
 from rhub.api import db, DEFAULT_PAGE_LIMIT
-from rhub.api.utils import db_sort
+from rhub.api.utils import db_count, db_paginate
 from rhub.auth.utils import route_require_admin
 from rhub.scheduler import model
 
@@ -12,7 +12,8 @@ logger = logging.getLogger(__name__)
 
 
 @route_require_admin
-def list_jobs(user, filter_, sort=None, page=0, limit=DEFAULT_PAGE_LIMIT):
+def list_jobs(user, filter_, sort=None, page=0, limit=DEFAULT_PAGE_LIMIT, cursor=None,
+              total='exact'):
     cron_jobs = model.SchedulerCronJob.query
 
     if 'name' in filter_:
@@ -20,14 +21,17 @@ def list_jobs(user, filter_, sort=None, page=0, limit=DEFAULT_PAGE_LIMIT):
             model.SchedulerCronJob.name.ilike(filter_['name']),
         )
 
-    if sort:
-        cron_jobs = db_sort(cron_jobs, sort)
+    paginated = db_paginate(
+        cron_jobs, model.SchedulerCronJob.id, sort,
+        page=page, limit=limit, cursor=cursor,
+    )
 
     return {
         'data': [
-            i.to_dict() for i in cron_jobs.limit(limit).offset(page * limit)
+            i.to_dict() for i in paginated.rows
         ],
-        'total': cron_jobs.count()
+        'total': db_count(cron_jobs, total, cache=not filter_),
+        '_href': paginated.href(),
     }
 
 
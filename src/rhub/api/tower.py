@@ -1,16 +1,13 @@
-import json
 import logging
-import time
 
 from connexion import problem
 from flask import Response, request, url_for
 
 from rhub import auth
-from rhub.api import DEFAULT_PAGE_LIMIT, db, di
-from rhub.api.utils import date_now, db_sort
-from rhub.lab import model as lab_model
-from rhub.messaging import Messaging
-from rhub.tower import model
+from rhub.api import DEFAULT_PAGE_LIMIT, db
+from rhub.api.utils import db_count, db_paginate
+from rhub.tower import model, output_cache
+from rhub.tower import tasks as tower_tasks
 from rhub.tower.client import TowerError
 
 
@@ -66,21 +63,24 @@ def _job_href(job):
     return href | _template_href(job.template)
 
 
-def list_servers(filter_, sort=None, page=0, limit=DEFAULT_PAGE_LIMIT):
+def list_servers(filter_, sort=None, page=0, limit=DEFAULT_PAGE_LIMIT, cursor=None, total='exact'):
     servers = model.Server.query
 
     if 'name' in filter_:
         servers = servers.filter(model.Server.name.ilike(filter_['name']))
 
-    if sort:
-        servers = db_sort(servers, sort)
+    paginated = db_paginate(
+        servers, model.Server.id, sort,
+        page=page, limit=limit, cursor=cursor,
+    )
 
     return {
         'data': [
             server.to_dict() | {'_href': _server_href(server)}
-            for server in servers.limit(limit).offset(page * limit)
+            for server in paginated.rows
         ],
-        'total': servers.count(),
+        'total': db_count(servers, total, cache=not filter_),
+        '_href': paginated.href(),
     }
 
 
@@ -124,6 +124,8 @@ def update_server(server_id, body, user):
     server.update_from_dict(body)
     db.session.commit()
 
+    model.tower_clients.invalidate(server.id)
+
     logger.info(
         f'Server {server.name} (id {server.id}) updated by user {user}',
         extra={'user_id': user, 'server_id': server.id},
@@ -141,13 +143,21 @@ def delete_server(server_id, user):
     db.session.delete(server)
     db.session.commit()
 
+    model.tower_clients.invalidate(server.id)
+
     logger.info(
         f'Server {server.name} (id {server.id}) deleted by user {user}',
         extra={'user_id': user, 'server_id': server.id},
     )
 
 
-def list_templates(filter_, sort=None, page=0, limit=DEFAULT_PAGE_LIMIT):
+@auth.utils.route_require_admin
+def get_client_stats(user):
+    return model.tower_clients.stats()
+
+
+def list_templates(filter_, sort=None, page=0, limit=DEFAULT_PAGE_LIMIT, cursor=None,
+                   total='exact'):
     templates = model.Template.query
 
     if 'name' in filter_:
@@ -156,15 +166,18 @@ def list_templates(filter_, sort=None, page=0, limit=DEFAULT_PAGE_LIMIT):
     if 'server_id' in filter_:
         templates = templates.filter(model.Template.server_id == filter_['server_id'])
 
-    if sort:
-        templates = db_sort(templates, sort)
+    paginated = db_paginate(
+        templates, model.Template.id, sort,
+        page=page, limit=limit, cursor=cursor,
+    )
 
     return {
         'data': [
             template.to_dict() | {'_href': _template_href(template)}
-            for template in templates.limit(limit).offset(page * limit)
+            for template in paginated.rows
         ],
-        'total': templates.count(),
+        'total': db_count(templates, total, cache=not filter_),
+        '_href': paginated.href(),
     }
 
 
@@ -305,7 +318,8 @@ def launch_template(template_id, body, user):
         return problem(500, 'Server Error', f'Unknown server error, {e}')
 
 
-def list_template_jobs(template_id, user, filter_, page=0, limit=DEFAULT_PAGE_LIMIT):
+def list_template_jobs(template_id, user, filter_, page=0, limit=DEFAULT_PAGE_LIMIT, cursor=None,
+                       total='exact'):
     jobs = model.Job.query.filter(model.Job.template_id == template_id)
 
     if not auth.utils.user_is_admin(user):
@@ -314,16 +328,22 @@ def list_template_jobs(template_id, user, filter_, page=0, limit=DEFAULT_PAGE_LI
     if 'launched_by' in filter_:
         jobs = jobs.filter(model.Job.launched_by == filter_['launched_by'])
 
+    paginated = db_paginate(
+        jobs, model.Job.id,
+        page=page, limit=limit, cursor=cursor,
+    )
+
     return {
         'data': [
             job.to_dict() | {'_href': _job_href(job)}
-            for job in jobs.limit(limit).offset(page * limit)
+            for job in paginated.rows
         ],
-        'total': jobs.count(),
+        'total': db_count(jobs, total, cache=not filter_),
+        '_href': paginated.href(),
     }
 
 
-def list_jobs(user, filter_, page=0, limit=DEFAULT_PAGE_LIMIT):
+def list_jobs(user, filter_, page=0, limit=DEFAULT_PAGE_LIMIT, cursor=None, total='exact'):
     jobs = model.Job.query
 
     if not auth.utils.user_is_admin(user):
@@ -332,12 +352,18 @@ def list_jobs(user, filter_, page=0, limit=DEFAULT_PAGE_LIMIT):
     if 'launched_by' in filter_:
         jobs = jobs.filter(model.Job.launched_by == filter_['launched_by'])
 
+    paginated = db_paginate(
+        jobs, model.Job.id,
+        page=page, limit=limit, cursor=cursor,
+    )
+
     return {
         'data': [
             job.to_dict() | {'_href': _job_href(job)}
-            for job in jobs.limit(limit).offset(page * limit)
+            for job in paginated.rows
         ],
-        'total': jobs.count(),
+        'total': db_count(jobs, total, cache=not filter_),
+        '_href': paginated.href(),
     }
 
 
@@ -422,7 +448,7 @@ def relaunch_job(job_id, user):
         return problem(500, 'Server Error', f'Unknown server error, {e}')
 
 
-def get_job_stdout(job_id, user):
+def get_job_stdout(job_id, user, start_line=None, end_line=None):
     job = model.Job.query.get(job_id)
     if not job:
         return problem(404, 'Not Found', f'Job {job_id} does not exist')
@@ -432,10 +458,12 @@ def get_job_stdout(job_id, user):
                        f"You don't have permissions to view job {job_id} stdout")
 
     try:
-        tower_client = job.server.create_tower_client()
-        tower_job_stdout = tower_client.template_job_stdout(job.tower_job_id)
-        # Force text/plain response.
-        return Response(tower_job_stdout, 200, content_type='text/plain')
+        tower_job_stdout = output_cache.job_output_stream(
+            job.server, job.tower_job_id, start_line=start_line, end_line=end_line,
+        )
+        # Force text/plain response, stream the output from Tower.
+        return Response(tower_job_stdout, 200, content_type='text/plain',
+                        direct_passthrough=True)
 
     except TowerError as e:
         logger.exception(f'Failed to get job {job_id} stdout, {e}')
@@ -484,92 +512,21 @@ def webhook_notification():
     if job_url and '/jobs/project/' in job_url:
         return Response(status=204)
 
-    try:
-        extra_vars = json.loads(payload['extra_vars'])
-
-        # Notification from cluster create/delete job have `rhub_cluster_id`
-        # extra var.
-        if rhub_cluster_id := extra_vars.get('rhub_cluster_id'):
-            cluster_notification_handler(payload, rhub_cluster_id)
+    # Notification is processed in Celery task, so the webhook doesn't block
+    # the API worker while it waits for Tower.
+    notification = model.WebhookNotification(
+        tower_job_id=job_id,
+        job_status=job_status,
+        payload=payload,
+    )
+    db.session.add(notification)
+    db.session.commit()
 
+    try:
+        tower_tasks.process_webhook_notification.delay(notification.id)
     except Exception:
-        logger.exception(
-            f'Failed to process a notification from tower {job_id=} {job_status=}'
-        )
+        # Notification is stored, it is queued again by the cron job, error
+        # response would only make Tower deliver (and store) it again.
+        logger.exception(f'Failed to queue processing of a notification from tower {job_id=}')
 
     return Response(status=204)
-
-
-def cluster_notification_handler(payload, cluster_id):
-    messaging = di.get(Messaging)
-
-    cluster = lab_model.Cluster.query.get(cluster_id)
-    tower_client = cluster.region.tower.create_tower_client()
-
-    job_id = payload['id']
-    job_name = payload['name']
-    job_status = payload['status']
-
-    # If received notification and status is running, wait a few seconds and
-    # then check status of the job. Sometimes a job fails almost immediatelly
-    # after it started and does not send failure notification.
-    if job_status == 'running':
-        time.sleep(5)
-        job = tower_client.template_job_get(job_id)
-        if job['failed']:
-            job_status = 'failed'
-
-    if job_name == cluster.product.tower_template_name_create:
-        cluster_operation = 'create'
-    elif job_name == cluster.product.tower_template_name_delete:
-        cluster_operation = 'delete'
-    else:
-        return
-
-    def update_cluster_status(new_status):
-        if cluster.status != new_status:
-            cluster_event = lab_model.ClusterStatusChangeEvent(
-                cluster_id=cluster.id,
-                user_id=None,
-                date=date_now(),
-                old_value=cluster.status,
-                new_value=new_status,
-            )
-            db.session.add(cluster_event)
-            cluster.status = new_status
-            db.session.commit()
-
-    msg_extra = {
-        'owner_id': cluster.owner_id,
-        'owner_name': cluster.owner.name,
-        'cluster_id': cluster.id,
-        'cluster_name': cluster.name,
-        'tower_id': cluster.region.tower_id,
-        'job_id': job_id,
-        'job_status': job_status,
-    }
-
-    if job_status == 'successful':
-        messaging.send(
-            f'lab.cluster.{cluster_operation}',
-            f'Cluster "{cluster.name}" (ID={cluster.id}) has been successfully '
-            f'{cluster_operation}d.',
-            extra=msg_extra,
-        )
-        if cluster_operation == 'create':
-            update_cluster_status(lab_model.ClusterStatus.ACTIVE)
-        else:
-            update_cluster_status(lab_model.ClusterStatus.DELETED)
-
-    elif job_status == 'failed':
-        messaging.send(
-            f'lab.cluster.{cluster_operation}',
-            f'Failed to {cluster_operation} cluster "{cluster.name}" '
-            f'(ID={cluster.id}).',
-            extra=msg_extra,
-        )
-        if not cluster.status.is_failed:
-            if cluster_operation == 'create':
-                update_cluster_status(lab_model.ClusterStatus.CREATE_FAILED)
-            else:
-                update_cluster_status(lab_model.ClusterStatus.DELETE_FAILED)
@@ -1,15 +1,54 @@
+import base64
+import collections
 import copy
 import datetime
+import enum
+import json
 import socket
 import urllib.parse
 
 import dateutil.parser
+import flask
+import sqlalchemy
 from sqlalchemy import event
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.inspection import inspect
 from sqlalchemy.orm import declarative_mixin, declared_attr
 from sqlalchemy.sql import functions
 
-from rhub.api import db
+from rhub.api import DEFAULT_PAGE_LIMIT, db
+from rhub.api.cache import TTLCache
+
+
+class FieldSelection:
+    """
+    Attributes selected by ``fields`` and ``expand`` query parameters, see
+    :meth:`ModelMixin.to_dict`.
+
+    If neither is set, everything is selected. Otherwise `fields` selects
+    plain attributes (all if `None`) and `expandable` nested objects are
+    selected only if listed in `expand` or `fields`. ``id`` is always selected.
+    """
+
+    def __init__(self, fields=None, expand=None, expandable=()):
+        self.fields = set(fields) if fields is not None else None
+        self.expand = set(expand or ())
+        self.expandable = set(expandable)
+
+    def __repr__(self):
+        return f'<FieldSelection fields={self.fields} expand={self.expand}>'
+
+    @property
+    def all(self):
+        return self.fields is None and not self.expand
+
+    def __contains__(self, name):
+        if self.all or name == 'id':
+            return True
+        if name in self.expand or (self.fields is not None and name in self.fields):
+            return True
+        return self.fields is None and name not in self.expandable
 
 
 class ModelMixin:
@@ -17,15 +56,37 @@ class ModelMixin:
 
     __embedded__ = []       # read-write embedding
     __embedded_ro__ = []    # read-only embedding
+    __expandable__ = []     # other nested objects, see `field_selection`
+
+    @classmethod
+    def field_selection(cls, fields=None, expand=None):
+        """
+        Create :class:`FieldSelection` for the model, embedded objects and
+        `__expandable__` attributes are serialized only on request.
+        """
+        return FieldSelection(
+            fields, expand,
+            cls.__embedded__ + cls.__embedded_ro__ + cls.__expandable__,
+        )
+
+    def to_dict(self, fields=None, expand=None):
+        """
+        Covert a model's object to `dict`, with parent's columns.
 
-    def to_dict(self):
-        """Covert a model's object to `dict`, with parent's columns."""
+        :param fields: names of attributes to include, all if `None`
+        :param expand: names of embedded objects to include, all if both
+                       `fields` and `expand` are `None`
+        """
+        selection = self.field_selection(fields, expand)
         data = {}
 
         for column in inspect(self.__class__).columns:
-            data[column.name] = getattr(self, column.name)
+            if column.name in selection:
+                data[column.name] = getattr(self, column.name)
 
         for embedded_name in self.__embedded__ + self.__embedded_ro__:
+            if embedded_name not in selection:
+                continue
             if getattr(self, embedded_name):
                 data[embedded_name] = getattr(self, embedded_name).to_dict()
             else:
@@ -119,6 +180,180 @@ def db_sort(query, sort_by, column_remap=None):
     return query.order_by(db.text(f'{column} {direction}'))
 
 
+class Page(collections.namedtuple('Page', ['rows', 'next_cursor'])):
+    """Result of :func:`db_paginate`."""
+
+    def href(self):
+        """
+        Links for the list response, ``next`` is URL of the current request
+        with `cursor` of the next page, missing if this is the last page.
+        """
+        if self.next_cursor is None:
+            return {}
+        args = flask.request.args.copy()
+        args.pop('page', None)
+        args['cursor'] = self.next_cursor
+        query = urllib.parse.urlencode(list(args.items(multi=True)))
+        return {'next': f'{flask.request.path}?{query}'}
+
+
+def _cursor_encode(sort_by, value, row_id):
+    # Enum columns (db.Enum) store and compare member names, not values.
+    if isinstance(value, enum.Enum):
+        value = value.name
+    data = json.dumps([sort_by or '', value, row_id], default=str)
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def _cursor_decode(cursor, sort_by):
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_sort_by, value, row_id = json.loads(data)
+    except Exception:
+        raise ValueError('Invalid cursor') from None
+    if cursor_sort_by != (sort_by or ''):
+        raise ValueError('Cursor does not match sort parameter')
+    return value, row_id
+
+
+def db_paginate(query, id_column, sort_by=None, column_remap=None, page=0,
+                limit=DEFAULT_PAGE_LIMIT, cursor=None):
+    """
+    Order query by `sort_by` (see :func:`db_sort`) and `id_column` and get
+    one page of rows.
+
+    If `cursor` (opaque token from :attr:`Page.next_cursor`) is set, rows
+    after the cursor are selected with ``WHERE (key, id) > (...)`` predicate
+    (keyset pagination) that can use an index and doesn't get slower on deep
+    pages, otherwise `page` number is used with ``OFFSET``.
+
+    Sort keys are attributes of the `id_column`'s model, unless remapped to
+    SQL column by `column_remap`. Value of the sort key for the cursor is read
+    from the row's attribute of the same name, for related models (e.g.
+    ``location`` remapped to ``lab_location.name``) from the remapped
+    column's attribute of the related model.
+
+    :returns: :class:`Page`
+    :raises: `ValueError` if the cursor is not valid
+    """
+    sort_key = column = None
+    desc = False
+    if sort_by:
+        desc = sort_by.startswith('-')
+        sort_key = sort_by.removeprefix('-')
+        if column_remap and sort_key in column_remap:
+            column = db.literal_column(column_remap[sort_key])
+        else:
+            column = getattr(id_column.class_, sort_key)
+        query = query.order_by(
+            column.desc() if desc else column.asc(),
+            id_column.desc() if desc else id_column.asc(),
+        )
+    else:
+        query = query.order_by(id_column.asc())
+
+    if cursor:
+        value, row_id = _cursor_decode(cursor, sort_by)
+        id_cond = id_column < row_id if desc else id_column > row_id
+        if column is None:
+            query = query.filter(id_cond)
+        # Postgres sorts NULLs last in ascending and first in descending order.
+        elif value is None:
+            if desc:
+                query = query.filter(sqlalchemy.or_(
+                    sqlalchemy.and_(column.is_(None), id_cond),
+                    column.isnot(None),
+                ))
+            else:
+                query = query.filter(column.is_(None), id_cond)
+        elif desc:
+            query = query.filter(
+                sqlalchemy.tuple_(column, id_column) < sqlalchemy.tuple_(value, row_id)
+            )
+        else:
+            query = query.filter(sqlalchemy.or_(
+                sqlalchemy.tuple_(column, id_column) > sqlalchemy.tuple_(value, row_id),
+                column.is_(None),
+            ))
+        rows = list(query.limit(limit))
+    else:
+        rows = list(query.limit(limit).offset(page * limit))
+
+    next_cursor = None
+    if rows and len(rows) == limit:
+        last_row = rows[-1]
+        value = None
+        if sort_key:
+            value = getattr(last_row, sort_key)
+            if isinstance(value, db.Model):
+                value = getattr(value, column_remap[sort_key].rsplit('.', 1)[-1])
+        next_cursor = _cursor_encode(sort_by, value, getattr(last_row, id_column.key))
+
+    return Page(rows, next_cursor)
+
+
+#: Cache of exact counts of list queries, see :func:`db_count`.
+count_cache = TTLCache(maxsize=256, ttl=10)
+
+
+def _db_count_cache_key(query):
+    statement = query.statement.compile(dialect=postgresql.dialect())
+    return str(statement), json.dumps(statement.params, sort_keys=True, default=str)
+
+
+class _Explain(sqlalchemy.sql.expression.Executable, sqlalchemy.sql.expression.ClauseElement):
+    """
+    ``EXPLAIN (FORMAT JSON)`` of the statement. Compiled by SQLAlchemy with
+    the statement, so bind parameters are processed by their types (e.g. Enum
+    values are sent as labels).
+    """
+
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(_Explain, 'postgresql')
+def _compile_explain(element, compiler, **kwargs):
+    return 'EXPLAIN (FORMAT JSON) ' + compiler.process(element.statement, **kwargs)
+
+
+def _db_count_estimate(query):
+    plan = db.session.execute(_Explain(query.statement)).scalar()
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def db_count(query, mode='exact', cache=False):
+    """
+    Count rows of the list query for ``total`` in the list response.
+
+    :param mode: ``exact`` runs ``SELECT count(*)`` of the query,
+                 ``estimate`` returns row estimate of the Postgres planner
+                 (``EXPLAIN``) that is cheap but may be inaccurate, ``none``
+                 skips counting
+    :param cache: store exact count in :data:`count_cache`, should be used for
+                  common queries (e.g. unfiltered lists) that are repeated
+                  often
+    :returns: int or `None` if mode is ``none``
+    """
+    if mode == 'none':
+        return None
+
+    if mode == 'estimate':
+        return _db_count_estimate(query)
+
+    if not cache or not count_cache.enabled:
+        return query.count()
+
+    key = _db_count_cache_key(query)
+    count = count_cache.get(key)
+    if count is None:
+        count = query.count()
+        count_cache.set(key, count)
+    return count
+
+
 def condition_eval(expr, params):
     """
     Evaluate condition expression.
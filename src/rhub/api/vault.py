@@ -1,11 +1,19 @@
 import abc
+import fcntl
 import logging
+import os
+import tempfile
+import threading
 
 import hvac
 import injector
+import inotify.adapters
+import inotify.constants
 import yaml
 from connexion.exceptions import ProblemException
 
+from rhub.api.cache import TTLCache
+
 
 logger = logging.getLogger(__name__)
 
@@ -38,27 +46,142 @@ class Vault(abc.ABC):
 
 
 class HashicorpVault(Vault):
-    """Hashicorp Vault client."""
+    """
+    Hashicorp Vault client.
+
+    Secrets are cached, each secret for its lease duration (KV v1) but at
+    most `max_staleness` seconds, KV v2 secrets have no lease so they are
+    cached for `max_staleness` seconds. Missing secrets are not cached.
+    Writes invalidate the cached secret. Set `max_staleness` to 0 to disable
+    the cache.
 
-    def __init__(self, url, role_id, secret_id):
+    AppRole token is renewed in background thread when 2/3 of its TTL
+    passed, if the token can't be renewed (max TTL reached) the client logs
+    in again. The thread is started on the first read or write in each
+    process, the client is created before gunicorn and Celery fork workers
+    and threads don't survive fork. Requests that fail with 403 also trigger
+    new login and are retried once.
+    """
+
+    def __init__(self, url, role_id, secret_id, max_staleness=60, cache_size=1024,
+                 token_renew=True):
+        self._role_id = role_id
+        self._secret_id = secret_id
         self._client = hvac.Client(url)
-        self._client.auth.approle.login(role_id=role_id, secret_id=secret_id)
+        self._cache = TTLCache(maxsize=cache_size, ttl=max_staleness)
+        self._lock = threading.Lock()
+        self._token_ttl = None
+        self._token_renew = token_renew
+        self._renew_stop = threading.Event()
+        self._renew_pid = None
+        self._renew_thread = None
+
+        self._login()
+
+    def _login(self):
+        response = self._client.auth.approle.login(
+            role_id=self._role_id, secret_id=self._secret_id,
+        )
+        with self._lock:
+            self._token_ttl = (response or {}).get('auth', {}).get('lease_duration')
+        logger.info(f'Logged in to {self!r}, token TTL {self._token_ttl}s')
+
+    def _renew_token(self):
+        """Renew the token or login again if the token can't be renewed."""
+        try:
+            response = self._client.auth.token.renew_self()
+            ttl = response['auth']['lease_duration']
+            with self._lock:
+                # Renewal is capped by token max TTL, near the max TTL the
+                # renewed token expires earlier than before.
+                expiring = self._token_ttl is not None and ttl < self._token_ttl
+                self._token_ttl = ttl
+            if not expiring:
+                logger.debug(f'Renewed {self!r} token, TTL {ttl}s')
+                return
+            logger.info(f'{self!r} token reached max TTL, logging in again')
+        except Exception:
+            logger.warning(f'Failed to renew {self!r} token, logging in again',
+                           exc_info=True)
+        self._login()
+
+    def _start_renew(self):
+        """Start token renew thread if it is not running in this process."""
+        if not self._token_renew or self._renew_pid == os.getpid():
+            return
+        with self._lock:
+            if self._renew_pid == os.getpid():
+                return
+            self._renew_pid = os.getpid()
+            self._renew_thread = threading.Thread(
+                target=self._renew_loop, name='vault-token-renew', daemon=True,
+            )
+            self._renew_thread.start()
+
+    def _renew_loop(self):
+        while True:
+            with self._lock:
+                ttl = self._token_ttl
+            if not ttl:
+                # Token without expiration (root or periodic token).
+                return
+            if self._renew_stop.wait(ttl * 2 / 3):
+                return
+            try:
+                self._renew_token()
+            except Exception:
+                logger.exception(f'Failed to log in to {self!r}')
+                if self._renew_stop.wait(10):
+                    return
+
+    def stop(self):
+        """Stop background token renewal."""
+        self._renew_stop.set()
+
+    def _read(self, path):
+        try:
+            return self._client.read(path)
+        except hvac.exceptions.Forbidden:
+            logger.warning(f'{self!r} request forbidden, logging in again')
+            self._login()
+            return self._client.read(path)
 
     def read(self, path):
+        self._start_renew()
+        cached = self._cache.get(path)
+        if cached is not None:
+            return dict(cached)
+
         logger.debug(f'Reading credentials from {self!r} at path {path!r}')
         try:
-            secret = self._client.read(path)
+            secret = self._read(path)
             # Check if response is kv-v2
             if 'data' in secret['data'] and 'metadata' in secret['data']:
-                return secret['data']['data']
-            return secret['data']
+                data = secret['data']['data']
+            else:
+                data = secret['data']
         except hvac.exceptions.InvalidPath:
             logger.exception(f'Failed to get credentials from {path!r}')
             return None
 
+        lease_duration = secret.get('lease_duration') or 0
+        if self._cache.enabled:
+            self._cache.set(path, dict(data), ttl=min(
+                lease_duration or self._cache.ttl, self._cache.ttl,
+            ))
+        return data
+
     def write(self, path, data):
         logger.debug(f'Writing credentials to {self!r} at path {path!r}')
-        self._client.write(path, **data)
+        self._start_renew()
+        try:
+            self._client.write(path, **data)
+        except hvac.exceptions.Forbidden:
+            logger.warning(f'{self!r} request forbidden, logging in again')
+            self._login()
+            self._client.write(path, **data)
+        finally:
+            self._cache.delete(path)
 
     def __repr__(self):
         return f'HashiCorpVault({self._client.url})'
@@ -76,26 +199,145 @@ class FileVault(Vault):
         kv/example/stage:
             username: foo
             password: bar
+
+    The file is watched with inotify and reloaded on the next read after it
+    was changed, so secrets rotated on disk are used without restart. If
+    inotify is not available, the file is checked with :func:`os.stat` on
+    every read. Writes are serialized between processes by :func:`fcntl.flock`
+    on ``<datafile>.lock`` file, reload the file first, so changes made by
+    other processes are not lost, and replace the file atomically (temporary
+    file and rename).
     """
 
-    def __init__(self, datafile):
+    def __init__(self, datafile, watch=True):
         logger.warning(
             'Storing secrets in plaintext YAML files is INSECURE!! '
             'Use Hashicorp Vault in production!'
         )
-        self._datafile = datafile
-        with open(self._datafile) as f:
-            self._data = yaml.safe_load(f)
+        self._datafile = os.path.abspath(datafile)
+        self._watch = watch
+        self._lock = threading.RLock()
+        self._changed = threading.Event()
+        self._stop = threading.Event()
+        self._watch_pid = None
+        self._watch_thread = None
+        self._load()
+        self._start_watcher()
+
+    def _stat(self):
+        try:
+            st = os.stat(self._datafile)
+        except FileNotFoundError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _load(self):
+        with self._lock:
+            stat = self._stat()
+            with open(self._datafile) as f:
+                self._data = yaml.safe_load(f) or {}
+            self._loaded_stat = stat
+
+    def _start_watcher(self):
+        self._watch_pid = os.getpid()
+        self._watch_thread = None
+        if not self._watch:
+            return
+
+        try:
+            watcher = inotify.adapters.Inotify()
+            # Watch the directory, the file is replaced on atomic writes.
+            watcher.add_watch(
+                os.path.dirname(self._datafile),
+                mask=(inotify.constants.IN_CLOSE_WRITE
+                      | inotify.constants.IN_MOVED_TO
+                      | inotify.constants.IN_DELETE),
+            )
+        except Exception:
+            logger.warning(f'Failed to watch {self._datafile} with inotify, '
+                           'file will be checked on every read', exc_info=True)
+            return
+
+        self._watch_thread = threading.Thread(
+            target=self._watch_loop, args=(watcher,), name='file-vault-watch',
+            daemon=True,
+        )
+        self._watch_thread.start()
+
+    def _watch_loop(self, watcher):
+        filename = os.path.basename(self._datafile)
+        try:
+            for event in watcher.event_gen():
+                if self._stop.is_set():
+                    return
+                if event is not None and event[3] == filename:
+                    self._changed.set()
+        finally:
+            # Inotify file descriptor is closed when the watcher is collected.
+            watcher.remove_watch(os.path.dirname(self._datafile))
+
+    def stop(self):
+        """Stop watching the file and close the watcher."""
+        self._stop.set()
+        if self._watch_thread is not None and self._watch_pid == os.getpid():
+            self._watch_thread.join()
+            self._watch_thread = None
+
+    def _reload_if_changed(self):
+        # Threads don't survive fork, start new watcher in forked processes
+        # (gunicorn or Celery workers).
+        if self._watch_pid != os.getpid():
+            with self._lock:
+                if self._watch_pid != os.getpid():
+                    self._start_watcher()
+                    self._changed.set()
+
+        watching = self._watch_thread is not None and self._watch_thread.is_alive()
+        if watching and not self._changed.is_set():
+            return
+
+        self._changed.clear()
+        stat = self._stat()
+        if stat is not None and stat != self._loaded_stat:
+            logger.info(f'{self!r} file changed, reloading')
+            self._load()
 
     def read(self, path):
         logger.debug(f'Reading credentials from {self!r} at path {path!r}')
+        self._reload_if_changed()
         return self._data.get(path)
 
     def write(self, path, data):
         logger.debug(f'Writing credentials to {self!r} at path {path!r}')
-        self._data[path] = data
-        with open(self._datafile, 'w') as f:
-            yaml.safe_dump(self._data, f)
+        with self._lock, open(f'{self._datafile}.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+            # Don't wait for inotify, the file may have been just replaced by
+            # the process that held the lock.
+            if self._stat() != self._loaded_stat:
+                self._load()
+            new_data = {**self._data, path: data}
+
+            dirname = os.path.dirname(self._datafile)
+            fd, tmp_path = tempfile.mkstemp(
+                dir=dirname, prefix=f'.{os.path.basename(self._datafile)}.',
+            )
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    yaml.safe_dump(new_data, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                try:
+                    os.chmod(tmp_path, os.stat(self._datafile).st_mode & 0o777)
+                except FileNotFoundError:
+                    pass
+                os.replace(tmp_path, self._datafile)
+            except Exception:
+                os.unlink(tmp_path)
+                raise
+
+            self._data = new_data
+            self._loaded_stat = self._stat()
 
     def __repr__(self):
         return f'FileVault({self._datafile})'
@@ -125,6 +367,9 @@ class VaultModule(injector.Module):
                 url=self.app.config['VAULT_ADDR'],
                 role_id=self.app.config['VAULT_ROLE_ID'],
                 secret_id=self.app.config['VAULT_SECRET_ID'],
+                max_staleness=self.app.config['VAULT_CACHE_MAX_STALENESS'],
+                cache_size=self.app.config['VAULT_CACHE_SIZE'],
+                token_renew=self.app.config['VAULT_TOKEN_RENEW'],
             )
 
         elif vault_type == 'file':
@@ -1,15 +1,188 @@
+import collections
+import contextlib
+import datetime
 import logging
+import os
+import threading
+import time
 
 import injector
 import ldap3
+from ldap3.core.exceptions import LDAPCommunicationError
+from ldap3.protocol.formatters.formatters import format_time
+from ldap3.utils.conv import escape_filter_chars
 
 
 logger = logging.getLogger(__name__)
 
+#: Simple Paged Results control, RFC 2696.
+PAGED_RESULTS_OID = '1.2.840.113556.1.4.319'
+
+
+class LdapPoolTimeout(Exception):
+    pass
+
+
+class LdapConnectionPool:
+    """
+    Thread-safe pool of bound LDAP connections.
+
+    At most `size` connections are open at the same time, threads that want
+    more connections wait up to `acquire_timeout` seconds. Connections idle
+    for more than `idle_timeout` seconds are closed, connections idle for more
+    than `health_check_interval` seconds are checked with a root DSE query
+    before they are reused. Broken connections are discarded and replaced
+    with new ones.
+
+    Connections are not shared with forked processes (gunicorn or Celery
+    workers), the pool is reset in the child process on first use.
+    """
+
+    STATS = ('created', 'reused', 'closed', 'expired', 'broken', 'health_checks',
+             'errors', 'waits', 'timeouts')
+
+    def __init__(self, connect, size=4, idle_timeout=300,
+                 health_check_interval=60, acquire_timeout=30):
+        self.connect = connect
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+
+        self._lock = threading.Lock()
+        self._reset()
+
+    def __repr__(self):
+        return f'<LdapConnectionPool size={self.size}>'
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = collections.deque()
+        self._semaphore = threading.BoundedSemaphore(self.size)
+        self._in_use = 0
+        self._stats = dict.fromkeys(self.STATS, 0)
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # Sockets are shared with the parent process, don't unbind.
+                    self._reset()
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def _close(self, conn):
+        self._count('closed')
+        try:
+            conn.unbind()
+        except Exception:
+            logger.debug('Failed to unbind LDAP connection', exc_info=True)
+
+    def _is_healthy(self, conn, idle_time):
+        if conn.closed or not conn.bound:
+            return False
+        if idle_time < self.health_check_interval:
+            return True
+        self._count('health_checks')
+        try:
+            return conn.search('', '(objectClass=*)', search_scope=ldap3.BASE,
+                               attributes=['1.1'])
+        except Exception:
+            return False
+
+    def _get_connection(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                conn, released = self._idle.pop()
+
+            idle_time = time.monotonic() - released
+            if idle_time > self.idle_timeout:
+                self._count('expired')
+                self._close(conn)
+            elif not self._is_healthy(conn, idle_time):
+                self._count('broken')
+                self._close(conn)
+            else:
+                self._count('reused')
+                return conn
+
+        conn = self.connect()
+        self._count('created')
+        return conn
+
+    @contextlib.contextmanager
+    def connection(self):
+        """
+        Get connection from the pool, connection is returned to the pool when
+        the context manager exits. If communication with the server fails, the
+        connection is closed instead.
+
+        :raises: `LdapPoolTimeout` if no connection is available in
+                 `acquire_timeout` seconds
+        """
+        self._check_pid()
+
+        semaphore = self._semaphore
+        if not semaphore.acquire(blocking=False):
+            self._count('waits')
+            if not semaphore.acquire(timeout=self.acquire_timeout):
+                self._count('timeouts')
+                raise LdapPoolTimeout(
+                    f'No LDAP connection available in {self.acquire_timeout}s'
+                )
+
+        with self._lock:
+            self._in_use += 1
+
+        conn = None
+        try:
+            conn = self._get_connection()
+            yield conn
+        except LDAPCommunicationError:
+            self._count('errors')
+            if conn is not None:
+                self._close(conn)
+            conn = None
+            raise
+        finally:
+            with self._lock:
+                self._in_use -= 1
+                if conn is not None:
+                    self._idle.append((conn, time.monotonic()))
+            semaphore.release()
+
+    def clear(self):
+        """Close all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, collections.deque()
+        for conn, _ in idle:
+            self._close(conn)
+
+    def stats(self):
+        """Pool statistics, useful for sizing the pool."""
+        with self._lock:
+            return {
+                'size': self.size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                **self._stats,
+            }
+
 
 class LdapClient:
     def __init__(self, config):
         self.config = config
+        self.pool = LdapConnectionPool(
+            self._connect,
+            size=config.get('pool_size', 4),
+            idle_timeout=config.get('pool_idle_timeout', 300),
+            health_check_interval=config.get('pool_health_check_interval', 60),
+            acquire_timeout=config.get('pool_acquire_timeout', 30),
+        )
 
     def _connect(self):
         return ldap3.Connection(
@@ -17,36 +190,175 @@ class LdapClient:
             auto_bind=True,
         )
 
+    def _search(self, base, query, scope, attributes=('*',)):
+        # Connection may be closed by the server at any time, for example by
+        # server idle timeout, retry once with a new connection.
+        for attempt in range(2):
+            try:
+                with self.pool.connection() as conn:
+                    conn.search(base, query, search_scope=scope,
+                                attributes=list(attributes))
+                    return conn.entries
+            except LDAPCommunicationError:
+                if attempt > 0:
+                    raise
+                logger.warning('LDAP connection failed, reconnecting', exc_info=True)
+
     def get(self, dn):
-        conn = self._connect()
-        conn.search(dn, '(objectClass=*)', search_scope=ldap3.BASE, attributes=['*'])
-        return conn.entries
+        return self._search(dn, '(objectClass=*)', ldap3.BASE)
 
     def search(self, base, query):
-        conn = self._connect()
-        conn.search(base, query, search_scope=ldap3.SUBTREE, attributes=['*'])
-        return conn.entries
+        return self._search(base, query, ldap3.SUBTREE)
 
-    def search_users(self, query):
+    def paged_search(self, base, query, attributes, page_size=None):
+        """
+        Generator of search results split to pages (lists of entries), uses
+        Simple Paged Results control, so only one page is held in memory.
+        The pooled connection is held until the generator is exhausted.
+        """
+        if page_size is None:
+            page_size = self.config.get('page_size', 500)
+
+        with self.pool.connection() as conn:
+            cookie = None
+            while True:
+                conn.search(
+                    base, query, search_scope=ldap3.SUBTREE, attributes=attributes,
+                    paged_size=page_size, paged_cookie=cookie,
+                )
+                yield conn.entries
+
+                controls = conn.result.get('controls') or {}
+                cookie = controls.get(PAGED_RESULTS_OID, {}).get('value', {}).get('cookie')
+                if not cookie:
+                    break
+
+    def _search_existing(self, base, build_filter, attr, values, chunk_size):
+        if chunk_size is None:
+            chunk_size = self.config.get('batch_size', 100)
+
+        values = list(values)
+        existing = set()
+        for i in range(0, len(values), chunk_size):
+            chunk_filter = ''.join(
+                f'({attr}={escape_filter_chars(value)})'
+                for value in values[i:i + chunk_size]
+            )
+            entries = self._search(
+                base, build_filter(f'(|{chunk_filter})'), ldap3.SUBTREE,
+                attributes=[ldap3.NO_ATTRIBUTES],
+            )
+            existing.update(entry.entry_dn.lower() for entry in entries)
+        return existing
+
+    def search_existing_users(self, names, chunk_size=None):
+        """
+        Find users by name (`name` attribute in `user_attrs` config) with
+        OR-filter searches, `chunk_size` names per search.
+
+        :returns: set of lowercase DNs of found users
+        """
+        return self._search_existing(
+            self.config['users_base'], self._users_filter,
+            self.config['user_attrs']['name'], names, chunk_size,
+        )
+
+    def search_existing_groups(self, names, chunk_size=None):
+        """
+        Find groups by name (`name` attribute in `group_attrs` config) with
+        OR-filter searches, `chunk_size` names per search.
+
+        :returns: set of lowercase DNs of found groups
+        """
+        return self._search_existing(
+            self.config['groups_base'], self._groups_filter,
+            self.config['group_attrs']['name'], names, chunk_size,
+        )
+
+    def pool_stats(self):
+        return self.pool.stats()
+
+    def _users_filter(self, query):
         object_class = '(objectClass=person)'
         users_filter = self.config.get('users_filter', '')
-        return self.search(
-            self.config['users_base'],
-            f'(&{object_class}{users_filter}{query})',
-        )
+        return f'(&{object_class}{users_filter}{query})'
 
-    def search_groups(self, query):
+    def _groups_filter(self, query):
         object_class = '(|(objectClass=groupOfNames)(objectClass=groupOfUniqueNames))'
         groups_filter = self.config.get('groups_filter', '')
-        return self.search(
-            self.config['groups_base'],
-            f'(&{object_class}{groups_filter}{query})',
+        return f'(&{object_class}{groups_filter}{query})'
+
+    def search_users(self, query):
+        return self.search(self.config['users_base'], self._users_filter(query))
+
+    def search_groups(self, query):
+        return self.search(self.config['groups_base'], self._groups_filter(query))
+
+    def search_users_paged(self, query='', page_size=None):
+        """
+        Generator of pages of users (as returned by :meth:`get_user`), only
+        attributes from `user_attrs` config and group membership are fetched.
+        Users also have `modify_timestamp` key, see :meth:`modified_since`.
+        """
+        attributes = ['memberOf', 'modifyTimestamp', *self.config['user_attrs'].values()]
+        pages = self.paged_search(
+            self.config['users_base'], self._users_filter(query), attributes, page_size,
+        )
+        for page in pages:
+            yield [
+                self._user_to_dict(i) | {'modify_timestamp': self._modify_timestamp(i)}
+                for i in page
+            ]
+
+    def search_groups_paged(self, query='', page_size=None):
+        """
+        Generator of pages of groups (as returned by :meth:`get_group`), only
+        attributes from `group_attrs` config and members are fetched.
+        Groups also have `modify_timestamp` key, see :meth:`modified_since`.
+        """
+        attributes = ['member', 'uniqueMember', 'modifyTimestamp',
+                      *self.config['group_attrs'].values()]
+        pages = self.paged_search(
+            self.config['groups_base'], self._groups_filter(query), attributes, page_size,
         )
+        for page in pages:
+            yield [
+                self._group_to_dict(i) | {'modify_timestamp': self._modify_timestamp(i)}
+                for i in page
+            ]
+
+    @staticmethod
+    def modified_since(timestamp):
+        """Filter of entries modified at or after `timestamp` (aware datetime)."""
+        utc_timestamp = timestamp.astimezone(datetime.timezone.utc)
+        return f'(modifyTimestamp>={utc_timestamp:%Y%m%d%H%M%S}Z)'
+
+    @staticmethod
+    def _modify_timestamp(entry):
+        """Value of `modifyTimestamp` as aware datetime, `None` if missing."""
+        values = LdapClient._values(entry, 'modifyTimestamp')
+        if not values:
+            return None
+        value = values[0]
+        if isinstance(value, str):
+            # Server schema not loaded, value is not converted by ldap3.
+            value = format_time(value.encode())
+        if not isinstance(value, datetime.datetime):
+            logger.warning(f'Invalid modifyTimestamp {value!r} of {entry.entry_dn}')
+            return None
+        return value
+
+    @staticmethod
+    def _values(entry, attr):
+        """List of attribute values, empty if entry doesn't have the attribute."""
+        if attr in entry:
+            return entry[attr].values
+        return []
 
     def _user_to_dict(self, user):
         user_dict = {
             'ldap_dn': user.entry_dn,
-            'groups': [{'ldap_dn': i} for i in user['memberOf'].value],
+            'groups': [{'ldap_dn': i} for i in self._values(user, 'memberOf')],
         }
 
         for dict_key, ldap_attr in self.config['user_attrs'].items():
@@ -67,8 +379,7 @@ class LdapClient:
         def extract_users(group):
             users_set = set()
             for k in ['member', 'uniqueMember']:
-                if k in group:
-                    users_set |= set(group[k].value)
+                users_set |= set(self._values(group, k))
             return [{'ldap_dn': i} for i in users_set]
 
         group_dict = {
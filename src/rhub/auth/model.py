@@ -1,13 +1,16 @@
+import collections
 import enum
 import hashlib
+import itertools
 import secrets
 
-from sqlalchemy import func
+from sqlalchemy import event, func
 from sqlalchemy.dialects import postgresql
 from sqlalchemy.orm import validates
 from sqlalchemy.sql import functions
 
 from rhub.api import db
+from rhub.api.cache import TTLCache
 from rhub.api.utils import ModelMixin, ModelValueError, TimestampMixin, date_now
 from rhub.auth import ldap
 
@@ -131,19 +134,48 @@ class Token(db.Model, ModelMixin):
             return False
         return self.expires_at < date_now()
 
+    @staticmethod
+    def hash_token(cleartext):
+        """Hash of the token as stored in the DB."""
+        return hashlib.sha256(cleartext.encode()).hexdigest()
+
     @classmethod
     def generate(cls, **kwargs):
         cleartext = secrets.token_urlsafe(32)
-        kwargs['token'] = hashlib.sha256(cleartext.encode()).hexdigest()
+        kwargs['token'] = cls.hash_token(cleartext)
         return cleartext, cls(**kwargs)
 
     @classmethod
     def find(cls, cleartext):
-        token = hashlib.sha256(cleartext.encode()).hexdigest()
-        q = cls.query.filter(cls.token == token)
-        if q.count() != 1:
+        q = cls.query.filter(cls.token == cls.hash_token(cleartext))
+        rows = q.options(db.joinedload(cls.user)).limit(2).all()
+        if len(rows) != 1:
             return None
-        return q.first()
+        return rows[0]
+
+    @classmethod
+    def find_cached(cls, cleartext):
+        """
+        Same as :meth:`find` but returns :class:`CachedToken` from
+        :data:`token_cache`, the DB is queried only on cache miss. Tokens that
+        don't exist are not cached.
+        """
+        token_hash = cls.hash_token(cleartext)
+
+        cached_token = token_cache.get(token_hash)
+        if cached_token is None:
+            token_row = cls.find(cleartext)
+            if not token_row:
+                return None
+            cached_token = CachedToken(
+                id=token_row.id,
+                user_id=token_row.user_id,
+                expires_at=token_row.expires_at,
+                user_deleted=bool(token_row.user.deleted),
+            )
+            token_cache.set(token_hash, cached_token)
+
+        return cached_token
 
     def to_dict(self):
         data = super().to_dict()
@@ -152,6 +184,31 @@ class Token(db.Model, ModelMixin):
         return data
 
 
+class CachedToken(collections.namedtuple(
+        'CachedToken', ['id', 'user_id', 'expires_at', 'user_deleted'])):
+    """Token data stored in :data:`token_cache`."""
+
+    @property
+    def is_expired(self):
+        if self.expires_at is None:
+            return False
+        return self.expires_at < date_now()
+
+
+#: Cache of API tokens and OIDC tokens used in authentication, token hash ->
+#: :class:`CachedToken`. Must be invalidated when token is deleted or user is
+#: marked as deleted, see :func:`token_cache_invalidate`.
+token_cache = TTLCache()
+
+
+def token_cache_invalidate(token_hash=None, user_id=None):
+    """Remove token from :data:`token_cache` by its hash or all user's tokens."""
+    if token_hash is not None:
+        token_cache.delete(token_hash)
+    if user_id is not None:
+        token_cache.delete_if(lambda _, cached_token: cached_token.user_id == user_id)
+
+
 class Role(str, enum.Enum):
     ADMIN = 'admin'
     LAB_CLUSTER_ADMIN = 'lab-cluster-admin'
@@ -198,3 +255,183 @@ class UserGroup(db.Model):
 
     user_id = db.Column(db.ForeignKey('auth_user.id'), primary_key=True)
     group_id = db.Column(db.ForeignKey('auth_group.id'), primary_key=True)
+
+
+class LdapSyncState(db.Model):
+    """
+    State of incremental LDAP sync per LDAP server, see
+    :func:`rhub.auth.tasks.update_ldap_incremental`.
+    """
+    __tablename__ = 'auth_ldap_sync_state'
+
+    server = db.Column(db.String(256), primary_key=True)
+    #: The latest `modifyTimestamp` of synced users (high-water mark).
+    users_modify_timestamp = db.Column(db.DateTime(timezone=True), nullable=True)
+    #: The latest `modifyTimestamp` of synced groups (high-water mark).
+    groups_modify_timestamp = db.Column(db.DateTime(timezone=True), nullable=True)
+    last_full_sync = db.Column(db.DateTime(timezone=True), nullable=True)
+
+
+class AuthorizedKeys(db.Model):
+    """
+    Materialized SSH keys of all users or of group members, used as
+    authorized keys of clusters, see
+    :attr:`rhub.lab.model.Cluster.authorized_keys`.
+
+    Rows are recomputed when the transaction that changed users' SSH keys or
+    group memberships is committed, ORM changes are tracked automatically,
+    bulk updates must call :func:`authorized_keys_invalidate`. Keys of all
+    users change with every new user, so the :attr:`ALL_USERS` row is only
+    marked :attr:`dirty` on commit and recomputed on the next read, see
+    :meth:`get_keys`.
+    """
+    __tablename__ = 'auth_authorized_keys'
+
+    #: Keys of all users that are not deleted.
+    ALL_USERS = 'all'
+
+    #: :attr:`ALL_USERS` or ``group:<id>``, see :meth:`group_scope`.
+    scope = db.Column(db.String(64), primary_key=True)
+    keys = db.Column(db.ARRAY(db.Text), server_default='{}', nullable=False)
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False,
+                           server_default=functions.now())
+    #: Keys are outdated and must be recomputed before use.
+    dirty = db.Column(db.Boolean, server_default='FALSE', nullable=False)
+
+    @staticmethod
+    def group_scope(group_id):
+        return f'group:{group_id}'
+
+    @staticmethod
+    def _lock(scope):
+        """
+        Lock the `scope` until the end of the transaction, so concurrent
+        transactions do not overwrite recomputed keys with older ones.
+        """
+        db.session.execute(
+            db.select(func.pg_advisory_xact_lock(func.hashtext(scope)))
+        )
+
+    @classmethod
+    def _query_keys(cls, scope):
+        query = db.session.query(
+            func.distinct(func.unnest(User.ssh_keys))
+        ).filter(
+            User.deleted.isnot(True)
+        )
+        if scope != cls.ALL_USERS:
+            group_id = int(scope.removeprefix('group:'))
+            query = query.join(
+                UserGroup, UserGroup.user_id == User.id,
+            ).filter(
+                UserGroup.group_id == group_id
+            )
+        return sorted(i[0] for i in query)
+
+    @classmethod
+    def refresh(cls, scopes):
+        """
+        Recompute keys of `scopes`, rows of deleted groups are removed.
+
+        :returns: dict, scope -> list of keys
+        """
+        result = {}
+        for scope in sorted(scopes):
+            cls._lock(scope)
+
+            if scope != cls.ALL_USERS:
+                group_id = int(scope.removeprefix('group:'))
+                if db.session.query(Group.id).filter(Group.id == group_id).scalar() is None:
+                    db.session.execute(
+                        cls.__table__.delete().where(cls.scope == scope)
+                    )
+                    result[scope] = []
+                    continue
+
+            keys = cls._query_keys(scope)
+            db.session.execute(
+                postgresql.insert(cls.__table__)
+                .values(scope=scope, keys=keys, dirty=False)
+                .on_conflict_do_update(
+                    index_elements=[cls.scope],
+                    set_={'keys': keys, 'updated_at': functions.now(), 'dirty': False},
+                )
+            )
+            result[scope] = keys
+        return result
+
+    @classmethod
+    def mark_dirty(cls, scopes):
+        """Mark rows of `scopes` to be recomputed on the next read."""
+        for scope in sorted(scopes):
+            cls._lock(scope)
+            db.session.execute(
+                cls.__table__.update().where(cls.scope == scope).values(dirty=True)
+            )
+
+    @classmethod
+    def get_keys(cls, scope):
+        """Materialized keys of the `scope`, missing or dirty row is computed."""
+        row = cls.query.get(scope)
+        if row is not None and not row.dirty:
+            return row.keys
+        keys = cls.refresh([scope])[scope]
+        db.session.commit()
+        return keys
+
+
+_AUTHORIZED_KEYS_DIRTY = 'rhub_authorized_keys_dirty'
+
+
+def authorized_keys_invalidate(session, group_ids=(), all_users=False):
+    """
+    Mark :class:`AuthorizedKeys` of groups or all users to be recomputed
+    when the `session` is committed.
+    """
+    scopes = session.info.setdefault(_AUTHORIZED_KEYS_DIRTY, set())
+    if all_users:
+        scopes.add(AuthorizedKeys.ALL_USERS)
+    scopes.update(AuthorizedKeys.group_scope(i) for i in group_ids)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _authorized_keys_track(session, flush_context):
+    group_ids = set()
+    all_users = False
+
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, User):
+            state = db.inspect(obj)
+            groups_history = state.attrs.groups.history
+            group_ids.update(g.id for g in groups_history.added)
+            group_ids.update(g.id for g in groups_history.deleted)
+            if (obj in session.new or obj in session.deleted
+                    or state.attrs.ssh_keys.history.has_changes()
+                    or state.attrs.deleted.history.has_changes()):
+                all_users = True
+                group_ids.update(g.id for g in obj.groups)
+
+        elif isinstance(obj, Group):
+            if obj in session.deleted or db.inspect(obj).attrs.users.history.has_changes():
+                group_ids.add(obj.id)
+
+        elif isinstance(obj, UserGroup):
+            if obj in session.new or obj in session.deleted:
+                group_ids.add(obj.group_id)
+
+    if group_ids or all_users:
+        authorized_keys_invalidate(session, group_ids, all_users)
+
+
+@event.listens_for(db.session, 'before_commit')
+def _authorized_keys_refresh(session):
+    session.flush()
+    if scopes := session.info.pop(_AUTHORIZED_KEYS_DIRTY, None):
+        lazy_scopes = scopes & {AuthorizedKeys.ALL_USERS}
+        AuthorizedKeys.mark_dirty(lazy_scopes)
+        AuthorizedKeys.refresh(scopes - lazy_scopes)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _authorized_keys_rollback(session):
+    session.info.pop(_AUTHORIZED_KEYS_DIRTY, None)
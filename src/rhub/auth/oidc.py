@@ -0,0 +1,177 @@
+import logging
+import threading
+import time
+
+import injector
+from jwkest import jwk, jws
+from oic import oic
+
+
+logger = logging.getLogger(__name__)
+
+
+class OidcError(Exception):
+    pass
+
+
+class OidcProvider:
+    """
+    OIDC provider with cached discovery metadata and JWKS.
+
+    Metadata and keys are loaded on first use and then refreshed in background
+    thread every `refresh_interval` seconds, requests are meanwhile served
+    from the cached data. If token is signed with unknown key (keys rotation),
+    keys are reloaded immediately, but at most once per `min_refresh_interval`
+    seconds.
+    """
+
+    #: Allowed clock skew in seconds when checking `exp` and `nbf` claims.
+    LEEWAY = 30
+
+    def __init__(self, endpoint, allow_issuer_mismatch=False, audience=None,
+                 refresh_interval=3600, min_refresh_interval=60):
+        self.endpoint = endpoint
+        self.allow_issuer_mismatch = allow_issuer_mismatch
+        self.audience = audience
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+
+        self._client = None
+        self._keys = None
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+
+    def __repr__(self):
+        return f'<OidcProvider {self.endpoint}>'
+
+    @property
+    def issuer(self):
+        return self._get_client().issuer
+
+    def refresh(self):
+        """Load provider metadata and JWKS from the provider."""
+        logger.info(f'Loading OIDC provider configuration from {self.endpoint}')
+
+        client = oic.Client()
+        if self.allow_issuer_mismatch:
+            client.allow['issuer_mismatch'] = True
+        client.provider_config(self.endpoint, keys=False)
+
+        keys = jwk.KEYS()
+        if jwks_uri := client.provider_info.get('jwks_uri'):
+            keys.load_from_url(jwks_uri)
+
+        with self._lock:
+            self._client = client
+            self._keys = keys
+            self._loaded_at = time.monotonic()
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refresh_thread and self._refresh_thread.is_alive():
+                return
+
+            def refresh():
+                try:
+                    self.refresh()
+                except Exception:
+                    logger.exception('Failed to refresh OIDC provider configuration')
+
+            self._refresh_thread = threading.Thread(
+                target=refresh, name='oidc-refresh', daemon=True,
+            )
+            self._refresh_thread.start()
+
+    def _get_client(self):
+        if self._client is None:
+            self.refresh()
+        elif time.monotonic() - self._loaded_at > self.refresh_interval:
+            self._refresh_in_background()
+        return self._client
+
+    def _get_keys(self):
+        self._get_client()
+        return self._keys
+
+    def verify_token(self, token):
+        """
+        Verify JWT access token locally, checks signature and `exp`, `nbf`,
+        `iss` and `aud` claims.
+
+        :returns: dict, token claims
+        :raises: `OidcError` if token is not JWT, `Exception` if token is not
+                 valid
+        """
+        try:
+            is_jws = jws.factory(token) is not None
+        except Exception:
+            is_jws = False
+        if not is_jws:
+            raise OidcError('Token is not signed JWT')
+
+        try:
+            claims = jws.JWS().verify_compact(token, self._get_keys().keys())
+        except jws.NoSuitableSigningKeys:
+            if time.monotonic() - self._loaded_at < self.min_refresh_interval:
+                raise
+            logger.info('Token signed with unknown key, reloading OIDC keys')
+            self.refresh()
+            claims = jws.JWS().verify_compact(token, self._get_keys().keys())
+
+        now = time.time()
+
+        if 'exp' not in claims or claims['exp'] + self.LEEWAY < now:
+            raise ValueError('Token has expired')
+
+        if 'nbf' in claims and claims['nbf'] - self.LEEWAY > now:
+            raise ValueError('Token is not valid yet')
+
+        if not self.allow_issuer_mismatch and claims.get('iss') != self.issuer:
+            raise ValueError(f'Invalid token issuer {claims.get("iss")!r}')
+
+        if self.audience:
+            audience = claims.get('aud', [])
+            if isinstance(audience, str):
+                audience = [audience]
+            if self.audience not in audience:
+                raise ValueError(f'Invalid token audience {audience!r}')
+
+        return claims
+
+    def user_info(self, token):
+        """
+        Get user info from the provider's userinfo endpoint.
+
+        :returns: dict
+        :raises: `OidcError` if token is rejected by the provider
+        """
+        user_info = self._get_client().do_user_info_request(token=token)
+        if 'error' in user_info:
+            raise OidcError(user_info.get('error_description', user_info['error']))
+        return user_info.to_dict()
+
+
+class OidcModule(injector.Module):
+    def __init__(self, app):
+        self.app = app
+
+    def configure(self, binder):
+        if not self.app.config.get('AUTH_OIDC_ENDPOINT'):
+            return
+        try:
+            binder.bind(
+                OidcProvider,
+                to=self._create_oidc_provider(),
+                scope=injector.singleton,
+            )
+        except Exception:
+            logger.exception('Failed to create OIDC provider.')
+
+    def _create_oidc_provider(self):
+        return OidcProvider(
+            endpoint=self.app.config['AUTH_OIDC_ENDPOINT'],
+            allow_issuer_mismatch=self.app.config['AUTH_OIDC_ALLOW_ISSUER_MISMATCH'],
+            audience=self.app.config['AUTH_OIDC_AUDIENCE'],
+            refresh_interval=self.app.config['AUTH_OIDC_REFRESH_INTERVAL'],
+        )
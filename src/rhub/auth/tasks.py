@@ -1,6 +1,13 @@
+import collections
+import datetime
 import logging
+import time
+
+import sqlalchemy
+from sqlalchemy.dialects import postgresql
 
 from rhub.api import db, di
+from rhub.api.utils import date_now
 from rhub.auth import ADMIN_GROUP, model
 from rhub.auth.ldap import LdapClient
 from rhub.dns import model as dns_model
@@ -8,12 +15,30 @@ from rhub.lab import model as lab_model
 from rhub.messaging import Messaging
 from rhub.openstack import model as openstack_model
 from rhub.satellite import model as satellite_model
+from rhub.worker import celery
 
 
 logger = logging.getLogger(__name__)
 
+#: Number of users/groups checked in one LDAP search and removed in one
+#: transaction by cleanup tasks.
+CLEANUP_CHUNK_SIZE = 100
+
+#: Default interval of full reconciliation in :func:`update_ldap_incremental`.
+FULL_SYNC_INTERVAL = datetime.timedelta(days=1)
+
+
+def update_users(bulk=False):
+    """
+    Update users from LDAP.
+
+    :param bulk: fetch all users with paged LDAP search and apply changes in
+                 bulk, see :func:`update_users_bulk`, otherwise each user is
+                 fetched and updated separately
+    """
+    if bulk:
+        return update_users_bulk()
 
-def update_users():
     ldap_client = di.get(LdapClient)
 
     users_query = model.User.query.filter(
@@ -38,7 +63,17 @@ def update_users():
     db.session.commit()
 
 
-def update_groups():
+def update_groups(bulk=False):
+    """
+    Update groups from LDAP.
+
+    :param bulk: fetch all groups with paged LDAP search and apply changes in
+                 bulk, see :func:`update_groups_bulk`, otherwise each group is
+                 fetched and updated separately
+    """
+    if bulk:
+        return update_groups_bulk()
+
     ldap_client = di.get(LdapClient)
 
     groups_query = model.Group.query.filter(model.Group.ldap_dn.isnot(None))
@@ -59,103 +94,508 @@ def update_groups():
     db.session.commit()
 
 
-def cleanup_users():
+@celery.task(ignore_result=True)
+def refresh_user(user_id):
+    """
+    Update user from LDAP, queued by authentication when user data are stale,
+    see :func:`rhub.api.auth.security._user_sync`.
+    """
     ldap_client = di.get(LdapClient)
-    messaging = di.get(Messaging)
 
-    users_query = model.User.query.filter(model.User.ldap_dn.isnot(None))
-    for user in users_query:
-        ldap_query = ldap_client.get(user.ldap_dn)
-        if len(ldap_query) > 0:
+    user = model.User.query.get(user_id)
+    if not user or user.deleted or not user.ldap_dn:
+        return
+
+    logger.info(
+        f'Updating user ID={user.id} LDAP_DN={user.ldap_dn} from LDAP',
+        extra={'user_id': user.id, 'user_ldap_dn': user.ldap_dn},
+    )
+    user.update_from_ldap(ldap_client)
+    # Bump even if nothing has changed, user is fresh now.
+    user.updated_at = date_now()
+    db.session.commit()
+
+
+def _sync_memberships(desired, current):
+    """
+    Insert missing and delete extra `auth_user_group` rows.
+
+    :param desired: set of `(user_id, group_id)` tuples that should exist
+    :param current: set of `(user_id, group_id)` tuples that exist in the DB
+    """
+    to_insert = desired - current
+    to_delete = current - desired
+
+    if to_insert:
+        db.session.execute(
+            postgresql.insert(model.UserGroup.__table__)
+            .values([{'user_id': u, 'group_id': g} for u, g in sorted(to_insert)])
+            .on_conflict_do_nothing()
+        )
+
+    if to_delete:
+        db.session.execute(
+            model.UserGroup.__table__.delete().where(
+                sqlalchemy.tuple_(
+                    model.UserGroup.user_id,
+                    model.UserGroup.group_id,
+                ).in_(sorted(to_delete))
+            )
+        )
+
+    return len(to_insert), len(to_delete)
+
+
+def _changed_values(row, data, columns):
+    """Columns from `data` with different values than in the `row`."""
+    return {
+        k: data[k] for k in columns
+        if k in data and getattr(row, k) != data[k]
+    }
+
+
+def _ldap_manager_ids(ldap_client, manager_dns):
+    """Map LDAP DN -> user ID of managers, missing managers are created."""
+    if not manager_dns:
+        return {}
+
+    manager_ids = dict(
+        db.session.query(model.User.ldap_dn, model.User.id)
+        .filter(model.User.ldap_dn.in_(manager_dns))
+    )
+    for manager_dn in manager_dns - manager_ids.keys():
+        try:
+            manager = model.User._get_or_create(ldap_client, manager_dn)
+        except Exception:
+            logger.exception(f'Failed to create manager LDAP_DN={manager_dn} from LDAP')
             continue
+        manager_ids[manager_dn] = manager.id
+    return manager_ids
 
-        logger.info(
-            f'User ID={user.id} LDAP_DN={user.ldap_dn} has been removed from LDAP.',
-            extra={'user_id': user.id, 'user_ldap_dn': user.ldap_dn},
+
+def _max_timestamp(*timestamps):
+    return max(filter(None, timestamps), default=None)
+
+
+def update_users_bulk(query=''):
+    """
+    Update users from LDAP in bulk. Users are fetched with paged LDAP search
+    (only configured `user_attrs`), each page is compared with the DB in
+    memory and changes are written with bulk UPDATE and set-based
+    `auth_user_group` updates, one transaction per page. Users missing in the
+    DB are not created, users are created on the first login.
+
+    :param query: additional LDAP filter, e.g. to fetch only modified users
+    :returns: dict with stats, `modify_timestamp` is the latest modification
+              time of fetched users
+    """
+    ldap_client = di.get(LdapClient)
+    user_columns = set(model.User.__table__.columns.keys()) - {'id', 'ldap_dn'}
+
+    group_ids = dict(
+        db.session.query(model.Group.ldap_dn, model.Group.id)
+        .filter(model.Group.ldap_dn.isnot(None))
+    )
+
+    stats = {'users': 0, 'updated': 0, 'memberships_added': 0,
+             'memberships_removed': 0, 'modify_timestamp': None}
+
+    for page in ldap_client.search_users_paged(query):
+        stats['modify_timestamp'] = _max_timestamp(
+            stats['modify_timestamp'], *(i.pop('modify_timestamp', None) for i in page),
         )
+        ldap_users = {i['ldap_dn']: i for i in page}
 
-        openstack_model.Project.query.filter(
-            openstack_model.Project.owner_id == user.id,
-        ).update(
-            {'owner_id': user.manager_id},
-            synchronize_session='fetch',
+        users = (
+            db.session.query(model.User)
+            .filter(
+                model.User.ldap_dn.in_(ldap_users.keys()),
+                model.User.deleted.is_(False),
+            )
+            .all()
         )
+        if not users:
+            continue
 
-        messaging.send(
-            'auth.user.delete',
-            f'User "{user.name}" has been deleted.',
-            extra={
-                'user_id': user.id,
-                'user_name': user.name,
-                'manager_id': user.manager.id,
-                'manager_name': user.manager.name,
+        manager_ids = _ldap_manager_ids(
+            ldap_client,
+            {ldap_users[u.ldap_dn].get('manager') for u in users} - {None},
+        )
+
+        updates = []
+        desired_memberships = set()
+        for user in users:
+            user_data = dict(ldap_users[user.ldap_dn])
+            if manager_dn := user_data.pop('manager', None):
+                if manager_dn in manager_ids:
+                    user_data['manager_id'] = manager_ids[manager_dn]
+
+            for group in user_data.pop('groups'):
+                if group_id := group_ids.get(group['ldap_dn']):
+                    desired_memberships.add((user.id, group_id))
+
+            if changes := _changed_values(user, user_data, user_columns):
+                updates.append({'id': user.id, 'updated_at': date_now(), **changes})
+
+        # Only memberships in LDAP groups are managed by LDAP.
+        current_memberships = set(
+            db.session.query(model.UserGroup.user_id, model.UserGroup.group_id)
+            .filter(
+                model.UserGroup.user_id.in_([u.id for u in users]),
+                model.UserGroup.group_id.in_(group_ids.values()),
+            )
+        )
+
+        # Bulk updates bypass ORM change tracking of authorized keys.
+        keys_changed = {
+            i['id'] for i in updates if 'ssh_keys' in i or 'deleted' in i
+        }
+        model.authorized_keys_invalidate(
+            db.session,
+            group_ids={
+                group_id
+                for user_id, group_id in desired_memberships | current_memberships
+                if user_id in keys_changed
+            } | {
+                group_id
+                for _, group_id in desired_memberships ^ current_memberships
             },
+            all_users=bool(keys_changed),
         )
 
-        user.deleted = True
+        db.session.expunge_all()
+        if updates:
+            db.session.bulk_update_mappings(model.User, updates)
+        added, removed = _sync_memberships(desired_memberships, current_memberships)
+        db.session.commit()
+
+        stats['users'] += len(users)
+        stats['updated'] += len(updates)
+        stats['memberships_added'] += added
+        stats['memberships_removed'] += removed
+
+    logger.info(f'Bulk update of users from LDAP finished, {stats}', extra=stats)
+    return stats
+
 
+def update_groups_bulk(query=''):
+    """
+    Update groups from LDAP in bulk, same as :func:`update_users_bulk` but
+    for groups and their members.
+    """
+    ldap_client = di.get(LdapClient)
+    group_columns = set(model.Group.__table__.columns.keys()) - {'id', 'ldap_dn'}
+
+    stats = {'groups': 0, 'updated': 0, 'memberships_added': 0,
+             'memberships_removed': 0, 'modify_timestamp': None}
+
+    for page in ldap_client.search_groups_paged(query):
+        stats['modify_timestamp'] = _max_timestamp(
+            stats['modify_timestamp'], *(i.pop('modify_timestamp', None) for i in page),
+        )
+        ldap_groups = {i['ldap_dn']: i for i in page}
+
+        groups = (
+            db.session.query(model.Group)
+            .filter(model.Group.ldap_dn.in_(ldap_groups.keys()))
+            .all()
+        )
+        if not groups:
+            continue
+
+        member_dns = {
+            member['ldap_dn']
+            for group in groups
+            for member in ldap_groups[group.ldap_dn]['users']
+        }
+        user_ids = dict(
+            db.session.query(model.User.ldap_dn, model.User.id)
+            .filter(model.User.ldap_dn.in_(member_dns))
+        ) if member_dns else {}
+
+        updates = []
+        desired_memberships = set()
+        for group in groups:
+            group_data = dict(ldap_groups[group.ldap_dn])
+
+            for user in group_data.pop('users'):
+                if user_id := user_ids.get(user['ldap_dn']):
+                    desired_memberships.add((user_id, group.id))
+
+            if changes := _changed_values(group, group_data, group_columns):
+                updates.append({'id': group.id, **changes})
+
+        # Only memberships of LDAP users are managed by LDAP.
+        current_memberships = set(
+            db.session.query(model.UserGroup.user_id, model.UserGroup.group_id)
+            .join(model.User, model.User.id == model.UserGroup.user_id)
+            .filter(
+                model.UserGroup.group_id.in_([g.id for g in groups]),
+                model.User.ldap_dn.isnot(None),
+            )
+        )
+
+        model.authorized_keys_invalidate(
+            db.session,
+            group_ids={
+                group_id
+                for _, group_id in desired_memberships ^ current_memberships
+            },
+        )
+
+        db.session.expunge_all()
+        if updates:
+            db.session.bulk_update_mappings(model.Group, updates)
+        added, removed = _sync_memberships(desired_memberships, current_memberships)
         db.session.commit()
 
+        stats['groups'] += len(groups)
+        stats['updated'] += len(updates)
+        stats['memberships_added'] += added
+        stats['memberships_removed'] += removed
+
+    logger.info(f'Bulk update of groups from LDAP finished, {stats}', extra=stats)
+    return stats
 
-def cleanup_groups():
+
+def update_ldap_incremental(full_sync_interval=FULL_SYNC_INTERVAL):
+    """
+    Incremental sync of users and groups from LDAP. Only entries modified
+    since the last sync (high-water mark of `modifyTimestamp` stored per LDAP
+    server in :class:`rhub.auth.model.LdapSyncState`) are fetched and updated
+    in bulk.
+
+    Removed entries can't be detected by `modifyTimestamp`, so full
+    reconciliation (cleanup and update of all users and groups) runs if the
+    last one is older than `full_sync_interval`.
+
+    :returns: dict with stats of the users and groups updates
+    """
+    ldap_client = di.get(LdapClient)
+    server = ldap_client.config['server']
+    now = date_now()
+
+    state = model.LdapSyncState.query.get(server)
+    full_sync = (
+        state is None
+        or state.last_full_sync is None
+        or state.last_full_sync + full_sync_interval <= now
+    )
+
+    if full_sync:
+        logger.info(f'Running full LDAP sync from {server}')
+        cleanup_users()
+        users_stats = update_users_bulk()
+        cleanup_groups()
+        groups_stats = update_groups_bulk()
+    else:
+        logger.info(f'Running incremental LDAP sync from {server}')
+        users_stats = update_users_bulk(ldap_client.modified_since(
+            state.users_modify_timestamp or state.last_full_sync
+        ))
+        groups_stats = update_groups_bulk(ldap_client.modified_since(
+            state.groups_modify_timestamp or state.last_full_sync
+        ))
+
+    # Bulk updates expunge the session, the state must be loaded again.
+    state = model.LdapSyncState.query.get(server)
+    if state is None:
+        state = model.LdapSyncState(server=server)
+        db.session.add(state)
+
+    state.users_modify_timestamp = _max_timestamp(
+        state.users_modify_timestamp, users_stats['modify_timestamp'],
+    )
+    state.groups_modify_timestamp = _max_timestamp(
+        state.groups_modify_timestamp, groups_stats['modify_timestamp'],
+    )
+    if full_sync:
+        state.last_full_sync = now
+    db.session.commit()
+
+    return {'full_sync': full_sync, 'users': users_stats, 'groups': groups_stats}
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _removed_from_ldap(ldap_client, rows, search_existing):
+    """
+    Rows (users or groups) that don't exist in LDAP. Existence is checked with
+    batched `search_existing` by name, rows not found that way (renamed or
+    outside of configured base) are checked by DN one by one.
+    """
+    existing_dns = search_existing([row.name for row in rows if row.name])
+    return [
+        row for row in rows
+        if row.ldap_dn.lower() not in existing_dns
+        and len(ldap_client.get(row.ldap_dn)) == 0
+    ]
+
+
+def cleanup_users(chunk_size=CLEANUP_CHUNK_SIZE):
+    """
+    Mark users removed from LDAP as deleted, their projects are transferred
+    to their managers.
+
+    :returns: dict with number of checked and removed users and duration
+    """
+    started = time.monotonic()
+    ldap_client = di.get(LdapClient)
+    messaging = di.get(Messaging)
+
+    users = list(
+        model.User.query.filter(
+            model.User.ldap_dn.isnot(None),
+            model.User.deleted.is_(False),
+        )
+    )
+
+    removed_users = []
+    for chunk in _chunks(users, chunk_size):
+        removed_users.extend(
+            _removed_from_ldap(ldap_client, chunk, ldap_client.search_existing_users)
+        )
+
+    for chunk in _chunks(removed_users, chunk_size):
+        users_by_manager = collections.defaultdict(list)
+        for user in chunk:
+            logger.info(
+                f'User ID={user.id} LDAP_DN={user.ldap_dn} has been removed from LDAP.',
+                extra={'user_id': user.id, 'user_ldap_dn': user.ldap_dn},
+            )
+            users_by_manager[user.manager_id].append(user.id)
+            user.deleted = True
+
+        for manager_id, user_ids in users_by_manager.items():
+            openstack_model.Project.query.filter(
+                openstack_model.Project.owner_id.in_(user_ids),
+            ).update(
+                {'owner_id': manager_id},
+                synchronize_session='fetch',
+            )
+            # Bulk update is not tracked by ORM events, quota usage of the
+            # projects has to be moved to the manager explicitly.
+            lab_model.quota_usage_invalidate(
+                db.session,
+                owner_ids=[*user_ids, *filter(None, [manager_id])],
+            )
+
+        messages = [
+            {
+                'user_id': user.id,
+                'user_name': user.name,
+                'manager_id': user.manager_id,
+                'manager_name': user.manager.name if user.manager else None,
+            }
+            for user in chunk
+        ]
+
+        db.session.commit()
+
+        for extra in messages:
+            messaging.send(
+                'auth.user.delete',
+                f'User "{extra["user_name"]}" has been deleted.',
+                extra=extra,
+            )
+            model.token_cache_invalidate(user_id=extra['user_id'])
+
+    stats = {
+        'checked': len(users),
+        'removed': len(removed_users),
+        'duration': round(time.monotonic() - started, 3),
+    }
+    logger.info(f'Cleanup of users removed from LDAP finished, {stats}', extra=stats)
+    return stats
+
+
+def cleanup_groups(chunk_size=CLEANUP_CHUNK_SIZE):
+    """
+    Delete groups removed from LDAP, resources owned by the groups are
+    transferred to the admin group.
+
+    :returns: dict with number of checked and removed groups and duration
+    """
+    started = time.monotonic()
     ldap_client = di.get(LdapClient)
 
     admin_group = model.Group.query.filter(model.Group.name == ADMIN_GROUP).first()
 
-    groups_query = model.Group.query.filter(model.Group.ldap_dn.isnot(None))
-    for group in groups_query:
-        ldap_query = ldap_client.get(group.ldap_dn)
-        if len(ldap_query) > 0:
-            continue
+    groups = list(model.Group.query.filter(model.Group.ldap_dn.isnot(None)))
 
-        logger.info(
-            f'Group ID={group.id} LDAP_DN={group.ldap_dn} has been removed from LDAP.',
-            extra={'group_id': group.id, 'group_ldap_dn': group.ldap_dn},
+    removed_groups = []
+    for chunk in _chunks(groups, chunk_size):
+        removed_groups.extend(
+            _removed_from_ldap(ldap_client, chunk, ldap_client.search_existing_groups)
         )
 
+    for chunk in _chunks(removed_groups, chunk_size):
+        for group in chunk:
+            logger.info(
+                f'Group ID={group.id} LDAP_DN={group.ldap_dn} has been removed from LDAP.',
+                extra={'group_id': group.id, 'group_ldap_dn': group.ldap_dn},
+            )
+
+        group_ids = [group.id for group in chunk]
+
         lab_model.Region.query.filter(
-            lab_model.Region.users_group_id == group.id,
+            lab_model.Region.users_group_id.in_(group_ids),
         ).update(
             {'users_group_id': None},
-            synchronize_session='fetch',
+            synchronize_session=False,
         )
 
         lab_model.Region.query.filter(
-            lab_model.Region.owner_group_id == group.id
+            lab_model.Region.owner_group_id.in_(group_ids),
         ).update(
             {'owner_group_id': admin_group.id},
-            synchronize_session='fetch',
+            synchronize_session=False,
         )
 
         openstack_model.Project.query.filter(
-            openstack_model.Project.group_id == group.id,
+            openstack_model.Project.group_id.in_(group_ids),
         ).update(
             {'group_id': None},
-            synchronize_session='fetch',
+            synchronize_session=False,
         )
 
         openstack_model.Cloud.query.filter(
-            openstack_model.Cloud.owner_group_id == group.id
+            openstack_model.Cloud.owner_group_id.in_(group_ids),
         ).update(
             {'owner_group_id': admin_group.id},
-            synchronize_session='fetch',
+            synchronize_session=False,
         )
 
         satellite_model.SatelliteServer.query.filter(
-            satellite_model.SatelliteServer.owner_group_id == group.id
+            satellite_model.SatelliteServer.owner_group_id.in_(group_ids),
         ).update(
             {'owner_group_id': admin_group.id},
-            synchronize_session='fetch',
+            synchronize_session=False,
         )
 
         dns_model.DnsServer.query.filter(
-            dns_model.DnsServer.owner_group_id == group.id
+            dns_model.DnsServer.owner_group_id.in_(group_ids),
         ).update(
             {'owner_group_id': admin_group.id},
-            synchronize_session='fetch',
+            synchronize_session=False,
         )
 
-        model.UserGroup.query.filter(model.UserGroup.group_id == group.id).delete()
+        model.UserGroup.query.filter(
+            model.UserGroup.group_id.in_(group_ids),
+        ).delete(synchronize_session=False)
+
+        for group in chunk:
+            db.session.delete(group)
 
-        db.session.delete(group)
         db.session.commit()
+
+    stats = {
+        'checked': len(groups),
+        'removed': len(removed_groups),
+        'duration': round(time.monotonic() - started, 3),
+    }
+    logger.info(f'Cleanup of groups removed from LDAP finished, {stats}', extra=stats)
+    return stats
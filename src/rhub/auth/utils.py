@@ -2,30 +2,85 @@ import base64
 import functools
 import struct
 
+import flask
 from werkzeug.exceptions import Forbidden
 
+from rhub.api import db
 from rhub.auth import model
 
 
-def is_user_in_group(user_id, *group_name):
-    q = (
-        model.User.query
+class Principal:
+    """
+    Authenticated user with roles and groups, see :func:`get_principal`.
+    """
+
+    def __init__(self, user, groups):
+        #: :type: :class:`rhub.auth.model.User`
+        self.user = user
+        self.group_ids = frozenset(group.id for group in groups)
+        self.group_names = frozenset(group.name for group in groups)
+        self.roles = frozenset(role for group in groups for role in group.roles)
+
+    def __repr__(self):
+        return f'<Principal user_id={self.id}>'
+
+    @property
+    def id(self):
+        return self.user.id
+
+    @property
+    def is_admin(self):
+        return model.Role.ADMIN in self.roles
+
+    @property
+    def is_cluster_admin(self):
+        return self.is_admin or model.Role.LAB_CLUSTER_ADMIN in self.roles
+
+    def has_role(self, role):
+        """Check if user has the role, admin has all roles."""
+        return role in self.roles or self.is_admin
+
+
+def _load_principal(user_id):
+    rows = (
+        db.session.query(model.User, model.Group)
+        .outerjoin(model.UserGroup, model.UserGroup.user_id == model.User.id)
+        .outerjoin(model.Group, model.Group.id == model.UserGroup.group_id)
         .filter(model.User.id == user_id)
-        .join(model.Group, model.User.groups)
-        .filter(model.Group.name.in_(group_name))
+        .all()
     )
-    return q.count() > 0
+    if not rows:
+        raise ValueError(f'User ID={user_id} does not exist')
+    return Principal(rows[0][0], [group for _, group in rows if group is not None])
+
+
+def get_principal(user_id):
+    """
+    Get :class:`Principal` for the user. User, roles and groups are loaded in
+    one query and then reused for the rest of the request (stored in
+    :data:`flask.g`). Outside of request, data are loaded on every call.
+    """
+    if not flask.has_request_context():
+        return _load_principal(user_id)
+
+    principals = flask.g.setdefault('rhub_principals', {})
+    if user_id not in principals:
+        principals[user_id] = _load_principal(user_id)
+    return principals[user_id]
+
+
+def is_user_in_group(user_id, *group_name):
+    return not get_principal(user_id).group_names.isdisjoint(group_name)
 
 
 def user_is_admin(user_id):
     """Check if user is admin, belongs to :const:`rhub.auth.ADMIN_GROUP` group."""
-    return model.User.query.get(user_id).is_admin
+    return get_principal(user_id).is_admin
 
 
 def user_group_ids(user_id):
     """Returns a set of group IDs to which the user belongs."""
-    q = model.UserGroup.query.filter(model.UserGroup.user_id == user_id)
-    return set(row.group_id for row in q)
+    return set(get_principal(user_id).group_ids)
 
 
 def route_require_role(role: model.Role,
@@ -46,8 +101,7 @@ def route_require_role(role: model.Role,
 
         @functools.wraps(fn)
         def inner(*args, **kwargs):
-            user = model.User.query.get(kwargs['user'])
-            if role not in user.roles and not user.is_admin:
+            if not get_principal(kwargs['user']).has_role(role):
                 raise Forbidden(forbidden_message)
             return fn(*args, **kwargs)
         return inner
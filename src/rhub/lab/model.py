@@ -1,7 +1,9 @@
 import datetime
 import enum
+import itertools
 import re
 
+from sqlalchemy import event
 from sqlalchemy.dialects import postgresql
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import validates
@@ -14,6 +16,7 @@ from rhub.lab import SHAREDCLUSTER_GROUP
 from rhub.openstack import model as openstack_model
 from rhub.satellite import model as satellite_model
 from rhub.tower import model as tower_model
+from rhub.tower import output_cache
 from rhub.auth import model as user_model
 
 
@@ -102,57 +105,27 @@ class Region(db.Model, ModelMixin):
             return None
         return datetime.timedelta(days=self.reservation_expiration_max)
 
-    def to_dict(self):
-        data = super().to_dict()
+    def to_dict(self, fields=None, expand=None):
+        selection = self.field_selection(fields, expand)
+        data = super().to_dict(fields, expand)
 
-        del data['user_quota_id']
-        del data['total_quota_id']
+        data.pop('user_quota_id', None)
+        data.pop('total_quota_id', None)
 
-        data['owner_group_name'] = self.owner_group.name
-        data['users_group_name'] = self.users_group.name if self.users_group else None
+        if 'owner_group_name' in selection:
+            data['owner_group_name'] = self.owner_group.name
+        if 'users_group_name' in selection:
+            data['users_group_name'] = self.users_group.name if self.users_group else None
 
         return data
 
-    def _query_cluster_hosts_usage(self):
-        return (
-            db.session.query(
-                db.func.coalesce(db.func.sum(ClusterHost.num_vcpus), 0),
-                db.func.coalesce(db.func.sum(ClusterHost.ram_mb), 0),
-                db.func.coalesce(db.func.sum(ClusterHost.num_volumes), 0),
-                db.func.coalesce(db.func.sum(ClusterHost.volumes_gb), 0),
-            )
-            .join(
-                Cluster,
-                ClusterHost.cluster_id == Cluster.id,
-            )
-            .join(
-                openstack_model.Project,
-                Cluster.project_id == openstack_model.Project.id,
-            )
-            .join(
-                auth_model.User,
-                openstack_model.Project.owner_id == auth_model.User.id,
-            )
-        )
-
     def get_user_quota_usage(self, user_id):
-        query = self._query_cluster_hosts_usage().where(
-            db.and_(
-                Cluster.region_id == self.id,
-                Cluster.owner_id == user_id,
-            )
-        )
-        result = query.first()
-
-        return dict(zip(Quota.FIELDS, result))
+        """User's usage in the region, see :class:`QuotaUsage`."""
+        return QuotaUsage.get_user_usage(self.id, user_id)
 
     def get_total_quota_usage(self):
-        query = self._query_cluster_hosts_usage().where(
-            Cluster.region_id == self.id,
-        )
-        result = query.first()
-
-        return dict(zip(Quota.FIELDS, result))
+        """Usage of all users in the region, see :class:`QuotaUsage`."""
+        return QuotaUsage.get_total_usage(self.id)
 
     def is_product_enabled(self, product_id):
         """Check if the product is configured and enabled in the region."""
@@ -296,6 +269,8 @@ class Cluster(db.Model, ModelMixin):
     product_params = db.Column(db.JSON, nullable=False)
     product = db.relationship('Product', back_populates='clusters')
 
+    __expandable__ = ['hosts', 'quota', 'quota_usage']
+
     RESERVED_NAMES = [
         'localhost',
         'all',
@@ -338,14 +313,48 @@ class Cluster(db.Model, ModelMixin):
         """
         User quota usage.
 
+        Usage set by :meth:`load_quota_usage` is used if available, otherwise
+        it's computed from the loaded hosts.
+
         :type: dict or `None`
         """
+        usage = getattr(self, '_quota_usage', None)
+        if usage is not None:
+            return usage
+
         usage = dict.fromkeys(Quota.FIELDS, 0)
         for host in self.hosts:
             for k in usage:
                 usage[k] += getattr(host, k) or 0
         return usage
 
+    @classmethod
+    def load_quota_usage(cls, clusters):
+        """
+        Compute :attr:`quota_usage` of all `clusters` in one aggregate query,
+        so the hosts don't need to be loaded.
+        """
+        clusters = {cluster.id: cluster for cluster in clusters}
+        if not clusters:
+            return
+
+        rows = (
+            ClusterHost.query
+            .with_entities(
+                ClusterHost.cluster_id,
+                *(db.func.coalesce(db.func.sum(getattr(ClusterHost, k)), 0)
+                  for k in Quota.FIELDS),
+            )
+            .filter(ClusterHost.cluster_id.in_(clusters))
+            .group_by(ClusterHost.cluster_id)
+            .all()
+        )
+
+        for cluster in clusters.values():
+            cluster._quota_usage = dict.fromkeys(Quota.FIELDS, 0)
+        for cluster_id, *usage in rows:
+            clusters[cluster_id]._quota_usage = dict(zip(Quota.FIELDS, usage))
+
     @hybrid_property
     def owner_id(self):
         return self.project.owner_id
@@ -376,15 +385,19 @@ class Cluster(db.Model, ModelMixin):
 
     @property
     def authorized_keys(self):
+        """
+        SSH keys of the owner and all users (shared cluster) or group members.
+        Keys of users and groups are read from materialized
+        :class:`rhub.auth.model.AuthorizedKeys`, the list is sorted so it can
+        be used to compute ETag.
+        """
+        AuthorizedKeys = user_model.AuthorizedKeys
         keys = set(self.owner.ssh_keys)
         if self.shared:
-            users_query = user_model.User.query.filter(user_model.User.deleted.isnot(True))
-            for user in users_query:
-                keys |= set(user.ssh_keys)
+            keys.update(AuthorizedKeys.get_keys(AuthorizedKeys.ALL_USERS))
         elif self.group:
-            for user in self.group.users:
-                keys |= set(user.ssh_keys)
-        return list(keys)
+            keys.update(AuthorizedKeys.get_keys(AuthorizedKeys.group_scope(self.group_id)))
+        return sorted(keys)
 
     @property
     def tower_launch_extra_vars(self):
@@ -402,38 +415,42 @@ class Cluster(db.Model, ModelMixin):
         }
         return rhub_extra_vars | self.product_params
 
-    def to_dict(self):
-        data = super().to_dict()
-
-        data['region_name'] = self.region.name
-        data['owner_id'] = self.owner_id
-        data['owner_name'] = self.owner.name
-        data['group_id'] = self.group_id
-        data['group_name'] = self.group.name if self.group else None
-        data['project_id'] = self.project.id
-        data['project_name'] = self.project.name
-        data['shared'] = self.shared
-
-        if self.hosts:
+    def to_dict(self, fields=None, expand=None):
+        selection = self.field_selection(fields, expand)
+        data = super().to_dict(fields, expand)
+
+        if 'region_name' in selection:
+            data['region_name'] = self.region.name
+        if 'owner_id' in selection:
+            data['owner_id'] = self.owner_id
+        if 'owner_name' in selection:
+            data['owner_name'] = self.owner.name
+        if 'group_id' in selection:
+            data['group_id'] = self.group_id
+        if 'group_name' in selection:
+            data['group_name'] = self.group.name if self.group else None
+        if 'project_id' in selection:
+            data['project_id'] = self.project.id
+        if 'project_name' in selection:
+            data['project_name'] = self.project.name
+        if 'shared' in selection:
+            data['shared'] = self.shared
+
+        if 'hosts' in selection:
             data['hosts'] = [host.to_dict() for host in self.hosts]
-        else:
-            data['hosts'] = []
 
-        if self.quota:
-            data['quota'] = self.quota.to_dict()
-            data['quota_usage'] = self.quota_usage
-        else:
-            data['quota'] = None
-            data['quota_usage'] = None
+        if 'quota' in selection:
+            data['quota'] = self.quota.to_dict() if self.quota else None
+        if 'quota_usage' in selection:
+            data['quota_usage'] = self.quota_usage if self.quota else None
 
-        if self.status:
-            data['status'] = self.status.value
-            data['status_flag'] = self.status.flag
-        else:
-            data['status'] = None
-            data['status_flag'] = None
+        if 'status' in selection:
+            data['status'] = self.status.value if self.status else None
+        if 'status_flag' in selection:
+            data['status_flag'] = self.status.flag if self.status else None
 
-        data['product_name'] = self.product.name
+        if 'product_name' in selection:
+            data['product_name'] = self.product.name
 
         return data
 
@@ -505,6 +522,16 @@ class ClusterTowerJobEvent(ClusterEvent):
         tower_client = self.tower.create_tower_client()
         return tower_client.template_job_stdout(self.tower_job_id, output_format='txt')
 
+    def get_tower_job_output_stream(self, start_line=None, end_line=None):
+        """
+        Stream job stdout, output of finished jobs is cached.
+
+        See :func:`rhub.tower.output_cache.job_output_stream()`.
+        """
+        return output_cache.job_output_stream(
+            self.tower, self.tower_job_id, start_line=start_line, end_line=end_line,
+        )
+
 
 class ClusterStatusChangeEvent(ClusterEvent):
     __mapper_args__ = {
@@ -552,6 +579,198 @@ class ClusterHost(db.Model, ModelMixin):
     cluster = db.relationship('Cluster', back_populates='hosts')
 
 
+class QuotaUsage(db.Model):
+    """
+    Materialized sum of resources of cluster hosts per region and owner, used
+    by quota checks and usage endpoints instead of aggregating hosts.
+
+    Rows of owners are recomputed when the transaction that changed cluster
+    hosts, clusters or project owners is committed, ORM changes are tracked
+    automatically, bulk updates must call :func:`quota_usage_invalidate`.
+    :meth:`verify` compares the table with hosts (cron job
+    :func:`rhub.scheduler.jobs.verify_quota_usage`).
+    """
+    __tablename__ = 'lab_quota_usage'
+
+    region_id = db.Column(db.Integer, db.ForeignKey('lab_region.id', ondelete='CASCADE'),
+                          primary_key=True)
+    owner_id = db.Column(db.Integer, db.ForeignKey('auth_user.id', ondelete='CASCADE'),
+                         primary_key=True)
+    num_vcpus = db.Column(db.Integer, nullable=False, default=0)
+    ram_mb = db.Column(db.Integer, nullable=False, default=0)
+    num_volumes = db.Column(db.Integer, nullable=False, default=0)
+    volumes_gb = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False,
+                           server_default=db.func.now())
+
+    def to_dict(self):
+        return {k: getattr(self, k) for k in Quota.FIELDS}
+
+    @staticmethod
+    def _query_hosts_usage(owner_ids=None):
+        """Usage computed from cluster hosts, grouped by region and owner."""
+        query = (
+            db.session.query(
+                Cluster.region_id,
+                openstack_model.Project.owner_id,
+                *(db.func.coalesce(db.func.sum(getattr(ClusterHost, k)), 0)
+                  for k in Quota.FIELDS),
+            )
+            .select_from(ClusterHost)
+            .join(Cluster, ClusterHost.cluster_id == Cluster.id)
+            .join(openstack_model.Project, Cluster.project_id == openstack_model.Project.id)
+            .group_by(Cluster.region_id, openstack_model.Project.owner_id)
+        )
+        if owner_ids is not None:
+            query = query.filter(openstack_model.Project.owner_id.in_(owner_ids))
+        return query
+
+    @classmethod
+    def refresh(cls, owner_ids):
+        """
+        Recompute usage of `owner_ids` in all regions.
+
+        Rows of the owners in ``auth_user`` are locked (in the order of IDs
+        to avoid deadlocks) until the end of the transaction, so concurrent
+        refreshes of the same owner don't insert duplicate rows and the later
+        one sees hosts committed by the earlier one.
+        """
+        owner_ids = sorted(owner_ids)
+        if not owner_ids:
+            return
+        db.session.execute(
+            db.select(auth_model.User.id)
+            .where(auth_model.User.id.in_(owner_ids))
+            .order_by(auth_model.User.id)
+            .with_for_update(key_share=True)
+        )
+        db.session.execute(
+            cls.__table__.delete().where(cls.owner_id.in_(owner_ids))
+        )
+        db.session.execute(
+            cls.__table__.insert().from_select(
+                ['region_id', 'owner_id', *Quota.FIELDS],
+                cls._query_hosts_usage(owner_ids).statement,
+            )
+        )
+
+    @classmethod
+    def verify(cls, fix=True):
+        """
+        Compare the table with usage computed from cluster hosts.
+
+        :param fix: recompute rows of owners with mismatched usage
+        :returns: set of `(region_id, owner_id)` with mismatched usage
+        """
+        expected = {
+            (region_id, owner_id): tuple(usage)
+            for region_id, owner_id, *usage in cls._query_hosts_usage()
+        }
+        actual = {
+            (row.region_id, row.owner_id): tuple(getattr(row, k) for k in Quota.FIELDS)
+            for row in cls.query
+        }
+        zero = (0,) * len(Quota.FIELDS)
+
+        mismatched = {
+            key for key in expected.keys() | actual.keys()
+            if expected.get(key, zero) != actual.get(key, zero)
+        }
+        if mismatched and fix:
+            cls.refresh({owner_id for _, owner_id in mismatched})
+            db.session.commit()
+        return mismatched
+
+    @classmethod
+    def get_user_usage(cls, region_id, owner_id):
+        row = cls.query.get((region_id, owner_id))
+        if row is None:
+            return dict.fromkeys(Quota.FIELDS, 0)
+        return row.to_dict()
+
+    @classmethod
+    def get_total_usage(cls, region_id):
+        result = db.session.query(
+            *(db.func.coalesce(db.func.sum(getattr(cls, k)), 0) for k in Quota.FIELDS)
+        ).filter(
+            cls.region_id == region_id,
+        ).first()
+        return dict(zip(Quota.FIELDS, result))
+
+
+_QUOTA_USAGE_DIRTY = 'rhub_quota_usage_dirty'
+
+
+def quota_usage_invalidate(session, owner_ids=(), cluster_ids=(), project_ids=()):
+    """
+    Mark :class:`QuotaUsage` of owners, owners of clusters or owners of
+    projects to be recomputed when the `session` is committed.
+    """
+    dirty = session.info.setdefault(_QUOTA_USAGE_DIRTY, {
+        'owner_ids': set(), 'cluster_ids': set(), 'project_ids': set(),
+    })
+    dirty['owner_ids'].update(owner_ids)
+    dirty['cluster_ids'].update(cluster_ids)
+    dirty['project_ids'].update(project_ids)
+
+
+def _history_values(obj, attr):
+    """Current and previous values of the column attribute."""
+    history = db.inspect(obj).attrs[attr].history
+    return {i for i in itertools.chain(history.sum(), [getattr(obj, attr)]) if i is not None}
+
+
+@event.listens_for(db.session, 'after_flush')
+def _quota_usage_track(session, flush_context):
+    owner_ids = set()
+    cluster_ids = set()
+    project_ids = set()
+
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, ClusterHost):
+            cluster_ids.update(_history_values(obj, 'cluster_id'))
+
+        elif isinstance(obj, Cluster):
+            if (obj in session.new or obj in session.deleted
+                    or db.inspect(obj).attrs.region_id.history.has_changes()
+                    or db.inspect(obj).attrs.project_id.history.has_changes()):
+                project_ids.update(_history_values(obj, 'project_id'))
+
+        elif isinstance(obj, openstack_model.Project):
+            if obj in session.deleted or db.inspect(obj).attrs.owner_id.history.has_changes():
+                owner_ids.update(_history_values(obj, 'owner_id'))
+
+    if owner_ids or cluster_ids or project_ids:
+        quota_usage_invalidate(session, owner_ids, cluster_ids, project_ids)
+
+
+@event.listens_for(db.session, 'before_commit')
+def _quota_usage_refresh(session):
+    session.flush()
+    dirty = session.info.pop(_QUOTA_USAGE_DIRTY, None)
+    if not dirty:
+        return
+
+    owner_ids = set(dirty['owner_ids'])
+    if dirty['cluster_ids']:
+        owner_ids.update(
+            i for i, in session.query(openstack_model.Project.owner_id)
+            .join(Cluster, Cluster.project_id == openstack_model.Project.id)
+            .filter(Cluster.id.in_(dirty['cluster_ids']))
+        )
+    if dirty['project_ids']:
+        owner_ids.update(
+            i for i, in session.query(openstack_model.Project.owner_id)
+            .filter(openstack_model.Project.id.in_(dirty['project_ids']))
+        )
+    QuotaUsage.refresh(owner_ids)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _quota_usage_rollback(session):
+    session.info.pop(_QUOTA_USAGE_DIRTY, None)
+
+
 class Product(db.Model, ModelMixin):
     __tablename__ = 'lab_product'
 
@@ -0,0 +1,145 @@
+import logging
+
+from celery.exceptions import Retry
+from flask import current_app
+
+from rhub.api import db
+from rhub.api.utils import date_now, date_parse
+from rhub.lab import model
+from rhub.lab import utils as lab_utils
+from rhub.worker import celery
+
+
+logger = logging.getLogger(__name__)
+
+
+def _retry_or_fail(task, cluster_id, user_id, exc, failed_status, launched_since):
+    """
+    Retry the launch `task` with exponential backoff, when retries are
+    exhausted (or the retry can't be queued) set the cluster to
+    `failed_status`.
+
+    `launched_since` (time of the first attempt) is passed to the retry, so
+    it doesn't launch the template again if the failed attempt launched the
+    job in Tower.
+    """
+    max_retries = current_app.config['LAB_TOWER_LAUNCH_MAX_RETRIES']
+    retries = task.request.retries
+
+    if retries < max_retries:
+        countdown = current_app.config['LAB_TOWER_LAUNCH_RETRY_DELAY'] * 2 ** retries
+        logger.warning(
+            f'Failed to launch Tower template for cluster ID={cluster_id}, '
+            f'retry {retries + 1}/{max_retries} in {countdown}s, {exc!s}',
+            extra={'user_id': user_id, 'cluster_id': cluster_id},
+        )
+        try:
+            raise task.retry(
+                exc=exc, countdown=countdown, max_retries=max_retries,
+                kwargs={**(task.request.kwargs or {}), 'launched_since': launched_since},
+            )
+        except Retry:
+            raise
+        except Exception:
+            logger.exception(
+                f'Failed to queue retry of Tower template launch for cluster ID={cluster_id}',
+                extra={'user_id': user_id, 'cluster_id': cluster_id},
+            )
+
+    else:
+        logger.error(
+            f'Failed to launch Tower template for cluster ID={cluster_id}, '
+            f'giving up after {retries} retries, {exc!s}',
+            extra={'user_id': user_id, 'cluster_id': cluster_id},
+        )
+
+    cluster = model.Cluster.query.get(cluster_id)
+    if not cluster:
+        return
+
+    cluster_event = model.ClusterStatusChangeEvent(
+        cluster_id=cluster.id,
+        user_id=user_id,
+        date=date_now(),
+        old_value=cluster.status,
+        new_value=failed_status,
+    )
+    db.session.add(cluster_event)
+    cluster.status = failed_status
+    db.session.commit()
+
+
+@celery.task(bind=True, ignore_result=True)
+def launch_cluster_create(self, cluster_id, user_id=None, launched_since=None):
+    """
+    Launch Tower template that creates the cluster, queued by
+    :func:`rhub.api.lab.cluster.create_cluster` in async mode
+    (`LAB_TOWER_LAUNCH_ASYNC` config). On failure the launch is retried, when
+    retries are exhausted the cluster is set to ``CREATE_FAILED``.
+
+    `launched_since` is ISO time of the first attempt, set by retries, see
+    :func:`rhub.lab.utils.launch_cluster_create`.
+    """
+    cluster = model.Cluster.query.get(cluster_id)
+    if not cluster or cluster.status != model.ClusterStatus.QUEUED:
+        logger.warning(f'Cluster ID={cluster_id} is not queued for creation, skipping launch')
+        return
+
+    first_attempt = launched_since is None
+    if first_attempt:
+        launched_since = date_now().isoformat()
+
+    try:
+        lab_utils.launch_cluster_create(
+            cluster, user_id,
+            launched_since=None if first_attempt else date_parse(launched_since),
+        )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        _retry_or_fail(self, cluster_id, user_id, e, model.ClusterStatus.CREATE_FAILED,
+                       launched_since)
+        return
+
+    logger.info(
+        f'Launched creation of cluster {cluster.name} (id {cluster.id})',
+        extra={'user_id': user_id, 'cluster_id': cluster.id},
+    )
+
+
+@celery.task(bind=True, ignore_result=True)
+def launch_cluster_delete(self, cluster_id, user_id=None, launched_since=None):
+    """
+    Launch Tower template that deletes the cluster, queued by
+    :func:`rhub.lab.utils.delete_cluster` in async mode. On failure the
+    launch is retried, when retries are exhausted the cluster is set to
+    ``DELETE_FAILED``.
+
+    `launched_since` is ISO time of the first attempt, set by retries, see
+    :func:`rhub.lab.utils.launch_cluster_delete`.
+    """
+    cluster = model.Cluster.query.get(cluster_id)
+    if not cluster or cluster.status != model.ClusterStatus.DELETION_QUEUED:
+        logger.warning(f'Cluster ID={cluster_id} is not queued for deletion, skipping launch')
+        return
+
+    first_attempt = launched_since is None
+    if first_attempt:
+        launched_since = date_now().isoformat()
+
+    try:
+        lab_utils.launch_cluster_delete(
+            cluster, user_id,
+            launched_since=None if first_attempt else date_parse(launched_since),
+        )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        _retry_or_fail(self, cluster_id, user_id, e, model.ClusterStatus.DELETE_FAILED,
+                       launched_since)
+        return
+
+    logger.info(
+        f'Launched deletion of cluster {cluster.name} (id {cluster.id})',
+        extra={'user_id': user_id, 'cluster_id': cluster.id},
+    )
@@ -1,44 +1,290 @@
+import collections
+import json
 import logging
+import threading
 
 from rhub.api import db
+from rhub.api.cache import TTLCache
 from rhub.api.utils import date_now
 from rhub.lab import model
+from rhub.tower.client import TowerError
 
 
 logger = logging.getLogger(__name__)
 
 
-def delete_cluster(cluster, user=None):
+#: Cache of Tower templates resolved from product template names, keys are
+#: ``(tower_id, template_name)`` and values are dicts with template ``id`` and
+#: ``name``, see :func:`tower_template_get`.
+tower_template_cache = TTLCache(maxsize=256, ttl=3600)
+
+
+def tower_template_get(tower_id, tower_client, template_name):
+    """
+    Get Tower template by its name, the template is cached in
+    :data:`tower_template_cache` to save Tower query on every launch.
+
+    :returns: dict with template ``id`` and ``name``
+    :raises: TowerError
+    """
+    key = (tower_id, template_name)
+    tower_template = tower_template_cache.get(key)
+    if tower_template is None:
+        data = tower_client.template_get(template_name=template_name)
+        tower_template = {'id': data['id'], 'name': data['name']}
+        tower_template_cache.set(key, tower_template)
+    return tower_template
+
+
+def tower_template_cache_invalidate(template_names=None, tower_id=None):
+    """
+    Remove templates from :data:`tower_template_cache` by template names
+    and/or Tower server, all templates if no argument is set.
+    """
+    template_names = set(template_names or [])
+
+    def predicate(key, _):
+        key_tower_id, key_template_name = key
+        if tower_id is not None and key_tower_id != tower_id:
+            return False
+        return not template_names or key_template_name in template_names
+
+    tower_template_cache.delete_if(predicate)
+
+
+def warm_tower_template_cache():
+    """
+    Resolve templates of all enabled products in enabled regions and store
+    them in :data:`tower_template_cache`. Failures are logged and skipped.
+    """
+    region_products = model.RegionProduct.query.join(
+        model.Region,
+    ).join(
+        model.Product,
+    ).filter(
+        model.RegionProduct.enabled.is_(True),
+        model.Region.enabled.is_(True),
+        model.Product.enabled.is_(True),
+        model.Region.tower_id.isnot(None),
+    )
+
+    towers = {}
+    template_names = collections.defaultdict(set)
+    for region_product in region_products:
+        region, product = region_product.region, region_product.product
+        towers[region.tower_id] = region.tower
+        template_names[region.tower_id].update([
+            product.tower_template_name_create,
+            product.tower_template_name_delete,
+        ])
+
+    for tower_id, tower in towers.items():
+        try:
+            tower_client = tower.create_tower_client()
+            for template_name in sorted(template_names[tower_id]):
+                tower_template_get(tower_id, tower_client, template_name)
+        except Exception as e:
+            logger.warning(
+                f'Failed to load Tower templates from server {tower.name} '
+                f'(id {tower_id}) to the cache, {e!s}'
+            )
+
+    logger.info(f'Loaded {len(tower_template_cache)} Tower templates to the cache')
+
+
+def warm_tower_template_cache_in_background(app):
+    """Run :func:`warm_tower_template_cache` in a daemon thread."""
+    def warm():
+        with app.app_context():
+            try:
+                warm_tower_template_cache()
+            except Exception:
+                logger.exception('Failed to load Tower templates to the cache')
+
+    thread = threading.Thread(target=warm, name='tower-template-cache', daemon=True)
+    thread.start()
+    return thread
+
+
+def _find_launched_job(tower_client, tower_template, cluster, launched_since):
+    """
+    Find job of the `tower_template` launched for the `cluster` (by
+    ``rhub_cluster_id`` extra var) after `launched_since`.
+
+    :returns: dict, job data or `None`
+    """
+    tower_jobs = tower_client.template_jobs_list(
+        tower_template['id'],
+        {'created__gte': launched_since.isoformat(), 'order_by': '-id'},
+    )
+    for tower_job in tower_jobs:
+        extra_vars = json.loads(tower_job.get('extra_vars') or '{}')
+        if extra_vars.get('rhub_cluster_id') == cluster.id:
+            return tower_job
+    return None
+
+
+def _tower_template_launch(cluster, template_name, extra_vars, user=None,
+                           launched_since=None):
+    """
+    Launch Tower template by its name. If the launch fails with 404, the
+    cached template is probably stale (template was re-created in Tower), so
+    it is resolved again and launched once more.
+
+    If `launched_since` is set (retry of failed launch), the template is not
+    launched again if Tower already has job of the template for the cluster
+    created after that time, for example the previous launch timed out after
+    Tower accepted it.
+
+    :returns: tuple, template and job data
+    """
+    tower_id = cluster.region.tower_id
+    tower_client = cluster.region.tower.create_tower_client()
+    tower_template = tower_template_get(tower_id, tower_client, template_name)
+
+    if launched_since is not None:
+        tower_job = _find_launched_job(tower_client, tower_template, cluster, launched_since)
+        if tower_job is not None:
+            logger.warning(
+                f'Tower template {tower_template["name"]} (id={tower_template["id"]}) '
+                f'already launched for cluster ID={cluster.id}, job ID {tower_job["id"]}',
+                extra={'user_id': user, 'cluster_id': cluster.id},
+            )
+            return tower_template, tower_job
+
+    logger.info(
+        f'Launching Tower template {tower_template["name"]} '
+        f'(id={tower_template["id"]}), '
+        f'extra_vars={extra_vars!r}',
+        extra={'user_id': user},
+    )
     try:
-        tower_client = cluster.region.tower.create_tower_client()
-        tower_template = tower_client.template_get(
-            template_name=cluster.product.tower_template_name_delete,
+        tower_job = tower_client.template_launch(
+            tower_template['id'],
+            {'extra_vars': extra_vars},
         )
-
-        logger.info(
-            f'Launching Tower template {tower_template["name"]} '
-            f'(id={tower_template["id"]}), '
-            f'extra_vars={cluster.tower_launch_extra_vars!r}'
+    except TowerError as e:
+        if getattr(e.response, 'status_code', None) != 404:
+            raise
+        logger.warning(
+            f'Tower template {tower_template["name"]} (id={tower_template["id"]}) '
+            'not found, resolving the template again'
         )
-        tower_client.template_launch(
+        tower_template_cache_invalidate([template_name], tower_id=tower_id)
+        tower_template = tower_template_get(tower_id, tower_client, template_name)
+        tower_job = tower_client.template_launch(
             tower_template['id'],
-            {'extra_vars': cluster.tower_launch_extra_vars},
+            {'extra_vars': extra_vars},
         )
 
-        tower_job = {'id': 0}
+    return tower_template, tower_job
+
+
+def launch_cluster_create(cluster, user=None, launched_since=None):
+    """
+    Launch Tower template that creates the `cluster` and add the Tower job
+    event. Changes are not committed. See :func:`_tower_template_launch` for
+    `launched_since`.
+    """
+    _, tower_job = _tower_template_launch(
+        cluster,
+        cluster.product.tower_template_name_create,
+        cluster.tower_launch_extra_vars,
+        user,
+        launched_since,
+    )
 
-        cluster_event = model.ClusterTowerJobEvent(
+    cluster_event = model.ClusterTowerJobEvent(
+        cluster_id=cluster.id,
+        user_id=user,
+        date=date_now(),
+        tower_id=cluster.region.tower_id,
+        tower_job_id=tower_job['id'],
+        status=model.ClusterStatus.QUEUED,
+    )
+    db.session.add(cluster_event)
+
+    cluster.status = model.ClusterStatus.QUEUED
+
+
+def launch_cluster_delete(cluster, user=None, launched_since=None):
+    """
+    Launch Tower template that deletes the `cluster` and add the Tower job
+    event. Changes are not committed. See :func:`_tower_template_launch` for
+    `launched_since`.
+    """
+    _tower_template_launch(
+        cluster,
+        cluster.product.tower_template_name_delete,
+        cluster.tower_launch_extra_vars,
+        user,
+        launched_since,
+    )
+
+    tower_job = {'id': 0}
+
+    cluster_event = model.ClusterTowerJobEvent(
+        cluster_id=cluster.id,
+        user_id=user,
+        date=date_now(),
+        tower_id=cluster.region.tower_id,
+        tower_job_id=tower_job['id'],
+        status=model.ClusterStatus.DELETION_QUEUED,
+    )
+    db.session.add(cluster_event)
+
+    cluster.status = model.ClusterStatus.DELETION_QUEUED
+
+
+def queue_cluster_launch(cluster, task, failed_status, user=None):
+    """
+    Queue Tower launch `task` (:mod:`rhub.lab.tasks`) of the `cluster` that
+    is already committed in queued status. If the task can't be queued, for
+    example the broker is down, the cluster is set to `failed_status`, so it
+    is not left queued forever.
+
+    :raises: exception from queuing the task
+    """
+    try:
+        task.delay(cluster.id, user)
+
+    except Exception as e:
+        logger.exception(
+            f'Failed to queue Tower launch of cluster ID={cluster.id}, {e!s}',
+            extra={'user_id': user, 'cluster_id': cluster.id},
+        )
+        cluster_event = model.ClusterStatusChangeEvent(
             cluster_id=cluster.id,
             user_id=user,
             date=date_now(),
-            tower_id=cluster.region.tower_id,
-            tower_job_id=tower_job['id'],
-            status=model.ClusterStatus.DELETION_QUEUED,
+            old_value=cluster.status,
+            new_value=failed_status,
         )
         db.session.add(cluster_event)
+        cluster.status = failed_status
+        db.session.commit()
+        raise
+
+
+def delete_cluster(cluster, user=None, async_launch=False):
+    """
+    Delete the cluster, Tower template is launched immediately or, if
+    `async_launch` is true, by :func:`rhub.lab.tasks.launch_cluster_delete`
+    task after the cluster is committed in ``DELETION_QUEUED`` status.
+    """
+    if async_launch:
+        from rhub.lab import tasks as lab_tasks
 
         cluster.status = model.ClusterStatus.DELETION_QUEUED
+        db.session.commit()
+        queue_cluster_launch(cluster, lab_tasks.launch_cluster_delete,
+                             model.ClusterStatus.DELETE_FAILED, user)
+        logger.info(f'Cluster {cluster.name} (id {cluster.id}) queued for deletion '
+                    f'by user {user}, Tower launch is queued')
+        return
 
+    try:
+        launch_cluster_delete(cluster, user)
         db.session.commit()
         logger.info(f'Cluster {cluster.name} (id {cluster.id}) queued for deletion '
                     f'by user {user}')
@@ -51,6 +297,78 @@ def delete_cluster(cluster, user=None):
         raise
 
 
+def cluster_notification_handler(cluster, payload, job_status):
+    """
+    Update the cluster status and notify the owner on Tower notification
+    about cluster create or delete job, see
+    :func:`rhub.tower.tasks.process_webhook_notification`. Changes are not
+    committed, the caller commits them together with the notification.
+
+    :returns: list of ``(topic, msg, extra)`` messages, the caller sends them
+              after the changes are committed
+    """
+    messages = []
+
+    job_id = payload['id']
+    job_name = payload['name']
+
+    if job_name == cluster.product.tower_template_name_create:
+        cluster_operation = 'create'
+    elif job_name == cluster.product.tower_template_name_delete:
+        cluster_operation = 'delete'
+    else:
+        return messages
+
+    def update_cluster_status(new_status):
+        if cluster.status != new_status:
+            cluster_event = model.ClusterStatusChangeEvent(
+                cluster_id=cluster.id,
+                user_id=None,
+                date=date_now(),
+                old_value=cluster.status,
+                new_value=new_status,
+            )
+            db.session.add(cluster_event)
+            cluster.status = new_status
+
+    msg_extra = {
+        'owner_id': cluster.owner_id,
+        'owner_name': cluster.owner.name,
+        'cluster_id': cluster.id,
+        'cluster_name': cluster.name,
+        'tower_id': cluster.region.tower_id,
+        'job_id': job_id,
+        'job_status': job_status,
+    }
+
+    if job_status == 'successful':
+        messages.append((
+            f'lab.cluster.{cluster_operation}',
+            f'Cluster "{cluster.name}" (ID={cluster.id}) has been successfully '
+            f'{cluster_operation}d.',
+            msg_extra,
+        ))
+        if cluster_operation == 'create':
+            update_cluster_status(model.ClusterStatus.ACTIVE)
+        else:
+            update_cluster_status(model.ClusterStatus.DELETED)
+
+    elif job_status == 'failed':
+        messages.append((
+            f'lab.cluster.{cluster_operation}',
+            f'Failed to {cluster_operation} cluster "{cluster.name}" '
+            f'(ID={cluster.id}).',
+            msg_extra,
+        ))
+        if not cluster.status.is_failed:
+            if cluster_operation == 'create':
+                update_cluster_status(model.ClusterStatus.CREATE_FAILED)
+            else:
+                update_cluster_status(model.ClusterStatus.DELETE_FAILED)
+
+    return messages
+
+
 def calculate_cluster_usage(cluster):
     """
     Calculate cluster usage from cluster parameters and product flavors. Should
@@ -6,9 +6,11 @@ import rhub.tower.model
 from rhub.api import db, di
 from rhub.api.utils import date_now
 from rhub.auth import tasks as auth_tasks
+from rhub.auth.ldap import LdapClient
 from rhub.lab import model as lab_model
 from rhub.lab import utils as lab_utils
 from rhub.messaging import Messaging
+from rhub.tower import tasks as tower_tasks
 from rhub.worker import celery
 
 
@@ -191,9 +193,96 @@ def cleanup_deleted_clusters(params):
             )
 
 
+@CronJob
+def verify_quota_usage(params):
+    """
+    Verify materialized quota usage (:class:`rhub.lab.model.QuotaUsage`)
+    against cluster hosts, mismatched rows are recomputed.
+
+    params:
+        fix -- recompute mismatched rows. Default: true
+    """
+    mismatched = lab_model.QuotaUsage.verify(fix=params.get('fix', True))
+    if mismatched:
+        logger.warning(
+            f'Quota usage mismatch for (region_id, owner_id): {sorted(mismatched)}',
+            extra={'quota_usage_mismatched': sorted(mismatched)},
+        )
+    else:
+        logger.info('Quota usage is consistent with cluster hosts')
+
+
+@CronJob
+def requeue_tower_notifications(params):
+    """
+    Queue processing of Tower webhook notifications that were not processed
+    (:func:`rhub.tower.tasks.requeue_webhook_notifications`).
+
+    params:
+        min_age -- skip notifications received in the last N minutes, they
+            may still be processed. Default: 10
+        max_age -- give up notifications received more than N hours ago.
+            Default: 24
+    """
+    tower_tasks.requeue_webhook_notifications(
+        min_age=datetime.timedelta(minutes=params.get('min_age', 10)),
+        max_age=datetime.timedelta(hours=params.get('max_age', 24)),
+    )
+
+
+@CronJob
+def cleanup_tower_notifications(params):
+    """
+    Delete old Tower webhook notifications and processed notifications
+    ledger (:func:`rhub.tower.tasks.cleanup_webhook_notifications`).
+
+    params:
+        retention -- keep notifications for N days. Default: 30
+    """
+    deleted = tower_tasks.cleanup_webhook_notifications(
+        retention=datetime.timedelta(days=params.get('retention', 30)),
+    )
+    logger.info(
+        f'Deleted {deleted["notifications"]} Tower webhook notifications and '
+        f'{deleted["ledger"]} processed notifications ledger rows',
+        extra={'tower_notifications_deleted': deleted},
+    )
+
+
 @CronJob
 def update_ldap_data(params):
-    auth_tasks.cleanup_users()
-    auth_tasks.update_users()
-    auth_tasks.cleanup_groups()
-    auth_tasks.update_groups()
+    """
+    Update users and groups from LDAP, users and groups removed from LDAP
+    are deleted.
+
+    params:
+        bulk -- fetch users and groups with paged LDAP searches and update
+            DB in bulk (:func:`rhub.auth.tasks.update_users_bulk`), much
+            faster for large directories. Default: false
+        incremental -- update only users and groups modified since the last
+            run (:func:`rhub.auth.tasks.update_ldap_incremental`), implies
+            `bulk`. Full sync is done every `full_sync_interval` hours, so the
+            job can be scheduled to run every few minutes. Default: false
+        full_sync_interval -- interval of full sync in incremental mode in
+            hours. Default: 24
+    """
+    if params.get('incremental', False):
+        auth_tasks.update_ldap_incremental(
+            full_sync_interval=datetime.timedelta(
+                hours=params.get('full_sync_interval', 24),
+            ),
+        )
+
+    else:
+        bulk = params.get('bulk', False)
+
+        auth_tasks.cleanup_users()
+        auth_tasks.update_users(bulk=bulk)
+        auth_tasks.cleanup_groups()
+        auth_tasks.update_groups(bulk=bulk)
+
+    pool_stats = di.get(LdapClient).pool_stats()
+    logger.info(
+        f'LDAP connection pool stats: {pool_stats}',
+        extra={'ldap_pool_stats': pool_stats},
+    )
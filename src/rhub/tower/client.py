@@ -1,5 +1,13 @@
-import requests
+import hashlib
+import itertools
+import json
+import os
+import threading
+import time
+
 import attr
+import requests
+import requests.adapters
 
 
 class TowerError(requests.HTTPError):
@@ -14,17 +22,25 @@ class Tower:
     username = attr.ib()
     password = attr.ib(repr=False)
     verify_ssl = attr.ib(default=True)
+    #: Optional :class:`requests.adapters.HTTPAdapter` shared by multiple
+    #: clients, see :class:`TowerClientRegistry`.
+    adapter = attr.ib(default=None, repr=False, eq=False)
 
     def __attrs_post_init__(self):
         self.url = self.url.rstrip('/')
 
         self._session = requests.Session()
         self._session.auth = (self.username, self.password)
+        if self.adapter is not None:
+            self._session.mount('https://', self.adapter)
+            self._session.mount('http://', self.adapter)
 
-    def request(self, method, path, params=None, data=None):
+    def request(self, method, path, params=None, data=None, stream=False):
         """
         Make request to Tower API.
 
+        :param stream: don't download the response body immediately, the
+                       response must be closed by the caller
         :returns: requests.Response
         :raises: TowerError if request failed (HTTP status code 4** or 5**)
         """
@@ -38,9 +54,12 @@ class Tower:
             headers=headers,
             params=params,
             json=data,
+            stream=stream,
         )
 
         if not response.ok:
+            if stream:
+                response.close()
             raise TowerError(
                 f'{response.status_code} Error: {response.reason} '
                 f'for url: {response.url}',
@@ -147,6 +166,21 @@ class Tower:
             },
         ).json()
 
+    def template_jobs_list(self, template_id, params=None):
+        """
+        List jobs launched from job template, first page of results.
+
+        :param params: query parameters, filters and ordering, for example
+                       ``{'created__gte': '...', 'order_by': '-id'}``
+        :returns: list of dicts - job data
+        :raises: TowerError
+        """
+        return self.request(
+            'GET',
+            f'/job_templates/{template_id}/jobs/',
+            params=params,
+        ).json()['results']
+
     def template_job_get(self, template_job_id):
         """
         Get job (launched job template).
@@ -204,3 +238,221 @@ class Tower:
         if output_format == 'json':
             return response.json()
         return response.text
+
+    def template_job_stdout_stream(self, template_job_id, start_line=None,
+                                   end_line=None, chunk_size=64 * 1024):
+        """
+        Stream job stdout (output from Ansible) as plain text, the output is
+        not loaded into memory. Use `start_line` and `end_line` to get only
+        part of the output, for example new lines of running job.
+
+        Tower refuses to display large output in ``txt`` format, so the output
+        is always downloaded in ``txt_download`` format and lines out of the
+        range are skipped while streaming, the download is stopped at
+        `end_line`.
+
+        :returns: iterator of bytes chunks
+        :raises: TowerError, before the iterator is returned
+        """
+        response = self.request(
+            'GET',
+            f'/jobs/{template_job_id}/stdout/',
+            params={'format': 'txt_download'},
+            stream=True,
+        )
+
+        def iter_chunks():
+            try:
+                chunks = response.iter_content(chunk_size)
+                if start_line is None and end_line is None:
+                    yield from chunks
+                else:
+                    yield from _iter_lines_range(chunks, start_line, end_line, chunk_size)
+            finally:
+                response.close()
+
+        return iter_chunks()
+
+
+def _iter_lines(chunks):
+    rest = b''
+    for chunk in chunks:
+        *lines, rest = (rest + chunk).split(b'\n')
+        for line in lines:
+            yield line + b'\n'
+    if rest:
+        yield rest
+
+
+def _iter_lines_range(chunks, start_line, end_line, chunk_size):
+    """
+    Lines from `start_line` to `end_line` (exclusive) of text in bytes
+    `chunks`, lines are joined to chunks of at least `chunk_size` bytes.
+    """
+    buffer = []
+    buffer_size = 0
+    for line in itertools.islice(_iter_lines(chunks), start_line or 0, end_line):
+        buffer.append(line)
+        buffer_size += len(line)
+        if buffer_size >= chunk_size:
+            yield b''.join(buffer)
+            buffer = []
+            buffer_size = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def credentials_version(credentials):
+    """Version of Tower credentials, hash of the credentials data."""
+    data = json.dumps(credentials, sort_keys=True, default=str).encode()
+    return hashlib.sha256(data).hexdigest()
+
+
+@attr.s
+class _RegistryEntry:
+    settings = attr.ib()
+    version = attr.ib()
+    client = attr.ib()
+    checked_at = attr.ib()
+
+
+class TowerClientRegistry:
+    """
+    Thread-safe registry of :class:`Tower` clients keyed by server ID.
+
+    Clients are reused, so connections to Tower are kept open between
+    requests, and all clients share one :class:`requests.adapters.HTTPAdapter`
+    connection pool. A client is rebuilt when server settings (URL, SSL
+    verification, credentials path) or the credentials version change.
+    Credentials are read again at most once per `credentials_ttl` seconds,
+    their version is a hash of the data (see :func:`credentials_version`).
+
+    Clients are not shared with forked processes (gunicorn or Celery
+    workers), the registry is reset in the child process on first use.
+    """
+
+    STATS = ('hits', 'misses', 'rebuilds', 'credentials_reads')
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, credentials_ttl=60):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.credentials_ttl = credentials_ttl
+
+        self._lock = threading.Lock()
+        self._reset()
+
+    def __repr__(self):
+        return f'<TowerClientRegistry clients={len(self._clients)}>'
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._clients = {}
+        self._adapter = requests.adapters.HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+        )
+        self._stats = dict.fromkeys(self.STATS, 0)
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # Sockets are shared with the parent process, don't close.
+                    self._reset()
+
+    def configure(self, pool_connections=None, pool_maxsize=None,
+                  credentials_ttl=None):
+        """Change pool size or credentials TTL, existing clients are dropped."""
+        with self._lock:
+            if pool_connections is not None:
+                self.pool_connections = pool_connections
+            if pool_maxsize is not None:
+                self.pool_maxsize = pool_maxsize
+            if credentials_ttl is not None:
+                self.credentials_ttl = credentials_ttl
+            self._adapter.close()
+            self._reset()
+
+    def get(self, server_id, url, verify_ssl, credentials_path, read_credentials):
+        """
+        Get client for the server, create a new one if the server is not in
+        the registry or its settings or credentials changed.
+
+        :param read_credentials: callable that returns dict with ``username``
+                                 and ``password``, it is called only when
+                                 credentials need to be checked
+        :returns: :class:`Tower`
+        """
+        self._check_pid()
+
+        settings = (url, verify_ssl, credentials_path)
+
+        with self._lock:
+            entry = self._clients.get(server_id)
+            if (entry and entry.settings == settings
+                    and time.monotonic() - entry.checked_at < self.credentials_ttl):
+                self._stats['hits'] += 1
+                return entry.client
+
+        credentials = read_credentials()
+        version = credentials_version(credentials)
+
+        with self._lock:
+            self._stats['credentials_reads'] += 1
+
+            entry = self._clients.get(server_id)
+            if entry and entry.settings == settings and entry.version == version:
+                entry.checked_at = time.monotonic()
+                self._stats['hits'] += 1
+                return entry.client
+
+            self._stats['rebuilds' if entry else 'misses'] += 1
+            client = Tower(
+                url=url,
+                username=credentials['username'],
+                password=credentials['password'],
+                verify_ssl=verify_ssl,
+                adapter=self._adapter,
+            )
+            self._clients[server_id] = _RegistryEntry(
+                settings=settings,
+                version=version,
+                client=client,
+                checked_at=time.monotonic(),
+            )
+            return client
+
+    def invalidate(self, server_id=None):
+        """Remove client of the server from the registry, all if `None`."""
+        with self._lock:
+            if server_id is None:
+                self._clients.clear()
+            else:
+                self._clients.pop(server_id, None)
+
+    def stats(self):
+        """Registry and connection pool statistics, useful for sizing the pool."""
+        with self._lock:
+            stats = {
+                'clients': len(self._clients),
+                'pool_connections': self.pool_connections,
+                'pool_maxsize': self.pool_maxsize,
+                **self._stats,
+            }
+            lookups = stats['hits'] + stats['misses'] + stats['rebuilds']
+            stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+
+            pools = self._adapter.poolmanager.pools
+            connections = requests_count = 0
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                connections += pool.num_connections
+                requests_count += pool.num_requests
+
+            # Connections opened and requests sent to all Tower hosts.
+            stats['hosts'] = len(pools)
+            stats['connections'] = connections
+            stats['requests'] = requests_count
+            return stats
@@ -1,9 +1,14 @@
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.orm import validates
 
 from rhub.api import db, di, utils
 from rhub.api.utils import ModelMixin, ModelValueError
 from rhub.api.vault import Vault
-from rhub.tower.client import Tower
+from rhub.tower.client import Tower, TowerClientRegistry
+
+
+#: Process-wide registry of Tower clients, see :meth:`Server.create_tower_client`.
+tower_clients = TowerClientRegistry()
 
 
 class Server(db.Model, ModelMixin):
@@ -20,24 +25,25 @@ class Server(db.Model, ModelMixin):
 
     def create_tower_client(self) -> Tower:
         """
-        Create Tower client.
+        Get Tower client from :data:`tower_clients` registry, the client is
+        reused until the server or its credentials in vault change.
 
         :returns: :class:`rhub.tower.client.Tower`
         :raises: `RuntimeError` if failed to create client due to missing
                  credentials in vault
         :raises: `Exception` any other errors
         """
-        vault = di.get(Vault)
-        credentials = vault.read(self.credentials)
-        if not credentials:
-            raise RuntimeError(
-                f'Missing credentials in vault; {vault!r} {self.credentials}'
-            )
-        return Tower(
-            url=self.url,
-            username=credentials['username'],
-            password=credentials['password'],
-            verify_ssl=self.verify_ssl,
+        def read_credentials():
+            vault = di.get(Vault)
+            credentials = vault.read(self.credentials)
+            if not credentials:
+                raise RuntimeError(
+                    f'Missing credentials in vault; {vault!r} {self.credentials}'
+                )
+            return credentials
+
+        return tower_clients.get(
+            self.id, self.url, self.verify_ssl, self.credentials, read_credentials,
         )
 
     @validates('url')
@@ -94,3 +100,95 @@ class Job(db.Model, ModelMixin):
     @property
     def server(self):
         return self.template.server
+
+
+class WebhookNotification(db.Model, ModelMixin):
+    """
+    Notification received from Tower webhook, the webhook only stores the
+    notification and :func:`rhub.tower.tasks.process_webhook_notification`
+    task processes it.
+    """
+    __tablename__ = 'tower_webhook_notification'
+
+    id = db.Column(db.Integer, primary_key=True)
+    received_at = db.Column(db.DateTime(timezone=True), nullable=False,
+                            server_default=db.func.now())
+    #: ID of job in Tower.
+    tower_job_id = db.Column(db.Integer, nullable=False)
+    job_status = db.Column(db.String(32), nullable=False)
+    #: Notification data as received from Tower.
+    payload = db.Column(db.JSON, nullable=False)
+    #: Time when the notification was processed, `NULL` if not yet.
+    processed_at = db.Column(db.DateTime(timezone=True), nullable=True, index=True)
+
+
+#: Order of Tower job statuses, notification with status lower or equal to
+#: already processed status of the same job is stale. All finished statuses
+#: have the same order, job can finish only once.
+JOB_STATUS_ORDER = {
+    'new': 0,
+    'pending': 1,
+    'waiting': 2,
+    'running': 3,
+    'successful': 4,
+    'failed': 4,
+    'error': 4,
+    'canceled': 4,
+}
+
+
+class ProcessedNotification(db.Model, ModelMixin):
+    """
+    Ledger of processed Tower job notifications. Tower retries webhook
+    deliveries and can deliver notifications of the same job out of order,
+    the ledger is used to drop duplicate and stale notifications before they
+    change anything, see :meth:`claim`.
+    """
+    __tablename__ = 'tower_processed_notification'
+
+    tower_id = db.Column(db.Integer,
+                         db.ForeignKey('tower_server.id', ondelete='CASCADE'),
+                         primary_key=True)
+    #: ID of job in Tower.
+    tower_job_id = db.Column(db.Integer, primary_key=True)
+    job_status = db.Column(db.String(32), primary_key=True)
+    processed_at = db.Column(db.DateTime(timezone=True), nullable=False,
+                             server_default=db.func.now(), index=True)
+
+    @classmethod
+    def claim(cls, tower_id, tower_job_id, job_status):
+        """
+        Record job status notification in the ledger, the change is not
+        committed, so it is rolled back if processing of the notification
+        fails.
+
+        Notifications of the same job are serialized by transaction-level
+        advisory lock held until the claim is committed or rolled back, so
+        concurrent notifications with different statuses of the same order
+        (e.g. ``failed`` and ``error``) are not both claimed.
+
+        :returns: `False` if the notification was already processed or
+                  a notification with later status of the same job was
+                  already processed, otherwise `True`
+        """
+        db.session.execute(
+            db.select(db.func.pg_advisory_xact_lock(tower_id, tower_job_id))
+        )
+
+        order = JOB_STATUS_ORDER.get(job_status)
+        if order is not None:
+            processed = db.session.query(cls.job_status).filter(
+                cls.tower_id == tower_id,
+                cls.tower_job_id == tower_job_id,
+            )
+            if any(JOB_STATUS_ORDER.get(status, -1) >= order for status, in processed):
+                return False
+
+        # Concurrent insert of the same row waits for the other transaction,
+        # so only one worker processes the notification.
+        result = db.session.execute(
+            postgresql.insert(cls.__table__)
+            .values(tower_id=tower_id, tower_job_id=tower_job_id, job_status=job_status)
+            .on_conflict_do_nothing()
+        )
+        return result.rowcount == 1
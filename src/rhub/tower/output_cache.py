@@ -0,0 +1,271 @@
+import gzip
+import logging
+import os
+import tempfile
+import threading
+import time
+import zlib
+
+
+logger = logging.getLogger(__name__)
+
+
+class JobOutputCache:
+    """
+    Persistent cache of finished Tower job output (stdout).
+
+    Output of finished job never changes, so it is stored gzip-compressed in
+    `directory` as ``<tower_id>/<tower_job_id>.txt.gz`` and served from the
+    cache without querying Tower, also after Tower prunes old jobs. Total
+    size of the cache is limited to `max_size` bytes, least recently used
+    files (by modification time, updated on every read) are evicted. Cache
+    with `max_size` set to zero or without `directory` is disabled.
+
+    Files are written to temporary file and renamed, so the cache can be
+    shared by multiple processes (gunicorn and Celery workers).
+    """
+
+    #: Temporary files older than this (seconds) are removed by :meth:`evict`.
+    TMP_MAX_AGE = 3600
+
+    def __init__(self, directory=None, max_size=0, chunk_size=64 * 1024):
+        self.directory = directory
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self._lock = threading.Lock()
+        self._total_size = None
+        self._filling = set()
+
+    def __repr__(self):
+        return f'<JobOutputCache directory={self.directory} max_size={self.max_size}>'
+
+    @property
+    def enabled(self):
+        return bool(self.directory) and self.max_size > 0
+
+    def configure(self, directory=None, max_size=None):
+        """Change cache directory or size, existing files are kept."""
+        if directory is not None:
+            self.directory = str(directory)
+        if max_size is not None:
+            self.max_size = max_size
+        with self._lock:
+            self._total_size = None
+
+    def _path(self, tower_id, tower_job_id):
+        return os.path.join(self.directory, str(tower_id), f'{tower_job_id}.txt.gz')
+
+    def read(self, tower_id, tower_job_id, start_line=None, end_line=None):
+        """
+        Read job output from the cache, optionally only lines from
+        `start_line` to `end_line` (exclusive).
+
+        :returns: iterator of bytes chunks, `None` if not in the cache
+        """
+        if not self.enabled:
+            return None
+
+        path = self._path(tower_id, tower_job_id)
+        try:
+            # Touch the file before it's opened, the open file would leak if
+            # the file was evicted in between.
+            os.utime(path)
+            f = gzip.open(path, 'rb')
+        except FileNotFoundError:
+            return None
+
+        def iter_lines():
+            buffer = []
+            buffer_size = 0
+            for i, line in enumerate(f):
+                if end_line is not None and i >= end_line:
+                    break
+                if start_line is not None and i < start_line:
+                    continue
+                buffer.append(line)
+                buffer_size += len(line)
+                if buffer_size >= self.chunk_size:
+                    yield b''.join(buffer)
+                    buffer = []
+                    buffer_size = 0
+            if buffer:
+                yield b''.join(buffer)
+
+        def iter_chunks():
+            try:
+                with f:
+                    if start_line is None and end_line is None:
+                        while chunk := f.read(self.chunk_size):
+                            yield chunk
+                    else:
+                        yield from iter_lines()
+            except (EOFError, OSError, zlib.error) as e:
+                # Truncated or corrupted file, e.g. disk full, the output is
+                # stored again on the next read.
+                logger.error(f'Failed to read {path} from {self!r}, removing it, {e!s}')
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+
+        return iter_chunks()
+
+    def store(self, tower_id, tower_job_id, chunks):
+        """
+        Store job output while it is passed through, the output is stored
+        only if all `chunks` are consumed.
+
+        :returns: iterator of the same bytes chunks
+        """
+        path = self._path(tower_id, tower_job_id)
+
+        def iter_chunks():
+            # Temporary file is created when the iteration starts, iterator
+            # that is never started must not leave the file behind.
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(
+                dir=os.path.dirname(path), prefix=f'.{tower_job_id}.', suffix='.tmp',
+            )
+            completed = False
+            try:
+                with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                    for chunk in chunks:
+                        f.write(chunk)
+                        yield chunk
+                size = os.path.getsize(tmp_path)
+                os.replace(tmp_path, path)
+                completed = True
+            finally:
+                if not completed:
+                    os.unlink(tmp_path)
+
+            logger.debug(f'Stored output of Tower (id {tower_id}) job {tower_job_id} '
+                         f'to {self!r}')
+            self._add_size(size)
+
+        return iter_chunks()
+
+    def _add_size(self, size):
+        """
+        Add size of stored file to the running total and evict files if the
+        cache is over `max_size`. Total is computed by :meth:`evict` when the
+        first file is stored, then it's updated without scanning the
+        directory. Files stored by other processes are counted on the next
+        eviction.
+        """
+        with self._lock:
+            if self._total_size is not None:
+                self._total_size += size
+                if self._total_size <= self.max_size:
+                    return
+        self.evict()
+
+    def evict(self):
+        """
+        Remove least recently used files until the cache fits `max_size`,
+        and temporary files left by processes that were killed while storing
+        output.
+        """
+        with self._lock:
+            files = []
+            total_size = 0
+            tmp_expire = time.time() - self.TMP_MAX_AGE
+            for root, _, filenames in os.walk(self.directory):
+                for filename in filenames:
+                    path = os.path.join(root, filename)
+                    try:
+                        st = os.stat(path)
+                        if filename.endswith('.tmp') and st.st_mtime < tmp_expire:
+                            os.unlink(path)
+                            logger.debug(f'Removed stale {path} from {self!r}')
+                            continue
+                    except FileNotFoundError:
+                        continue
+                    if not filename.endswith('.txt.gz'):
+                        continue
+                    files.append((st.st_mtime, st.st_size, path))
+                    total_size += st.st_size
+
+            files.sort()
+            for _, size, path in files:
+                if total_size <= self.max_size:
+                    break
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total_size -= size
+                logger.debug(f'Evicted {path} from {self!r}')
+
+            self._total_size = total_size
+
+    def fill_in_background(self, tower_id, tower_job_id, open_chunks):
+        """
+        Store job output in background thread, unless it's already being
+        stored by this process.
+
+        :param open_chunks: callable that returns iterator of bytes chunks of
+                            the whole output, called in the thread
+        :returns: :class:`threading.Thread`, `None` if the output is already
+                  being stored
+        """
+        key = (tower_id, tower_job_id)
+        with self._lock:
+            if key in self._filling:
+                return None
+            self._filling.add(key)
+
+        def fill():
+            try:
+                for _ in self.store(tower_id, tower_job_id, open_chunks()):
+                    pass
+            except Exception:
+                logger.exception(f'Failed to store output of Tower (id {tower_id}) '
+                                 f'job {tower_job_id} to {self!r}')
+            finally:
+                with self._lock:
+                    self._filling.discard(key)
+
+        thread = threading.Thread(target=fill, name='tower-job-output-cache', daemon=True)
+        thread.start()
+        return thread
+
+
+#: Cache of finished Tower job output, see :func:`job_output_stream`.
+job_output_cache = JobOutputCache()
+
+
+def job_output_stream(server, tower_job_id, start_line=None, end_line=None):
+    """
+    Stream Tower job output (stdout), output of finished jobs is served from
+    :data:`job_output_cache` and stored there on first read.
+
+    :param server: :class:`rhub.tower.model.Server`, Tower client is created
+                   only if the output is not cached
+    :returns: iterator of bytes chunks
+    :raises: TowerError
+    """
+    chunks = job_output_cache.read(server.id, tower_job_id, start_line, end_line)
+    if chunks is not None:
+        return chunks
+
+    tower_client = server.create_tower_client()
+
+    if job_output_cache.enabled:
+        tower_job = tower_client.template_job_get(tower_job_id)
+        if tower_job.get('finished') is not None:
+            if start_line is None and end_line is None:
+                return job_output_cache.store(
+                    server.id, tower_job_id,
+                    tower_client.template_job_stdout_stream(tower_job_id),
+                )
+            # Line range is streamed from Tower, the whole output is
+            # downloaded to the cache in background for next requests.
+            job_output_cache.fill_in_background(
+                server.id, tower_job_id,
+                lambda: tower_client.template_job_stdout_stream(tower_job_id),
+            )
+
+    return tower_client.template_job_stdout_stream(
+        tower_job_id, start_line=start_line, end_line=end_line,
+    )
@@ -0,0 +1,194 @@
+import json
+import logging
+
+import requests
+import sqlalchemy.exc
+from flask import current_app
+
+from rhub.api import db, di
+from rhub.api.utils import date_now
+from rhub.lab import model as lab_model
+from rhub.lab import utils as lab_utils
+from rhub.messaging import Messaging
+from rhub.tower import model
+from rhub.worker import celery
+
+
+logger = logging.getLogger(__name__)
+
+
+def _is_transient(exc):
+    """Check if processing failed on error that may not happen on retry."""
+    if isinstance(exc, requests.HTTPError):
+        # TowerError, 5xx is an error of Tower, 4xx of the request.
+        return exc.response is None or exc.response.status_code >= 500
+    return isinstance(exc, (requests.RequestException, sqlalchemy.exc.OperationalError))
+
+
+def _claim(cluster, job_id, job_status):
+    """
+    Record the notification in :class:`rhub.tower.model.ProcessedNotification`
+    ledger, duplicate and stale notifications are dropped.
+    """
+    if model.ProcessedNotification.claim(cluster.region.tower_id, job_id, job_status):
+        return True
+    logger.info(
+        f'Dropped duplicate or stale notification from tower {job_id=} {job_status=} '
+        f'for cluster ID={cluster.id}'
+    )
+    return False
+
+
+@celery.task(bind=True, ignore_result=True)
+def process_webhook_notification(self, notification_id, recheck=False):
+    """
+    Process notification received by :func:`rhub.api.tower.webhook_notification`.
+
+    Sometimes a job fails almost immediately after it started and Tower does
+    not send failure notification, so on ``running`` notification the task
+    schedules itself with `recheck` after `TOWER_WEBHOOK_RECHECK_DELAY`
+    seconds to check the job status in Tower.
+
+    Tower retries webhook deliveries and can deliver notifications out of
+    order, duplicate notifications and notifications with a status older
+    than already processed status of the same job are dropped, see
+    :class:`rhub.tower.model.ProcessedNotification`.
+
+    Processing that failed on Tower or DB connection error is retried with
+    exponential backoff. Notifications that are still not processed are
+    queued again by :func:`requeue_webhook_notifications`. Failed attempt is
+    rolled back, including the claim, and messages from the handler are sent
+    only after the changes are committed, so the retry processes the
+    notification again from scratch without sending the messages twice.
+    """
+    notification = model.WebhookNotification.query.get(notification_id)
+    if not notification:
+        logger.warning(f'Tower webhook notification ID={notification_id} does not exist')
+        return
+
+    payload = notification.payload
+    job_id = notification.tower_job_id
+    job_status = notification.job_status
+    messages = []
+
+    try:
+        extra_vars = json.loads(payload.get('extra_vars') or '{}')
+
+        # Notification from cluster create/delete job have `rhub_cluster_id`
+        # extra var.
+        if rhub_cluster_id := extra_vars.get('rhub_cluster_id'):
+            cluster = lab_model.Cluster.query.get(rhub_cluster_id)
+            if not cluster:
+                logger.warning(f'Cluster ID={rhub_cluster_id} from a notification '
+                               f'from tower {job_id=} does not exist')
+
+            elif not recheck and not _claim(cluster, job_id, job_status):
+                # Duplicate or stale, only mark it as processed.
+                pass
+
+            elif job_status == 'running' and not recheck:
+                # Commit the claim, so duplicates do not schedule more checks.
+                db.session.commit()
+                process_webhook_notification.apply_async(
+                    (notification_id,), {'recheck': True},
+                    countdown=current_app.config['TOWER_WEBHOOK_RECHECK_DELAY'],
+                )
+                return
+
+            elif job_status != 'running':
+                messages = lab_utils.cluster_notification_handler(
+                    cluster, payload, job_status,
+                )
+
+            else:
+                tower_client = cluster.region.tower.create_tower_client()
+                job = tower_client.template_job_get(job_id)
+                if job['failed'] and _claim(cluster, job_id, 'failed'):
+                    messages = lab_utils.cluster_notification_handler(
+                        cluster, payload, 'failed',
+                    )
+
+        notification.processed_at = date_now()
+        db.session.commit()
+
+    except Exception as e:
+        db.session.rollback()
+
+        max_retries = current_app.config['TOWER_WEBHOOK_MAX_RETRIES']
+        retries = self.request.retries
+        if _is_transient(e) and retries < max_retries:
+            countdown = current_app.config['TOWER_WEBHOOK_RETRY_DELAY'] * 2 ** retries
+            logger.warning(
+                f'Failed to process a notification from tower {job_id=} {job_status=}, '
+                f'retry {retries + 1}/{max_retries} in {countdown}s, {e!s}'
+            )
+            raise self.retry(exc=e, countdown=countdown, max_retries=max_retries)
+
+        logger.exception(
+            f'Failed to process a notification from tower {job_id=} {job_status=}'
+        )
+        return
+
+    messaging = di.get(Messaging)
+    for topic, msg, extra in messages:
+        messaging.send(topic, msg, extra=extra)
+
+
+def requeue_webhook_notifications(min_age, max_age):
+    """
+    Queue processing of notifications that were not processed, e.g. the
+    webhook failed to queue the task or the task failed. ``running``
+    notifications are queued with `recheck`, the delayed check may have been
+    lost.
+
+    :param min_age: :class:`datetime.timedelta`, skip recent notifications
+                    that may still be processed
+    :param max_age: :class:`datetime.timedelta`, older notifications are
+                    given up
+    :returns: number of queued notifications
+    """
+    now = date_now()
+    pending = db.session.query(
+        model.WebhookNotification.id,
+        model.WebhookNotification.job_status,
+    ).filter(
+        model.WebhookNotification.processed_at.is_(None),
+        model.WebhookNotification.received_at < now - min_age,
+        model.WebhookNotification.received_at >= now - max_age,
+    ).all()
+
+    for notification_id, job_status in pending:
+        process_webhook_notification.apply_async(
+            (notification_id,), {'recheck': job_status == 'running'},
+        )
+
+    if pending:
+        logger.warning(f'Queued {len(pending)} unprocessed Tower webhook notifications')
+    return len(pending)
+
+
+def cleanup_webhook_notifications(retention):
+    """
+    Delete notifications and ledger rows processed (or received, if never
+    processed) more than `retention` ago.
+
+    :param retention: :class:`datetime.timedelta`
+    :returns: dict with numbers of deleted notifications and ledger rows
+    """
+    cutoff = date_now() - retention
+
+    notifications = model.WebhookNotification.query.filter(
+        db.or_(
+            model.WebhookNotification.processed_at < cutoff,
+            db.and_(
+                model.WebhookNotification.processed_at.is_(None),
+                model.WebhookNotification.received_at < cutoff,
+            ),
+        )
+    ).delete(synchronize_session=False)
+    ledger = model.ProcessedNotification.query.filter(
+        model.ProcessedNotification.processed_at < cutoff,
+    ).delete(synchronize_session=False)
+    db.session.commit()
+
+    return {'notifications': notifications, 'ledger': ledger}
@@ -9,8 +9,10 @@ import pytest
 import sqlalchemy.exc
 
 from rhub.api import create_app
+from rhub.api.utils import count_cache
 from rhub.api.vault import Vault
 from rhub.auth.ldap import LdapClient
+from rhub.lab.utils import tower_template_cache
 from rhub.messaging import Messaging
 
 
@@ -96,6 +98,20 @@ def db_session_mock(mocker):
     yield mocker.patch('rhub.api.db.session')
 
 
+@pytest.fixture(autouse=True)
+def count_cache_clear():
+    count_cache.clear()
+    yield count_cache
+    count_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def tower_template_cache_clear():
+    tower_template_cache.clear()
+    yield tower_template_cache
+    tower_template_cache.clear()
+
+
 @pytest.fixture
 def db_unique_violation(mocker, db_session_mock):
     class UniqueViolationMock(mocker.Mock, sqlalchemy.exc.IntegrityError):
@@ -143,6 +159,8 @@ def client(mocker):
         'RHUB_DB_PASSWORD': 'test',
         'RHUB_DB_DATABASE': 'test',
     })
+    # Don't store Tower job output in RHUB_DATA_DIR.
+    mocker.patch('rhub.api._config.TOWER_JOB_OUTPUT_CACHE_SIZE', 0)
 
     app = create_app()
     with app.test_client() as client:
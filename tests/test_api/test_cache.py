@@ -0,0 +1,82 @@
+import pytest
+
+from rhub.api import cache
+
+
+@pytest.fixture
+def monotonic_mock(mocker):
+    m = mocker.patch('time.monotonic')
+    m.return_value = 1000.0
+    yield m
+
+
+def test_get_set(monotonic_mock):
+    c = cache.TTLCache(maxsize=10, ttl=60)
+
+    assert c.get('foo') is None
+    c.set('foo', 'bar')
+    assert c.get('foo') == 'bar'
+
+    assert c.stats() == {
+        'size': 1,
+        'maxsize': 10,
+        'ttl': 60,
+        'hits': 1,
+        'misses': 1,
+    }
+
+
+def test_expiration(monotonic_mock):
+    c = cache.TTLCache(maxsize=10, ttl=60)
+    c.set('foo', 'bar')
+    c.set('baz', 'qux', ttl=120)
+
+    monotonic_mock.return_value += 61
+
+    assert c.get('foo') is None
+    assert c.get('baz') == 'qux'
+    assert len(c) == 1
+
+
+def test_lru_eviction(monotonic_mock):
+    c = cache.TTLCache(maxsize=2, ttl=60)
+    c.set('a', 1)
+    c.set('b', 2)
+    c.get('a')
+    c.set('c', 3)
+
+    assert c.get('a') == 1
+    assert c.get('b') is None
+    assert c.get('c') == 3
+
+
+def test_delete_if(monotonic_mock):
+    c = cache.TTLCache(maxsize=10, ttl=60)
+    c.set('a', 1)
+    c.set('b', 2)
+    c.set('c', 1)
+
+    assert c.delete_if(lambda k, v: v == 1) == 2
+    assert len(c) == 1
+    assert c.get('b') == 2
+
+
+@pytest.mark.parametrize('maxsize, ttl', [(0, 60), (10, 0)])
+def test_disabled(monotonic_mock, maxsize, ttl):
+    c = cache.TTLCache(maxsize=maxsize, ttl=ttl)
+    c.set('foo', 'bar')
+
+    assert not c.enabled
+    assert c.get('foo') is None
+
+
+def test_configure(monotonic_mock):
+    c = cache.TTLCache(maxsize=10, ttl=60)
+    for i in range(10):
+        c.set(i, i)
+
+    c.configure(maxsize=5)
+
+    assert len(c) == 5
+    assert c.get(0) is None
+    assert c.get(9) == 9
@@ -26,7 +26,7 @@ def auth_group(mocker):
 
 
 def test_list_servers(client, auth_group):
-    model.DnsServer.query.limit.return_value.offset.return_value = [
+    model.DnsServer.query.order_by.return_value.limit.return_value.offset.return_value = [
         model.DnsServer(
             id=1,
             name='test',
@@ -61,6 +61,7 @@ def test_list_servers(client, auth_group):
             }
         ],
         'total': 1,
+        '_href': {},
     }
 
 
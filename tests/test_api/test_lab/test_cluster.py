@@ -3,12 +3,16 @@ import datetime
 from unittest.mock import ANY
 
 import pytest
+import sqlalchemy
+from celery.exceptions import Retry
 from dateutil.tz import tzutc
+from sqlalchemy.dialects import postgresql
 
 from rhub.auth import model as auth_model
 from rhub.lab import SHAREDCLUSTER_GROUP, model
 from rhub.openstack import model as openstack_model
 from rhub.tower import model as tower_model
+from rhub.tower import tasks as tower_tasks
 from rhub.tower.client import TowerError
 
 
@@ -23,6 +27,15 @@ def date_now_mock(mocker):
     yield date_now_mock
 
 
+@pytest.fixture(autouse=True)
+def hosts_usage_query(mocker):
+    """Mock of the aggregate query of :meth:`model.Cluster.load_quota_usage`."""
+    query = mocker.patch.object(model.ClusterHost, 'query')
+    q = query.with_entities.return_value.filter.return_value.group_by.return_value
+    q.all.return_value = []
+    yield q.all
+
+
 def _db_add_row_side_effect(data_added):
     def side_effect(row):
         for k, v in data_added.items():
@@ -31,14 +44,15 @@ def _db_add_row_side_effect(data_added):
 
 
 @pytest.fixture
-def auth_user(mocker):
-    mocker.patch('rhub.api.lab.cluster._user_can_access_region').return_value = True
-    mocker.patch('rhub.api.lab.cluster._user_is_cluster_admin').return_value = True
-    mocker.patch('rhub.api.lab.cluster._user_can_access_cluster').return_value = True
-    mocker.patch('rhub.api.lab.cluster._user_can_create_reservation').return_value = True
-    mocker.patch('rhub.api.lab.cluster._user_can_set_lifespan').return_value = False
-    mocker.patch('rhub.api.lab.cluster._user_can_disable_expiration').return_value = False
-    mocker.patch('rhub.api.lab.cluster._user_can_create_sharedcluster').return_value = False
+def auth_user(mocker, request):
+    if 'principal_query' not in request.fixturenames:
+        mocker.patch('rhub.api.lab.cluster._user_can_access_region').return_value = True
+        mocker.patch('rhub.api.lab.cluster._user_is_cluster_admin').return_value = True
+        mocker.patch('rhub.api.lab.cluster._user_can_access_cluster').return_value = True
+        mocker.patch('rhub.api.lab.cluster._user_can_create_reservation').return_value = True
+        mocker.patch('rhub.api.lab.cluster._user_can_set_lifespan').return_value = False
+        mocker.patch('rhub.api.lab.cluster._user_can_disable_expiration').return_value = False
+        mocker.patch('rhub.api.lab.cluster._user_can_create_sharedcluster').return_value = False
 
     return auth_model.User(
         id=1,
@@ -56,14 +70,15 @@ def auth_group():
 
 
 @pytest.fixture
-def auth_shared_user(mocker):
-    mocker.patch('rhub.api.lab.cluster._user_can_access_region').return_value = True
-    mocker.patch('rhub.api.lab.cluster._user_is_cluster_admin').return_value = True
-    mocker.patch('rhub.api.lab.cluster._user_can_access_cluster').return_value = True
-    mocker.patch('rhub.api.lab.cluster._user_can_create_reservation').return_value = True
-    mocker.patch('rhub.api.lab.cluster._user_can_set_lifespan').return_value = True
-    mocker.patch('rhub.api.lab.cluster._user_can_disable_expiration').return_value = True
-    mocker.patch('rhub.api.lab.cluster._user_can_create_sharedcluster').return_value = True
+def auth_shared_user(mocker, request):
+    if 'principal_query' not in request.fixturenames:
+        mocker.patch('rhub.api.lab.cluster._user_can_access_region').return_value = True
+        mocker.patch('rhub.api.lab.cluster._user_is_cluster_admin').return_value = True
+        mocker.patch('rhub.api.lab.cluster._user_can_access_cluster').return_value = True
+        mocker.patch('rhub.api.lab.cluster._user_can_create_reservation').return_value = True
+        mocker.patch('rhub.api.lab.cluster._user_can_set_lifespan').return_value = True
+        mocker.patch('rhub.api.lab.cluster._user_can_disable_expiration').return_value = True
+        mocker.patch('rhub.api.lab.cluster._user_can_create_sharedcluster').return_value = True
 
     yield auth_model.User(
         id=100,
@@ -293,7 +308,7 @@ def _cluster_href(mocker):
 
 def test_list_clusters(client, mocker, region, project, product):
     q = model.Cluster.query.outerjoin.return_value.filter.return_value
-    q.limit.return_value.offset.return_value = [
+    q.options.return_value.order_by.return_value.limit.return_value.offset.return_value = [
         model.Cluster(
             id=1,
             name='testcluster',
@@ -352,9 +367,227 @@ def test_list_clusters(client, mocker, region, project, product):
             },
         ],
         'total': 1,
+        '_href': {},
     }
 
 
+def test_list_clusters_quota_usage(client, mocker, hosts_usage_query,
+                                   region, project, product):
+    clusters = [
+        model.Cluster(
+            id=cluster_id,
+            name=f'testcluster{cluster_id}',
+            region_id=region.id,
+            region=region,
+            project_id=project.id,
+            project=project,
+            status=model.ClusterStatus.ACTIVE,
+            product_id=product.id,
+            product_params={},
+            product=product,
+        )
+        for cluster_id in [1, 2]
+    ]
+    q = model.Cluster.query.outerjoin.return_value.filter.return_value
+    q.options.return_value.order_by.return_value.limit.return_value.offset.return_value = clusters
+    q.count.return_value = 2
+
+    hosts_mock = mocker.patch.object(model.Cluster, 'hosts', new_callable=mocker.PropertyMock)
+    mocker.patch.object(model.Cluster, 'quota', model.Quota(
+        num_vcpus=20, ram_mb=20000, num_volumes=2, volumes_gb=200,
+    ))
+    # Cluster 2 has no hosts and no row in the result.
+    hosts_usage_query.return_value = [(1, 4, 8192, 2, 40)]
+
+    rv = client.get(
+        f'{API_BASE}/lab/cluster',
+        query_string={'fields': 'name,quota_usage'},
+        headers=AUTH_HEADER,
+    )
+
+    assert rv.status_code == 200, rv.data
+    assert [c['quota_usage'] for c in rv.json['data']] == [
+        {'num_vcpus': 4, 'ram_mb': 8192, 'num_volumes': 2, 'volumes_gb': 40},
+        {'num_vcpus': 0, 'ram_mb': 0, 'num_volumes': 0, 'volumes_gb': 0},
+    ]
+
+    # Usage of all clusters in the page is computed in one query, hosts are
+    # not loaded.
+    hosts_usage_query.assert_called_once()
+    hosts_mock.assert_not_called()
+
+
+def test_list_clusters_eager_loading(client):
+    from rhub.api.lab import cluster as cluster_api
+
+    query = sqlalchemy.orm.Query(model.Cluster).outerjoin(
+        openstack_model.Project,
+        openstack_model.Project.id == model.Cluster.project_id,
+    ).options(
+        *cluster_api._cluster_list_options(model.Cluster.field_selection())
+    ).limit(100)
+    sql = str(query.statement.compile(dialect=postgresql.dialect()))
+
+    # Everything used by Cluster.to_dict() is loaded in one query, except
+    # hosts that are loaded in the second query for all clusters in the page.
+    for table in ['lab_region', 'lab_quota', 'auth_user', 'auth_group', 'lab_product']:
+        assert f'JOIN {table} ' in sql
+    assert 'lab_cluster_host' not in sql
+
+
+def test_list_clusters_eager_loading_fields(client):
+    from rhub.api.lab import cluster as cluster_api
+
+    selection = model.Cluster.field_selection(fields=['name', 'status', 'region_name'])
+    options = cluster_api._cluster_list_options(selection)
+    query = sqlalchemy.orm.Query(model.Cluster).outerjoin(
+        openstack_model.Project,
+        openstack_model.Project.id == model.Cluster.project_id,
+    ).options(*options).limit(100)
+    sql = str(query.statement.compile(dialect=postgresql.dialect()))
+
+    assert 'JOIN lab_region ' in sql
+    for table in ['lab_quota', 'auth_user', 'auth_group', 'lab_product']:
+        assert f'JOIN {table} ' not in sql
+    # Only project (joined by the list query) and region, hosts are not loaded.
+    assert len(options) == 2
+
+
+def test_list_clusters_eager_loading_region_for_href(client):
+    from rhub.api.lab import cluster as cluster_api
+
+    selection = model.Cluster.field_selection(fields=['name'])
+    options = cluster_api._cluster_list_options(selection)
+    query = sqlalchemy.orm.Query(model.Cluster).outerjoin(
+        openstack_model.Project,
+        openstack_model.Project.id == model.Cluster.project_id,
+    ).options(*options).limit(100)
+    sql = str(query.statement.compile(dialect=postgresql.dialect()))
+
+    # Region is used by _cluster_href() even if not selected.
+    assert 'JOIN lab_region ' in sql
+    assert 'JOIN lab_quota ' not in sql
+
+
+def test_list_clusters_eager_loading_quota_usage(client):
+    from rhub.api.lab import cluster as cluster_api
+
+    selection = model.Cluster.field_selection(fields=['name', 'quota_usage'])
+    options = cluster_api._cluster_list_options(selection)
+    query = sqlalchemy.orm.Query(model.Cluster).outerjoin(
+        openstack_model.Project,
+        openstack_model.Project.id == model.Cluster.project_id,
+    ).options(*options).limit(100)
+    sql = str(query.statement.compile(dialect=postgresql.dialect()))
+
+    # Cluster.quota_usage checks the user quota of the region.
+    assert 'JOIN lab_region ' in sql
+    assert 'JOIN lab_quota ' in sql
+    assert 'lab_cluster_host' not in sql
+
+
+@pytest.fixture
+def principal_query(db_session_mock):
+    """
+    Mock of the query loading the user with groups for `auth_utils.Principal`.
+    If used, `auth_user` and `auth_shared_user` fixtures don't mock permission
+    checks.
+    """
+    user = auth_model.User(id=1, name='testuser', email='testuser@example.com')
+    group = auth_model.Group(id=1, name='testgroup', roles=[])
+
+    q = db_session_mock.query.return_value.outerjoin.return_value.outerjoin.return_value
+    q.filter.return_value.all.return_value = [(user, group)]
+
+    yield db_session_mock.query
+
+
+@pytest.fixture
+def other_user_project(auth_group, openstack_cloud):
+    other_user = auth_model.User(id=2, name='otheruser', email='otheruser@example.com')
+    yield openstack_model.Project(
+        id=2,
+        cloud_id=openstack_cloud.id,
+        cloud=openstack_cloud,
+        name='other_project',
+        description='',
+        owner_id=other_user.id,
+        owner=other_user,
+        group_id=auth_group.id,
+        group=auth_group,
+    )
+
+
+def test_list_clusters_user_queries(client, mocker, principal_query,
+                                    region, other_user_project, product):
+    q = (
+        model.Cluster.query.filter.return_value
+        .outerjoin.return_value.filter.return_value
+    )
+    q.options.return_value.order_by.return_value.limit.return_value.offset.return_value = [
+        model.Cluster(
+            id=1,
+            name='testcluster',
+            description='test cluster',
+            created=datetime.datetime(2021, 1, 1, 1, 0, 0, tzinfo=tzutc()),
+            region_id=region.id,
+            region=region,
+            project_id=other_user_project.id,
+            project=other_user_project,
+            reservation_expiration=None,
+            lifespan_expiration=None,
+            status=model.ClusterStatus.ACTIVE,
+            product_id=product.id,
+            product_params={},
+            product=product,
+        ),
+    ]
+    q.count.return_value = 1
+
+    mocker.patch.object(model.Cluster, 'hosts', [])
+    mocker.patch.object(model.Cluster, 'quota', None)
+
+    rv = client.get(
+        f'{API_BASE}/lab/cluster',
+        headers=AUTH_HEADER,
+    )
+
+    assert rv.status_code == 200, rv.data
+    assert rv.json['total'] == 1
+
+    principal_query.assert_called_once_with(auth_model.User, auth_model.Group)
+
+
+def test_get_cluster_user_queries(client, principal_query,
+                                  region, other_user_project, product):
+    model.Cluster.query.get.return_value = model.Cluster(
+        id=1,
+        name='testcluster',
+        description='test cluster',
+        created=datetime.datetime(2021, 1, 1, 1, 0, 0, tzinfo=tzutc()),
+        region_id=region.id,
+        region=region,
+        project_id=other_user_project.id,
+        project=other_user_project,
+        reservation_expiration=None,
+        lifespan_expiration=None,
+        status=model.ClusterStatus.ACTIVE,
+        product_id=product.id,
+        product_params={},
+        product=product,
+    )
+
+    rv = client.get(
+        f'{API_BASE}/lab/cluster/1',
+        headers=AUTH_HEADER,
+    )
+
+    assert rv.status_code == 200, rv.data
+
+    # Cluster admin check and group membership check share one query.
+    principal_query.assert_called_once_with(auth_model.User, auth_model.Group)
+
+
 def test_list_clusters_unauthorized(client):
     rv = client.get(
         f'{API_BASE}/lab/cluster',
@@ -371,8 +604,8 @@ def test_list_clusters_unauthorized(client):
 @pytest.mark.parametrize(
     'is_admin', [pytest.param(False, id='user'), pytest.param(True, id='admin')],
 )
-def test_get_cluster(client, mocker, region_with_quotas, project, shared_project,
-                     product, is_shared, is_admin):
+def test_get_cluster(client, mocker, hosts_usage_query, region_with_quotas, project,
+                     shared_project, product, is_shared, is_admin):
     if is_shared:
         project = shared_project
 
@@ -438,6 +671,8 @@ def test_get_cluster(client, mocker, region_with_quotas, project, shared_project
         volumes_gb=200,
     ))
 
+    hosts_usage_query.return_value = [(1, 4, 8192, 2, 40)]
+
     rv = client.get(
         f'{API_BASE}/lab/cluster/1',
         headers=AUTH_HEADER,
@@ -446,6 +681,7 @@ def test_get_cluster(client, mocker, region_with_quotas, project, shared_project
     assert rv.status_code == 200
 
     model.Cluster.query.get.assert_called_with(1)
+    hosts_usage_query.assert_called_once()
 
     assert rv.json == {
         'id': 1,
@@ -516,6 +752,50 @@ def test_get_cluster(client, mocker, region_with_quotas, project, shared_project
     }
 
 
+@pytest.mark.parametrize(
+    'query_string, expected_keys',
+    [
+        ('fields=name,status', {'id', 'name', 'status'}),
+        ('fields=name&expand=quota', {'id', 'name', 'quota'}),
+        ('fields=name,hosts', {'id', 'name', 'hosts'}),
+    ],
+)
+def test_get_cluster_fields(client, mocker, region, project, product,
+                            query_string, expected_keys):
+    model.Cluster.query.get.return_value = model.Cluster(
+        id=1,
+        name='testcluster',
+        description='test cluster',
+        region_id=region.id,
+        region=region,
+        project_id=project.id,
+        project=project,
+        status=model.ClusterStatus.ACTIVE,
+        product_id=product.id,
+        product_params={},
+        product=product,
+    )
+    mocker.patch.object(model.Cluster, 'hosts', [])
+    mocker.patch.object(model.Cluster, 'quota', None)
+
+    rv = client.get(
+        f'{API_BASE}/lab/cluster/1?{query_string}',
+        headers=AUTH_HEADER,
+    )
+
+    assert rv.status_code == 200, rv.data
+    assert set(rv.json) == expected_keys | {'_href'}
+
+
+def test_get_cluster_expand_invalid(client):
+    rv = client.get(
+        f'{API_BASE}/lab/cluster/1?expand=events',
+        headers=AUTH_HEADER,
+    )
+
+    assert rv.status_code == 400, rv.data
+
+
 def test_get_cluster_forbidden(client, mocker, region, project, product):
     cluster_id = 1
 
@@ -714,6 +994,88 @@ def test_create_cluster_shared(client, db_session_mock, mocker,
     assert rv.json['lifespan_expiration'] is None
 
 
+def test_create_cluster_async(client, db_session_mock, mocker,
+                              region, project, product, tower_client):
+    client.application.config['LAB_TOWER_LAUNCH_ASYNC'] = True
+    delay_mock = mocker.patch('rhub.lab.tasks.launch_cluster_create.delay')
+
+    model.Cluster.query.filter.return_value.count.return_value = 0
+
+    def db_add(row):
+        row.id = 1
+        if isinstance(row, model.Cluster):
+            mocker.patch.object(model.Cluster, 'region', region)
+            mocker.patch.object(model.Cluster, 'product', product)
+            mocker.patch.object(model.Cluster, 'project', project)
+
+    db_session_mock.add.side_effect = db_add
+
+    rv = client.post(
+        f'{API_BASE}/lab/cluster',
+        headers=AUTH_HEADER,
+        json={
+            'name': 'testcluster',
+            'description': 'test cluster',
+            'region_id': 1,
+            'reservation_expiration': '2100-01-01T00:00:00+00:00',
+            'product_id': 1,
+            'product_params': {},
+        },
+    )
+
+    assert rv.status_code == 202, rv.data
+
+    tower_client.template_launch.assert_not_called()
+    db_session_mock.commit.assert_called()
+    delay_mock.assert_called_once_with(1, 1)
+
+    assert rv.json['id'] == 1
+    assert rv.json['status'] == model.ClusterStatus.QUEUED.value
+
+
+def test_create_cluster_async_queue_failed(client, db_session_mock, mocker,
+                                           region, project, product, tower_client):
+    mocker.patch.dict(client.application.config, {'LAB_TOWER_LAUNCH_ASYNC': True})
+    delay_mock = mocker.patch('rhub.lab.tasks.launch_cluster_create.delay')
+    delay_mock.side_effect = ConnectionError('broker is down')
+
+    model.Cluster.query.filter.return_value.count.return_value = 0
+
+    def db_add(row):
+        row.id = 1
+        if isinstance(row, model.Cluster):
+            mocker.patch.object(model.Cluster, 'region', region)
+            mocker.patch.object(model.Cluster, 'product', product)
+            mocker.patch.object(model.Cluster, 'project', project)
+
+    db_session_mock.add.side_effect = db_add
+
+    rv = client.post(
+        f'{API_BASE}/lab/cluster',
+        headers=AUTH_HEADER,
+        json={
+            'name': 'testcluster',
+            'description': 'test cluster',
+            'region_id': 1,
+            'reservation_expiration': '2100-01-01T00:00:00+00:00',
+            'product_id': 1,
+            'product_params': {},
+        },
+    )
+
+    assert rv.status_code == 500, rv.data
+    assert rv.json['detail'] == 'Failed to trigger cluster creation.'
+
+    cluster = db_session_mock.add.call_args_list[0].args[0]
+    assert cluster.status == model.ClusterStatus.CREATE_FAILED
+
+    cluster_event = db_session_mock.add.call_args_list[-1].args[0]
+    assert isinstance(cluster_event, model.ClusterStatusChangeEvent)
+    assert cluster_event.old_value == model.ClusterStatus.QUEUED
+    assert cluster_event.new_value == model.ClusterStatus.CREATE_FAILED
+    assert db_session_mock.commit.call_count == 2
+
+
 def test_create_cluster_in_disabled_region(client, db_session_mock, mocker,
                                            region, project):
     region.enabled = False
@@ -747,7 +1109,7 @@ def test_create_cluster_in_disabled_region(client, db_session_mock, mocker,
         pytest.param('all'),
     ]
 )
-def test_create_cluster_invalid_name(client, cluster_name, mocker, region, project):
+def test_create_cluster_invalid_name(client, cluster_name, mocker, region, project, product):
     model.Cluster.query.filter.return_value.count.return_value = 0
 
     rv = client.post(
@@ -1620,6 +1982,73 @@ def test_delete_cluster(client, db_session_mock, mocker,
         db_session_mock.commit.assert_called()
 
 
+def test_delete_cluster_async(client, db_session_mock, mocker,
+                              region, project, product, tower_client):
+    client.application.config['LAB_TOWER_LAUNCH_ASYNC'] = True
+    delay_mock = mocker.patch('rhub.lab.tasks.launch_cluster_delete.delay')
+
+    cluster = model.Cluster(
+        id=1,
+        name='testcluster',
+        region_id=region.id,
+        region=region,
+        project_id=project.id,
+        project=project,
+        status=model.ClusterStatus.ACTIVE,
+        product_id=product.id,
+        product_params={},
+        product=product,
+    )
+    model.Cluster.query.get.return_value = cluster
+
+    rv = client.delete(
+        f'{API_BASE}/lab/cluster/1',
+        headers=AUTH_HEADER,
+    )
+
+    assert rv.status_code == 202, rv.data
+
+    tower_client.template_launch.assert_not_called()
+    db_session_mock.commit.assert_called()
+    delay_mock.assert_called_once_with(1, 1)
+
+    assert cluster.status == model.ClusterStatus.DELETION_QUEUED
+
+
+def test_delete_cluster_async_queue_failed(client, db_session_mock, mocker,
+                                           region, project, product, tower_client):
+    mocker.patch.dict(client.application.config, {'LAB_TOWER_LAUNCH_ASYNC': True})
+    delay_mock = mocker.patch('rhub.lab.tasks.launch_cluster_delete.delay')
+    delay_mock.side_effect = ConnectionError('broker is down')
+
+    cluster = model.Cluster(
+        id=1,
+        name='testcluster',
+        region_id=region.id,
+        region=region,
+        project_id=project.id,
+        project=project,
+        status=model.ClusterStatus.ACTIVE,
+        product_id=product.id,
+        product_params={},
+        product=product,
+    )
+    model.Cluster.query.get.return_value = cluster
+
+    rv = client.delete(
+        f'{API_BASE}/lab/cluster/1',
+        headers=AUTH_HEADER,
+    )
+
+    assert rv.status_code == 500, rv.data
+
+    assert cluster.status == model.ClusterStatus.DELETE_FAILED
+    cluster_event = db_session_mock.add.call_args.args[0]
+    assert cluster_event.old_value == model.ClusterStatus.DELETION_QUEUED
+    assert cluster_event.new_value == model.ClusterStatus.DELETE_FAILED
+    assert db_session_mock.commit.call_count == 2
+
+
 def test_delete_cluster_forbidden(client, db_session_mock, mocker):
     cluster_id = 1
 
@@ -1830,7 +2259,8 @@ def test_get_cluster_event_stdout(client, mocker):
         tower_job_id=1,
         status=model.ClusterStatus.POST_PROVISIONING,
     )
-    mocker.patch.object(event, 'get_tower_job_output').return_value = 'Ansible output.'
+    stdout_mock = mocker.patch.object(event, 'get_tower_job_output_stream')
+    stdout_mock.return_value = iter([b'Ansible ', b'output.'])
 
     model.ClusterTowerJobEvent.query.get.return_value = event
 
@@ -1839,7 +2269,35 @@ def test_get_cluster_event_stdout(client, mocker):
         headers=AUTH_HEADER,
     )
 
+    assert rv.status_code == 200
     assert rv.data == b'Ansible output.'
+    stdout_mock.assert_called_once_with(None, None)
+
+
+def test_get_cluster_event_stdout_lines(client, mocker):
+    event = model.ClusterTowerJobEvent(
+        id=1,
+        date=datetime.datetime(2021, 1, 1, 1, 0, 0, tzinfo=tzutc()),
+        user_id='00000000-0000-0000-0000-000000000000',
+        cluster_id=1,
+        tower_id=1,
+        tower=tower_model.Server(id=1),
+        tower_job_id=1,
+        status=model.ClusterStatus.POST_PROVISIONING,
+    )
+    stdout_mock = mocker.patch.object(event, 'get_tower_job_output_stream')
+    stdout_mock.return_value = iter([b'line 10\n'])
+
+    model.ClusterTowerJobEvent.query.get.return_value = event
+
+    rv = client.get(
+        f'{API_BASE}/lab/cluster_event/1/stdout?start_line=10&end_line=11',
+        headers=AUTH_HEADER,
+    )
+
+    assert rv.status_code == 200
+    assert rv.data == b'line 10\n'
+    stdout_mock.assert_called_once_with(10, 11)
 
 
 def test_get_cluster_event_stdout_forbidden(client, mocker, region, project, product):
@@ -1926,7 +2384,7 @@ def test_get_cluster_event_stdout_towererror(client, mocker):
         tower_job_id=1,
         status=model.ClusterStatus.ACTIVE,
     )
-    mocker.patch.object(event, 'get_tower_job_output').side_effect = TowerError
+    mocker.patch.object(event, 'get_tower_job_output_stream').side_effect = TowerError
 
     model.ClusterTowerJobEvent.query.get.return_value = event
 
@@ -2272,10 +2730,12 @@ def test_delete_cluster_hosts_unauthorized(client, db_session_mock):
 
 
 def test_tower_webhook_cluster(
-    client, mocker, messaging_mock, auth_user, region, project, product, tower_client,
+    client, mocker, db_session_mock, messaging_mock, auth_user, region, project, product, tower_client,
     di_mock
 ):
-    mocker.patch('rhub.api.tower.di', new=di_mock)
+    mocker.patch('rhub.tower.tasks.di', new=di_mock)
+    delay_mock = mocker.patch('rhub.tower.tasks.process_webhook_notification.delay')
+    db_session_mock.add.side_effect = _db_add_row_side_effect({'id': 1})
 
     cluster = model.Cluster(
         id=1,
@@ -2352,6 +2812,25 @@ def test_tower_webhook_cluster(
 
     assert rv.status_code == 204, rv.data
 
+    # Webhook only stores the notification, it is processed by the task.
+    messaging_mock.send.assert_not_called()
+    delay_mock.assert_called_once_with(1)
+
+    notification = db_session_mock.add.call_args.args[0]
+    assert isinstance(notification, tower_model.WebhookNotification)
+    assert notification.tower_job_id == tower_job_id
+    assert notification.job_status == 'successful'
+    assert notification.payload == payload
+
+    mocker.patch.object(tower_model.WebhookNotification, 'query').get.return_value = (
+        notification
+    )
+    db_session_mock.execute.return_value.rowcount = 1
+    with client.application.app_context():
+        tower_tasks.process_webhook_notification.run(1)
+
+    assert notification.processed_at is not None
+    assert cluster.status == model.ClusterStatus.DELETED
     messaging_mock.send.assert_called()
 
     m_topic, m_msg = messaging_mock.send.call_args.args
@@ -2361,3 +2840,289 @@ def test_tower_webhook_cluster(
     assert m_extra['cluster_id'] == cluster.id
     assert m_extra['job_id'] == tower_job_id
     assert m_extra['job_status'] == 'successful'
+
+
+@pytest.mark.parametrize('job_failed', [False, True])
+def test_tower_webhook_cluster_running(
+    client, mocker, db_session_mock, messaging_mock, region, project, product,
+    tower_client, di_mock, job_failed,
+):
+    mocker.patch('rhub.tower.tasks.di', new=di_mock)
+
+    cluster = model.Cluster(
+        id=1,
+        name='testcluster',
+        region_id=region.id,
+        region=region,
+        project_id=project.id,
+        project=project,
+        status=model.ClusterStatus.PROVISIONING,
+        product_id=product.id,
+        product_params={},
+        product=product,
+    )
+    model.Cluster.query.get.return_value = cluster
+
+    notification = tower_model.WebhookNotification(
+        id=1,
+        tower_job_id=321,
+        job_status='running',
+        payload={
+            'id': 321,
+            'name': product.tower_template_name_create,
+            'status': 'running',
+            'extra_vars': '{"rhub_cluster_id": 1}',
+        },
+    )
+    mocker.patch.object(tower_model.WebhookNotification, 'query').get.return_value = (
+        notification
+    )
+    apply_async_mock = mocker.patch(
+        'rhub.tower.tasks.process_webhook_notification.apply_async',
+    )
+    tower_client.template_job_get.return_value = {'id': 321, 'failed': job_failed}
+    db_session_mock.execute.return_value.rowcount = 1
+
+    mocker.patch.dict(client.application.config, {'TOWER_WEBHOOK_RECHECK_DELAY': 5})
+
+    with client.application.app_context():
+        tower_tasks.process_webhook_notification.run(1)
+
+        # Job is checked later instead of blocking the worker.
+        apply_async_mock.assert_called_once_with((1,), {'recheck': True}, countdown=5)
+        tower_client.template_job_get.assert_not_called()
+        assert notification.processed_at is None
+
+        tower_tasks.process_webhook_notification.run(1, recheck=True)
+
+    tower_client.template_job_get.assert_called_once_with(321)
+    assert notification.processed_at is not None
+
+    if job_failed:
+        assert cluster.status == model.ClusterStatus.CREATE_FAILED
+        messaging_mock.send.assert_called()
+    else:
+        assert cluster.status == model.ClusterStatus.PROVISIONING
+        messaging_mock.send.assert_not_called()
+
+
+def test_tower_webhook_cluster_retry(
+    client, mocker, db_session_mock, messaging_mock, region, project, product, di_mock,
+):
+    mocker.patch('rhub.tower.tasks.di', new=di_mock)
+    mocker.patch.dict(client.application.config, {
+        'TOWER_WEBHOOK_MAX_RETRIES': 3,
+        'TOWER_WEBHOOK_RETRY_DELAY': 10,
+    })
+    retry_mock = mocker.patch.object(tower_tasks.process_webhook_notification, 'retry')
+    retry_mock.return_value = Retry()
+
+    cluster = model.Cluster(
+        id=1,
+        name='testcluster',
+        region_id=region.id,
+        region=region,
+        project_id=project.id,
+        project=project,
+        status=model.ClusterStatus.PROVISIONING,
+        product_id=product.id,
+        product_params={},
+        product=product,
+    )
+    model.Cluster.query.get.return_value = cluster
+
+    notification = tower_model.WebhookNotification(
+        id=1,
+        tower_job_id=321,
+        job_status='successful',
+        payload={
+            'id': 321,
+            'name': product.tower_template_name_create,
+            'status': 'successful',
+            'extra_vars': '{"rhub_cluster_id": 1}',
+        },
+    )
+    mocker.patch.object(tower_model.WebhookNotification, 'query').get.return_value = (
+        notification
+    )
+    db_session_mock.execute.return_value.rowcount = 1
+
+    def rollback():
+        # Rollback expires the changes of the failed attempt.
+        cluster.status = model.ClusterStatus.PROVISIONING
+        notification.processed_at = None
+
+    db_session_mock.rollback.side_effect = rollback
+    db_session_mock.commit.side_effect = [
+        sqlalchemy.exc.OperationalError('COMMIT', {}, Exception()),
+        None,
+    ]
+
+    with client.application.app_context():
+        with pytest.raises(Retry):
+            tower_tasks.process_webhook_notification.run(1)
+
+        assert cluster.status == model.ClusterStatus.PROVISIONING
+        assert notification.processed_at is None
+        messaging_mock.send.assert_not_called()
+
+        tower_tasks.process_webhook_notification.run(1)
+
+    # The retry applies the notification again, the same as the first attempt.
+    assert cluster.status == model.ClusterStatus.ACTIVE
+    assert notification.processed_at is not None
+    events = [
+        call.args[0] for call in db_session_mock.add.call_args_list
+        if isinstance(call.args[0], model.ClusterStatusChangeEvent)
+    ]
+    assert len(events) == 2
+    assert events[0].new_value == events[1].new_value == model.ClusterStatus.ACTIVE
+    messaging_mock.send.assert_called_once_with('lab.cluster.create', ANY, extra=ANY)
+
+
+@pytest.mark.parametrize('job_status', ['successful', 'running'])
+def test_tower_webhook_cluster_duplicate(
+    client, mocker, db_session_mock, messaging_mock, region, project, product,
+    di_mock, job_status,
+):
+    mocker.patch('rhub.tower.tasks.di', new=di_mock)
+    claim_mock = mocker.patch.object(tower_model.ProcessedNotification, 'claim')
+    claim_mock.return_value = False
+
+    cluster = model.Cluster(
+        id=1,
+        name='testcluster',
+        region_id=region.id,
+        region=region,
+        project_id=project.id,
+        project=project,
+        status=model.ClusterStatus.PROVISIONING,
+        product_id=product.id,
+        product_params={},
+        product=product,
+    )
+    model.Cluster.query.get.return_value = cluster
+
+    notification = tower_model.WebhookNotification(
+        id=1,
+        tower_job_id=321,
+        job_status=job_status,
+        payload={
+            'id': 321,
+            'name': product.tower_template_name_create,
+            'status': job_status,
+            'extra_vars': '{"rhub_cluster_id": 1}',
+        },
+    )
+    mocker.patch.object(tower_model.WebhookNotification, 'query').get.return_value = (
+        notification
+    )
+    apply_async_mock = mocker.patch(
+        'rhub.tower.tasks.process_webhook_notification.apply_async',
+    )
+
+    with client.application.app_context():
+        tower_tasks.process_webhook_notification.run(1)
+
+    claim_mock.assert_called_once_with(region.tower_id, 321, job_status)
+    apply_async_mock.assert_not_called()
+    db_session_mock.add.assert_not_called()
+    messaging_mock.send.assert_not_called()
+    assert cluster.status == model.ClusterStatus.PROVISIONING
+    assert notification.processed_at is not None
+
+
+@pytest.fixture
+def authorized_keys_query(mocker):
+    yield mocker.patch.object(auth_model.AuthorizedKeys, 'query')
+
+
+@pytest.mark.parametrize('is_shared', [False, True])
+def test_cluster_authorized_keys(client, mocker, authorized_keys_query, project,
+                                 shared_project, is_shared):
+    user_query = mocker.patch.object(auth_model.User, 'query')
+    if is_shared:
+        project = shared_project
+    project.owner.ssh_keys = ['ssh-ed25519 OWNER']
+
+    model.Cluster.query.get.return_value = model.Cluster(
+        id=1,
+        name='testcluster',
+        project_id=project.id,
+        project=project,
+    )
+    authorized_keys_query.get.return_value = auth_model.AuthorizedKeys(
+        keys=['ssh-ed25519 BBBB', 'ssh-ed25519 OWNER'],
+    )
+
+    rv = client.get(f'{API_BASE}/lab/cluster/1/authorized_keys')
+
+    assert rv.status_code == 200, rv.data
+    assert rv.data.decode() == 'ssh-ed25519 BBBB\nssh-ed25519 OWNER\n'
+    assert rv.headers['ETag']
+
+    authorized_keys_query.get.assert_called_once_with(
+        'all' if is_shared else f'group:{project.group_id}'
+    )
+    user_query.filter.assert_not_called()
+
+
+def test_cluster_authorized_keys_not_modified(client, authorized_keys_query, project):
+    project.owner.ssh_keys = ['ssh-ed25519 OWNER']
+
+    model.Cluster.query.get.return_value = model.Cluster(
+        id=1,
+        name='testcluster',
+        project_id=project.id,
+        project=project,
+    )
+    authorized_keys_query.get.return_value = auth_model.AuthorizedKeys(
+        keys=['ssh-ed25519 BBBB'],
+    )
+
+    rv = client.get(f'{API_BASE}/lab/cluster/1/authorized_keys')
+    etag = rv.headers['ETag']
+
+    rv = client.get(
+        f'{API_BASE}/lab/cluster/1/authorized_keys',
+        headers={'If-None-Match': etag},
+    )
+
+    assert rv.status_code == 304
+    assert rv.data == b''
+
+    authorized_keys_query.get.return_value.keys = ['ssh-ed25519 CCCC']
+
+    rv = client.get(
+        f'{API_BASE}/lab/cluster/1/authorized_keys',
+        headers={'If-None-Match': etag},
+    )
+
+    assert rv.status_code == 200
+    assert rv.headers['ETag'] != etag
+
+
+def test_cluster_authorized_keys_not_materialized(client, db_session_mock, mocker,
+                                                  authorized_keys_query, project):
+    project.owner.ssh_keys = []
+
+    model.Cluster.query.get.return_value = model.Cluster(
+        id=1,
+        name='testcluster',
+        project_id=project.id,
+        project=project,
+    )
+    authorized_keys_query.get.return_value = None
+    db_session_mock.query.return_value.filter.return_value.scalar.return_value = 1
+    query_keys_mock = mocker.patch.object(auth_model.AuthorizedKeys, '_query_keys')
+    query_keys_mock.return_value = ['ssh-ed25519 BBBB']
+
+    rv = client.get(f'{API_BASE}/lab/cluster/1/authorized_keys')
+
+    assert rv.status_code == 200, rv.data
+    assert rv.data.decode() == 'ssh-ed25519 BBBB\n'
+
+    query_keys_mock.assert_called_once_with(f'group:{project.group_id}')
+    # Scope lock and upsert.
+    assert db_session_mock.execute.call_count == 2
+    db_session_mock.commit.assert_called()
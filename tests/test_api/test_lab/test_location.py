@@ -21,7 +21,7 @@ def _db_add_row_side_effect(data_added):
 
 
 def test_location_list(client):
-    model.Location.query.limit.return_value.offset.return_value = [
+    model.Location.query.order_by.return_value.limit.return_value.offset.return_value = [
         model.Location(
             id=1,
             name='RDU',
@@ -46,6 +46,7 @@ def test_location_list(client):
             }
         ],
         'total': 1,
+        '_href': {},
     }
 
 
@@ -7,6 +7,7 @@ from dateutil.tz import tzutc
 
 from rhub.api.vault import Vault
 from rhub.lab import model
+from rhub.lab.utils import tower_template_cache
 
 
 API_BASE = '/v0'
@@ -28,7 +29,7 @@ def _db_add_row_side_effect(data_added):
 
 
 def test_list_products(client):
-    model.Product.query.limit.return_value.offset.return_value = [
+    model.Product.query.order_by.return_value.limit.return_value.offset.return_value = [
         model.Product(
             id=1,
             name='dummy',
@@ -63,6 +64,7 @@ def test_list_products(client):
             },
         ],
         'total': 1,
+        '_href': {},
     }
 
 
@@ -579,3 +581,34 @@ def test_product_params_validation(param_spec, param_vals, expectation):
 
     with expectation:
         product.validate_cluster_params(param_vals)
+
+
+def test_update_product_tower_template_cache(client, db_session_mock):
+    product = model.Product(
+        id=1,
+        name='dummy',
+        description='dummy',
+        enabled=True,
+        tower_template_name_create='dummy-create',
+        tower_template_name_delete='dummy-delete',
+        parameters=[],
+    )
+    model.Product.query.get.return_value = product
+
+    tower_template_cache.set((1, 'dummy-create'), {'id': 1, 'name': 'dummy-create'})
+    tower_template_cache.set((1, 'dummy-delete'), {'id': 2, 'name': 'dummy-delete'})
+    tower_template_cache.set((1, 'other-create'), {'id': 3, 'name': 'other-create'})
+
+    rv = client.patch(
+        f'{API_BASE}/lab/product/1',
+        headers=AUTH_HEADER,
+        json={
+            'tower_template_name_create': 'new-create',
+        },
+    )
+
+    assert rv.status_code == 200
+
+    assert tower_template_cache.get((1, 'dummy-create')) is None
+    assert tower_template_cache.get((1, 'dummy-delete')) is None
+    assert tower_template_cache.get((1, 'other-create')) is not None
@@ -1,8 +1,10 @@
 import base64
+import collections
 from unittest.mock import ANY
 
 import pytest
 import sqlalchemy.exc
+from sqlalchemy.dialects import postgresql
 
 from rhub.api.vault import Vault
 from rhub.auth import model as auth_model
@@ -134,7 +136,8 @@ def test_to_dict(mocker, openstack, auth_user, auth_group, di_mock):
 
 
 def test_list_regions(client, openstack, auth_group):
-    model.Region.query.outerjoin.return_value.limit.return_value.offset.return_value = [
+    q = model.Region.query.outerjoin.return_value.options.return_value
+    q.order_by.return_value.limit.return_value.offset.return_value = [
         model.Region(
             id=1,
             name='test',
@@ -207,6 +210,7 @@ def test_list_regions(client, openstack, auth_group):
             },
         ],
         'total': 1,
+        '_href': {},
     }
 
 
@@ -224,7 +228,7 @@ def test_query_regions(client):
     # Simple test to detect issues with deepObject query parameters,
     # https://github.com/resource-hub-dev/rhub-api/pull/150
     q = model.Region.query.outerjoin.return_value.filter.return_value
-    q.limit.return_value.offset.return_value = []
+    q.options.return_value.order_by.return_value.limit.return_value.offset.return_value = []
     q.count.return_value = 0
 
     rv = client.get(
@@ -234,7 +238,7 @@ def test_query_regions(client):
     )
 
     assert rv.status_code == 200, rv.data
-    assert rv.json == {'data': [], 'total': 0}
+    assert rv.json == {'data': [], 'total': 0, '_href': {}}
 
 
 def test_get_region(client, openstack, auth_group):
@@ -309,6 +313,43 @@ def test_get_region(client, openstack, auth_group):
     }
 
 
+def test_get_region_fields(client, openstack, auth_group):
+    model.Region.query.get.return_value = model.Region(
+        id=1,
+        name='test',
+        location_id=1,
+        location=model.Location(
+            id=1,
+            name='RDU',
+            description='Raleigh',
+        ),
+        enabled=True,
+        owner_group_id=auth_group.id,
+        owner_group=auth_group,
+        tower_id=1,
+        openstack_id=openstack.id,
+        openstack=openstack,
+    )
+
+    rv = client.get(
+        f'{API_BASE}/lab/region/1?fields=name,enabled&expand=location',
+        headers=AUTH_HEADER,
+    )
+
+    assert rv.status_code == 200, rv.data
+    assert rv.json == {
+        'id': 1,
+        'name': 'test',
+        'enabled': True,
+        'location': {
+            'id': 1,
+            'name': 'RDU',
+            'description': 'Raleigh',
+        },
+        '_href': ANY,
+    }
+
+
 def test_get_region_unauthorized(client):
     rv = client.get(
         f'{API_BASE}/lab/region/1',
@@ -1260,3 +1301,89 @@ def test_region_delete_product_unauthorized(client, db_session_mock):
     assert rv.status_code == 401, rv.data
     assert rv.json['title'] == 'Unauthorized'
     assert rv.json['detail'] == 'No authorization token provided'
+
+
+def _usage_row(region_id, user_quota_id, total_quota_id, **values):
+    columns = ['region_id', 'user_quota_id', 'total_quota_id']
+    for prefix in ['user_quota', 'user_quota_usage', 'total_quota', 'total_quota_usage']:
+        columns += [f'{prefix}_{k}' for k in model.Quota.FIELDS]
+    Row = collections.namedtuple('Row', columns)
+    return Row(region_id, user_quota_id, total_quota_id,
+               **dict.fromkeys(columns[3:], None) | values)
+
+
+def test_get_all_usage(client, mocker):
+    usage_fields = {
+        f'{prefix}_{k}': 0
+        for prefix in ['user_quota_usage', 'total_quota_usage']
+        for k in model.Quota.FIELDS
+    }
+    query_mock = mocker.patch('rhub.api.lab.region._query_all_usage')
+    query_mock.return_value.all.return_value = [
+        _usage_row(1, 1, None, **usage_fields | {
+            'user_quota_num_vcpus': 10, 'user_quota_ram_mb': 1024,
+            'user_quota_usage_num_vcpus': 2, 'total_quota_usage_num_vcpus': 6,
+        }),
+        _usage_row(2, None, None, **usage_fields | {
+            'user_quota_usage_num_vcpus': 1, 'total_quota_usage_num_vcpus': 1,
+        }),
+        _usage_row(None, 1, None, **usage_fields | {
+            'user_quota_num_vcpus': 10, 'user_quota_ram_mb': 1024,
+            'user_quota_usage_num_vcpus': 3, 'total_quota_usage_num_vcpus': 7,
+        }),
+    ]
+
+    rv = client.get(
+        f'{API_BASE}/lab/region/all/usage',
+        headers=AUTH_HEADER,
+    )
+
+    assert rv.status_code == 200, rv.data
+    zero = dict.fromkeys(model.Quota.FIELDS, 0)
+    assert rv.json == {
+        '1': {
+            'user_quota': {'num_vcpus': 10, 'ram_mb': 1024,
+                           'num_volumes': None, 'volumes_gb': None},
+            'user_quota_usage': zero | {'num_vcpus': 2},
+            'total_quota': None,
+            'total_quota_usage': zero | {'num_vcpus': 6},
+        },
+        '2': {
+            'user_quota': None,
+            'user_quota_usage': zero | {'num_vcpus': 1},
+            'total_quota': None,
+            'total_quota_usage': zero | {'num_vcpus': 1},
+        },
+        'all': {
+            'user_quota': zero | {'num_vcpus': 10, 'ram_mb': 1024},
+            'user_quota_usage': zero | {'num_vcpus': 3},
+            'total_quota': zero,
+            'total_quota_usage': zero | {'num_vcpus': 7},
+        },
+    }
+
+
+def test_get_all_usage_no_regions(client, mocker):
+    query_mock = mocker.patch('rhub.api.lab.region._query_all_usage')
+    query_mock.return_value.all.return_value = [_usage_row(None, None, None)]
+
+    rv = client.get(
+        f'{API_BASE}/lab/region/all/usage',
+        headers=AUTH_HEADER,
+    )
+
+    assert rv.status_code == 404, rv.data
+
+
+def test_get_all_usage_query(client, db_session_mock):
+    from rhub.api.lab import region as region_api
+
+    db_session_mock.query.side_effect = lambda *entities: sqlalchemy.orm.Query(entities)
+
+    query = region_api._query_all_usage(sqlalchemy.orm.Query(model.Region), 1)
+    sql = str(query.statement.compile(dialect=postgresql.dialect()))
+
+    # Quotas and usage of all regions and their sum in one query.
+    assert sql.count('SELECT') == 3  # main query, usage and regions subqueries
+    assert 'GROUP BY ROLLUP(lab_region.id)' in sql
+    assert 'FROM lab_quota_usage' in sql
@@ -37,7 +37,7 @@ def auth_group(mocker):
 
 
 def test_list_clouds(client, auth_group):
-    model.Cloud.query.limit.return_value.offset.return_value = [
+    model.Cloud.query.order_by.return_value.limit.return_value.offset.return_value = [
         model.Cloud(
             id=1,
             name='test',
@@ -76,6 +76,7 @@ def test_list_clouds(client, auth_group):
             }
         ],
         'total': 1,
+        '_href': {},
     }
 
 
@@ -470,7 +471,7 @@ def test_list_projects(client, auth_group, auth_user):
         networks=['test_net'],
     )
 
-    model.Project.query.limit.return_value.offset.return_value = [
+    model.Project.query.order_by.return_value.limit.return_value.offset.return_value = [
         model.Project(
             id=1,
             cloud_id=1,
@@ -505,6 +506,7 @@ def test_list_projects(client, auth_group, auth_user):
             }
         ],
         'total': 1,
+        '_href': {},
     }
 
 
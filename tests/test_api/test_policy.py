@@ -40,7 +40,7 @@ def test_list_policy(client, mocker):
         row._asdict.return_value = data
         return row
 
-    db.session.query.return_value.limit.return_value.offset.return_value = [
+    db.session.query.return_value.order_by.return_value.limit.return_value.offset.return_value = [
         row({'id': 1, 'name': 'test', 'department': 'test'}),
         row({'id': 2, 'name': 'test', 'department': 'test'}),
     ]
@@ -66,6 +66,7 @@ def test_list_policy(client, mocker):
             }
         ],
         'total': 2,
+        '_href': {},
     }
 
 
@@ -36,7 +36,7 @@ def auth_group(mocker):
 
 
 def test_list_servers(client, auth_group):
-    model.SatelliteServer.query.limit.return_value.offset.return_value = [
+    model.SatelliteServer.query.order_by.return_value.limit.return_value.offset.return_value = [
         model.SatelliteServer(
             id=1,
             name='test',
@@ -71,6 +71,7 @@ def test_list_servers(client, auth_group):
             }
         ],
         'total': 1,
+        '_href': {},
     }
 
 
@@ -19,7 +19,7 @@ def _db_add_row_side_effect(data_added):
 
 
 def test_list(client):
-    model.SchedulerCronJob.query.limit.return_value.offset.return_value = [
+    model.SchedulerCronJob.query.order_by.return_value.limit.return_value.offset.return_value = [
         model.SchedulerCronJob(
             id=1,
             name='example-job',
@@ -53,6 +53,7 @@ def test_list(client):
             },
         ],
         'total': 1,
+        '_href': {},
     }
 
 
@@ -1,8 +1,10 @@
 import base64
+import urllib.parse
 from unittest.mock import ANY
 
 import pytest
 
+from rhub.api import utils
 from rhub.tower import model
 from rhub.tower.client import TowerError
 from rhub.lab import model as lab_model
@@ -25,7 +27,7 @@ def _db_add_row_side_effect(data_added):
 
 
 def test_list_servers(client):
-    model.Server.query.limit.return_value.offset.return_value = [
+    model.Server.query.order_by.return_value.limit.return_value.offset.return_value = [
         model.Server(
             id=1,
             name='test',
@@ -58,6 +60,7 @@ def test_list_servers(client):
             }
         ],
         'total': 1,
+        '_href': {},
     }
 
 
@@ -283,6 +286,28 @@ def test_update_server(client):
     assert rv.status_code == 200
 
 
+def test_update_server_invalidates_client(client, mocker):
+    model.Server.query.get.return_value = model.Server(
+        id=1,
+        name='test',
+        description='',
+        enabled=True,
+        url='https://tower.example.com',
+        verify_ssl=True,
+        credentials='kv/test',
+    )
+    invalidate_mock = mocker.patch.object(model.tower_clients, 'invalidate')
+
+    rv = client.patch(
+        f'{API_BASE}/tower/server/1',
+        headers=AUTH_HEADER,
+        json={'url': 'https://new.example.com'},
+    )
+
+    assert rv.status_code == 200
+    invalidate_mock.assert_called_once_with(1)
+
+
 def test_update_server_duplicate_name(client, db_unique_violation):
     db_unique_violation('name', 'new')
 
@@ -396,8 +421,33 @@ def test_delete_server_unauthorized(client, db_session_mock):
     assert rv.json['detail'] == 'No authorization token provided'
 
 
+def test_get_client_stats(client, mocker):
+    stats_mock = mocker.patch.object(model.tower_clients, 'stats')
+    stats_mock.return_value = {
+        'clients': 1,
+        'pool_connections': 10,
+        'pool_maxsize': 10,
+        'hits': 3,
+        'misses': 1,
+        'rebuilds': 0,
+        'credentials_reads': 1,
+        'hit_rate': 0.75,
+        'hosts': 1,
+        'connections': 1,
+        'requests': 4,
+    }
+
+    rv = client.get(
+        f'{API_BASE}/tower/client_stats',
+        headers=AUTH_HEADER,
+    )
+
+    assert rv.status_code == 200, rv.data
+    assert rv.json == stats_mock.return_value
+
+
 def test_list_templates(client):
-    model.Template.query.limit.return_value.offset.return_value = [
+    model.Template.query.order_by.return_value.limit.return_value.offset.return_value = [
         model.Template(
             id=1,
             name='test',
@@ -437,6 +487,7 @@ def test_list_templates(client):
             }
         ],
         'total': 1,
+        '_href': {},
     }
 
 
@@ -1125,7 +1176,7 @@ def test_job_relaunch_unauthorized(client):
 
 
 def test_list_jobs(client, mocker):
-    model.Job.query.limit.return_value.offset.return_value = [
+    model.Job.query.order_by.return_value.limit.return_value.offset.return_value = [
         model.Job(
             id=1,
             template_id=1,
@@ -1154,9 +1205,68 @@ def test_list_jobs(client, mocker):
             }
         ],
         'total': 1,
+        '_href': {},
     }
 
 
+def test_list_jobs_cursor(client, mocker):
+    q = model.Job.query.order_by.return_value
+    q.filter.return_value.limit.return_value = [
+        model.Job(
+            id=i,
+            template_id=1,
+            tower_job_id=i,
+            launched_by=1,
+        )
+        for i in [11, 12]
+    ]
+    model.Job.query.count.return_value = 20
+
+    mocker.patch('rhub.api.tower._job_href').return_value = {}
+
+    rv = client.get(
+        f'{API_BASE}/tower/job',
+        headers=AUTH_HEADER,
+        query_string={'limit': 2, 'cursor': utils._cursor_encode(None, None, 10)},
+    )
+
+    assert rv.status_code == 200, rv.data
+    assert [i['id'] for i in rv.json['data']] == [11, 12]
+
+    next_url = urllib.parse.urlsplit(rv.json['_href']['next'])
+    next_args = urllib.parse.parse_qs(next_url.query)
+    assert next_url.path == f'{API_BASE}/tower/job'
+    assert next_args['limit'] == ['2']
+    assert utils._cursor_decode(next_args['cursor'][0], None) == (None, 12)
+
+
+def test_list_jobs_invalid_cursor(client):
+    rv = client.get(
+        f'{API_BASE}/tower/job',
+        headers=AUTH_HEADER,
+        query_string={'cursor': 'invalid'},
+    )
+
+    assert rv.status_code == 400, rv.data
+
+
+@pytest.mark.parametrize('total_mode, total', [('exact', 1), ('none', None)])
+def test_list_jobs_total(client, mocker, total_mode, total):
+    model.Job.query.order_by.return_value.limit.return_value.offset.return_value = []
+    model.Job.query.count.reset_mock()
+    model.Job.query.count.return_value = 1
+
+    rv = client.get(
+        f'{API_BASE}/tower/job',
+        headers=AUTH_HEADER,
+        query_string={'total': total_mode},
+    )
+
+    assert rv.status_code == 200, rv.data
+    assert rv.json['total'] == total
+    assert model.Job.query.count.called == (total is not None)
+
+
 def test_list_jobs_unauthorized(client):
     rv = client.get(
         f'{API_BASE}/tower/job',
@@ -1341,11 +1451,12 @@ def test_get_job_towererror(client, mocker):
         ),
     ]
 )
-def test_webhook(client, mocker, payload):
+def test_webhook(client, mocker, db_session_mock, payload):
     mocker.patch.dict(client.application.config, {
         'WEBHOOK_USER': 'user',
         'WEBHOOK_PASS': 'pass',
     })
+    delay_mock = mocker.patch('rhub.tower.tasks.process_webhook_notification.delay')
 
     rv = client.post(
         f'{API_BASE}/tower/webhook_notification',
@@ -1356,3 +1467,27 @@ def test_webhook(client, mocker, payload):
     )
 
     assert rv.status_code == 204
+    db_session_mock.commit.assert_called()
+    delay_mock.assert_called_once()
+
+
+def test_webhook_queue_failed(client, mocker, db_session_mock):
+    mocker.patch.dict(client.application.config, {
+        'WEBHOOK_USER': 'user',
+        'WEBHOOK_PASS': 'pass',
+    })
+    delay_mock = mocker.patch('rhub.tower.tasks.process_webhook_notification.delay')
+    delay_mock.side_effect = Exception('Broker is down')
+
+    rv = client.post(
+        f'{API_BASE}/tower/webhook_notification',
+        headers=AUTH_HEADER | {
+            'Content-Type': 'application/json',
+        },
+        json={'id': 38, 'name': 'Demo Job Template', 'status': 'successful'},
+    )
+
+    # Notification is stored and queued later by the cron job, Tower must
+    # not deliver it again.
+    assert rv.status_code == 204
+    db_session_mock.commit.assert_called()
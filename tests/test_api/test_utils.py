@@ -1,6 +1,10 @@
+import flask
 import pytest
+import sqlalchemy
+from sqlalchemy.dialects import postgresql
 
 from rhub.api import utils
+from rhub.lab import model as lab_model
 
 
 @pytest.mark.parametrize(
@@ -94,3 +98,185 @@ from rhub.api import utils
 )
 def test_condition_eval(condition, params, result):
     assert utils.condition_eval(condition, params) == result
+
+
+@pytest.fixture
+def paginate_query(mocker):
+    query = mocker.Mock()
+    query.order_by.return_value = query
+    query.filter.return_value = query
+    query.limit.return_value = query
+    query.offset.return_value = query
+    query.__iter__ = mocker.Mock(return_value=iter([]))
+    yield query
+
+
+def _locations(*names):
+    return [
+        lab_model.Location(id=i, name=name)
+        for i, name in enumerate(names, start=1)
+    ]
+
+
+def test_db_paginate_page(paginate_query):
+    paginate_query.__iter__.return_value = iter(_locations('a', 'b'))
+
+    page = utils.db_paginate(paginate_query, lab_model.Location.id, 'name',
+                             page=3, limit=2)
+
+    assert [i.name for i in page.rows] == ['a', 'b']
+    paginate_query.offset.assert_called_once_with(6)
+    assert utils._cursor_decode(page.next_cursor, 'name') == ('b', 2)
+
+
+def test_db_paginate_last_page(paginate_query):
+    paginate_query.__iter__.return_value = iter(_locations('a'))
+
+    page = utils.db_paginate(paginate_query, lab_model.Location.id, limit=2)
+
+    assert page.next_cursor is None
+
+
+@pytest.mark.parametrize(
+    'sort_by, value, sql',
+    [
+        (None, None, 'lab_location.id > 10'),
+        ('name', 'foo', '(lab_location.name, lab_location.id) > (\'foo\', 10) '
+                        'OR lab_location.name IS NULL'),
+        ('-name', 'foo', '(lab_location.name, lab_location.id) < (\'foo\', 10)'),
+        ('name', None, 'lab_location.name IS NULL AND lab_location.id > 10'),
+    ],
+    ids=['id', 'asc', 'desc', 'null'],
+)
+def test_db_paginate_cursor(paginate_query, sort_by, value, sql):
+    cursor = utils._cursor_encode(sort_by, value, 10)
+
+    utils.db_paginate(paginate_query, lab_model.Location.id, sort_by,
+                      limit=2, cursor=cursor)
+
+    paginate_query.offset.assert_not_called()
+    condition = sqlalchemy.and_(*paginate_query.filter.call_args.args)
+    compiled = condition.compile(
+        dialect=postgresql.dialect(),
+        compile_kwargs={'literal_binds': True},
+    )
+    assert str(compiled) == sql
+
+
+def _clusters(*statuses):
+    return [
+        lab_model.Cluster(id=i, name=f'cluster{i}', status=status)
+        for i, status in enumerate(statuses, start=1)
+    ]
+
+
+def test_db_paginate_cursor_enum(paginate_query):
+    paginate_query.__iter__.return_value = iter(_clusters(
+        lab_model.ClusterStatus.ACTIVE, lab_model.ClusterStatus.DELETED,
+    ))
+    page = utils.db_paginate(paginate_query, lab_model.Cluster.id, 'status', limit=2)
+
+    paginate_query.__iter__.return_value = iter([])
+    utils.db_paginate(paginate_query, lab_model.Cluster.id, 'status',
+                      limit=2, cursor=page.next_cursor)
+
+    condition = sqlalchemy.and_(*paginate_query.filter.call_args.args)
+    compiled = condition.compile(
+        dialect=postgresql.dialect(),
+        compile_kwargs={'literal_binds': True},
+    )
+    assert str(compiled) == (
+        "(lab_cluster.status, lab_cluster.id) > ('DELETED', 2) "
+        "OR lab_cluster.status IS NULL"
+    )
+
+
+@pytest.mark.parametrize('cursor', ['not-a-cursor', utils._cursor_encode('-name', 'a', 1)])
+def test_db_paginate_invalid_cursor(paginate_query, cursor):
+    with pytest.raises(ValueError):
+        utils.db_paginate(paginate_query, lab_model.Location.id, 'name',
+                          cursor=cursor)
+
+
+def test_page_href():
+    app = flask.Flask(__name__)
+    with app.test_request_context('/v0/lab/location?sort=name&page=2&limit=5'):
+        assert utils.Page([], 'abc').href() == {
+            'next': '/v0/lab/location?sort=name&limit=5&cursor=abc',
+        }
+        assert utils.Page([], None).href() == {}
+
+
+def test_db_count_none(paginate_query):
+    assert utils.db_count(paginate_query, 'none') is None
+    paginate_query.count.assert_not_called()
+
+
+def test_db_count_cache(mocker):
+    query = sqlalchemy.orm.Query(lab_model.Location).filter(
+        lab_model.Location.name == 'RDU'
+    )
+    count_mock = mocker.patch.object(sqlalchemy.orm.Query, 'count')
+    count_mock.return_value = 5
+
+    assert utils.db_count(query, cache=True) == 5
+    count_mock.return_value = 6
+    assert utils.db_count(query, cache=True) == 5
+    assert utils.db_count(query) == 6
+
+    other_query = sqlalchemy.orm.Query(lab_model.Location).filter(
+        lab_model.Location.name == 'BRQ'
+    )
+    assert utils.db_count(other_query, cache=True) == 6
+
+
+def _compile_literal(statement):
+    return str(statement.compile(
+        dialect=postgresql.dialect(),
+        compile_kwargs={'literal_binds': True},
+    ))
+
+
+def test_db_count_estimate(db_session_mock):
+    query = sqlalchemy.orm.Query(lab_model.Location).filter(
+        lab_model.Location.name == 'RDU'
+    )
+    exec_mock = db_session_mock.execute
+    exec_mock.return_value.scalar.return_value = [{'Plan': {'Plan Rows': 42}}]
+
+    assert utils.db_count(query, 'estimate') == 42
+
+    sql = _compile_literal(exec_mock.call_args.args[0])
+    assert sql.startswith('EXPLAIN (FORMAT JSON) SELECT')
+    assert "lab_location.name = 'RDU'" in sql
+
+
+def test_db_count_estimate_enum(db_session_mock):
+    query = sqlalchemy.orm.Query(lab_model.Cluster).filter(
+        lab_model.Cluster.status != lab_model.ClusterStatus.DELETED,
+        lab_model.Cluster.status.in_([lab_model.ClusterStatus.ACTIVE]),
+    )
+    exec_mock = db_session_mock.execute
+    exec_mock.return_value.scalar.return_value = [{'Plan': {'Plan Rows': 3}}]
+
+    assert utils.db_count(query, 'estimate') == 3
+
+    # Enum bind parameters are rendered by the column type as DB labels.
+    sql = _compile_literal(exec_mock.call_args.args[0])
+    assert "lab_cluster.status != 'DELETED'" in sql
+    assert "lab_cluster.status IN ('ACTIVE')" in sql
+
+
+@pytest.mark.parametrize(
+    'fields, expand, expected',
+    [
+        (None, None, {'id', 'name', 'hosts', 'quota'}),
+        (['name'], None, {'id', 'name'}),
+        (['name', 'hosts'], None, {'id', 'name', 'hosts'}),
+        (None, ['quota'], {'id', 'name', 'quota'}),
+        (['name'], ['quota'], {'id', 'name', 'quota'}),
+    ],
+)
+def test_field_selection(fields, expand, expected):
+    selection = utils.FieldSelection(fields, expand, expandable=['hosts', 'quota'])
+    assert {n for n in ['id', 'name', 'hosts', 'quota'] if n in selection} == expected
@@ -0,0 +1,261 @@
+import fcntl
+import os
+import threading
+import time
+
+import hvac.exceptions
+import pytest
+import yaml
+
+from rhub.api import vault
+
+
+@pytest.fixture
+def monotonic_mock(mocker):
+    m = mocker.patch('time.monotonic')
+    m.return_value = 1000.0
+    yield m
+
+
+@pytest.fixture
+def hvac_client(mocker):
+    client_cls = mocker.patch('rhub.api.vault.hvac.Client')
+    client = client_cls.return_value
+    client.url = 'https://vault.example.com'
+    client.auth.approle.login.return_value = {'auth': {'lease_duration': 3600}}
+    client.read.return_value = {
+        'lease_duration': 0,
+        'data': {
+            'data': {'username': 'user', 'password': 'pass'},
+            'metadata': {'version': 1},
+        },
+    }
+    yield client
+
+
+@pytest.fixture
+def hashicorp_vault(hvac_client):
+    yield vault.HashicorpVault(
+        'https://vault.example.com', 'role', 'secret',
+        max_staleness=60, token_renew=False,
+    )
+
+
+def test_hashicorp_read_cached(hashicorp_vault, hvac_client, monotonic_mock):
+    assert hashicorp_vault.read('kv/test') == {'username': 'user', 'password': 'pass'}
+    assert hashicorp_vault.read('kv/test') == {'username': 'user', 'password': 'pass'}
+    hvac_client.read.assert_called_once_with('kv/test')
+
+    monotonic_mock.return_value += 61
+    hashicorp_vault.read('kv/test')
+    assert hvac_client.read.call_count == 2
+
+
+def test_hashicorp_read_lease(hashicorp_vault, hvac_client, monotonic_mock):
+    hvac_client.read.return_value = {
+        'lease_duration': 10,
+        'data': {'username': 'user', 'password': 'pass'},
+    }
+
+    assert hashicorp_vault.read('kv/test') == {'username': 'user', 'password': 'pass'}
+
+    monotonic_mock.return_value += 11
+    hashicorp_vault.read('kv/test')
+    assert hvac_client.read.call_count == 2
+
+
+def test_hashicorp_read_missing_not_cached(hashicorp_vault, hvac_client, monotonic_mock):
+    hvac_client.read.side_effect = hvac.exceptions.InvalidPath()
+
+    assert hashicorp_vault.read('kv/test') is None
+    assert hashicorp_vault.read('kv/test') is None
+    assert hvac_client.read.call_count == 2
+
+
+def test_hashicorp_write_invalidates(hashicorp_vault, hvac_client, monotonic_mock):
+    hashicorp_vault.read('kv/test')
+    hashicorp_vault.write('kv/test', {'username': 'user', 'password': 'new'})
+    hashicorp_vault.read('kv/test')
+
+    hvac_client.write.assert_called_once_with('kv/test', username='user', password='new')
+    assert hvac_client.read.call_count == 2
+
+
+def test_hashicorp_read_forbidden_login(hashicorp_vault, hvac_client, monotonic_mock):
+    data = hvac_client.read.return_value
+    hvac_client.read.side_effect = [hvac.exceptions.Forbidden(), data]
+
+    assert hashicorp_vault.read('kv/test') == {'username': 'user', 'password': 'pass'}
+    assert hvac_client.auth.approle.login.call_count == 2
+
+
+def test_hashicorp_renew_token(hashicorp_vault, hvac_client):
+    hvac_client.auth.token.renew_self.return_value = {'auth': {'lease_duration': 3600}}
+
+    hashicorp_vault._renew_token()
+
+    hvac_client.auth.token.renew_self.assert_called_once()
+    hvac_client.auth.approle.login.assert_called_once()
+
+
+@pytest.mark.parametrize(
+    'renew_side_effect',
+    [
+        pytest.param([{'auth': {'lease_duration': 100}}], id='max-ttl'),
+        pytest.param(hvac.exceptions.InvalidRequest(), id='error'),
+    ],
+)
+def test_hashicorp_renew_token_login(hashicorp_vault, hvac_client, renew_side_effect):
+    hvac_client.auth.token.renew_self.side_effect = renew_side_effect
+
+    hashicorp_vault._renew_token()
+
+    assert hvac_client.auth.approle.login.call_count == 2
+
+
+def test_hashicorp_renew_thread_per_process(hvac_client, mocker):
+    thread_mock = mocker.patch('rhub.api.vault.threading.Thread')
+    getpid_mock = mocker.patch('os.getpid')
+    getpid_mock.return_value = 100
+
+    hashicorp_vault = vault.HashicorpVault(
+        'https://vault.example.com', 'role', 'secret',
+    )
+    # Not started in the process that created the client (e.g. gunicorn
+    # master), until it's used.
+    thread_mock.assert_not_called()
+
+    hashicorp_vault.read('kv/test')
+    hashicorp_vault.read('kv/other')
+    assert thread_mock.return_value.start.call_count == 1
+
+    # Forked worker.
+    getpid_mock.return_value = 101
+    hashicorp_vault.write('kv/test', {'username': 'user'})
+    assert thread_mock.return_value.start.call_count == 2
+
+
+@pytest.fixture
+def datafile(tmp_path):
+    path = tmp_path / 'vault.yml'
+    path.write_text(yaml.safe_dump({'kv/test': {'username': 'user', 'password': 'pass'}}))
+    path.chmod(0o600)
+    yield path
+
+
+def _rotate(datafile, password):
+    tmp = datafile.with_suffix('.tmp')
+    tmp.write_text(yaml.safe_dump({'kv/test': {'username': 'user', 'password': password}}))
+    os.replace(tmp, datafile)
+
+
+def _wait_for(fn, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if fn():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_file_read(datafile):
+    file_vault = vault.FileVault(datafile)
+    try:
+        assert file_vault.read('kv/test') == {'username': 'user', 'password': 'pass'}
+        assert file_vault.read('kv/missing') is None
+    finally:
+        file_vault.stop()
+
+
+def test_file_reload_on_change(datafile):
+    file_vault = vault.FileVault(datafile)
+    try:
+        _rotate(datafile, 'new')
+        assert _wait_for(lambda: file_vault.read('kv/test')['password'] == 'new')
+    finally:
+        file_vault.stop()
+
+
+def test_file_no_reload_without_change(datafile, mocker):
+    file_vault = vault.FileVault(datafile)
+    try:
+        assert _wait_for(lambda: file_vault._watch_thread.is_alive())
+        load_mock = mocker.patch.object(file_vault, '_load')
+        stat_mock = mocker.spy(file_vault, '_stat')
+
+        for _ in range(3):
+            file_vault.read('kv/test')
+
+        load_mock.assert_not_called()
+        stat_mock.assert_not_called()
+    finally:
+        file_vault.stop()
+
+
+def test_file_reload_without_inotify(datafile, mocker):
+    mocker.patch('inotify.adapters.Inotify', side_effect=OSError)
+
+    file_vault = vault.FileVault(datafile)
+    assert file_vault._watch_thread is None
+
+    _rotate(datafile, 'new')
+    assert file_vault.read('kv/test')['password'] == 'new'
+
+
+def test_file_stop_closes_watcher(datafile):
+    fds = len(os.listdir('/proc/self/fd'))
+
+    file_vault = vault.FileVault(datafile)
+    assert _wait_for(lambda: file_vault._watch_thread.is_alive())
+    file_vault.stop()
+
+    assert file_vault._watch_thread is None
+    assert _wait_for(lambda: len(os.listdir('/proc/self/fd')) == fds)
+
+
+def test_file_write_atomic(datafile):
+    file_vault = vault.FileVault(datafile, watch=False)
+
+    # Secret added by another process must not be lost.
+    data = yaml.safe_load(datafile.read_text())
+    data['kv/other'] = {'username': 'other'}
+    tmp = datafile.with_suffix('.tmp')
+    tmp.write_text(yaml.safe_dump(data))
+    tmp.chmod(0o600)
+    os.replace(tmp, datafile)
+
+    file_vault.write('kv/new', {'username': 'new'})
+
+    assert yaml.safe_load(datafile.read_text()) == {
+        'kv/test': {'username': 'user', 'password': 'pass'},
+        'kv/other': {'username': 'other'},
+        'kv/new': {'username': 'new'},
+    }
+    assert datafile.stat().st_mode & 0o777 == 0o600
+    assert sorted(os.listdir(datafile.parent)) == ['vault.yml', 'vault.yml.lock']
+    assert file_vault.read('kv/new') == {'username': 'new'}
+
+
+def test_file_write_locked(datafile):
+    file_vault = vault.FileVault(datafile, watch=False)
+
+    with open(f'{datafile}.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+        thread = threading.Thread(
+            target=file_vault.write, args=('kv/new', {'username': 'new'}),
+        )
+        thread.start()
+        thread.join(0.2)
+        assert thread.is_alive()
+
+        # Another process writes the file while it holds the lock.
+        _rotate(datafile, 'new')
+
+    thread.join(5)
+    assert not thread.is_alive()
+
+    assert yaml.safe_load(datafile.read_text()) == {
+        'kv/test': {'username': 'user', 'password': 'new'},
+        'kv/new': {'username': 'new'},
+    }
@@ -0,0 +1,236 @@
+import datetime
+import threading
+
+import ldap3
+import pytest
+from ldap3.core.exceptions import LDAPSessionTerminatedByServerError
+
+from rhub.auth import ldap
+
+
+@pytest.fixture
+def monotonic_mock(mocker):
+    m = mocker.patch('time.monotonic')
+    m.return_value = 1000.0
+    yield m
+
+
+@pytest.fixture
+def connect_mock(mocker):
+    def connect():
+        conn = mocker.Mock()
+        conn.closed = False
+        conn.bound = True
+        return conn
+    yield mocker.Mock(side_effect=connect)
+
+
+@pytest.fixture
+def pool(connect_mock):
+    yield ldap.LdapConnectionPool(
+        connect_mock, size=2, idle_timeout=300, health_check_interval=60,
+        acquire_timeout=0.1,
+    )
+
+
+def test_pool_reuse(pool, connect_mock, monotonic_mock):
+    with pool.connection() as conn1:
+        pass
+    with pool.connection() as conn2:
+        pass
+
+    assert conn1 is conn2
+    connect_mock.assert_called_once()
+
+    stats = pool.stats()
+    assert stats['created'] == 1
+    assert stats['reused'] == 1
+    assert stats['idle'] == 1
+    assert stats['in_use'] == 0
+
+
+def test_pool_idle_timeout(pool, connect_mock, monotonic_mock):
+    with pool.connection() as conn1:
+        pass
+
+    monotonic_mock.return_value += 301
+
+    with pool.connection() as conn2:
+        pass
+
+    assert conn1 is not conn2
+    conn1.unbind.assert_called_once()
+    assert pool.stats()['expired'] == 1
+
+
+def test_pool_health_check(pool, connect_mock, monotonic_mock):
+    with pool.connection() as conn1:
+        pass
+
+    monotonic_mock.return_value += 61
+    conn1.search.return_value = False
+
+    with pool.connection() as conn2:
+        pass
+
+    assert conn1 is not conn2
+    conn1.search.assert_called_once()
+    assert pool.stats()['broken'] == 1
+
+
+def test_pool_closed_connection(pool, connect_mock, monotonic_mock):
+    with pool.connection() as conn1:
+        pass
+
+    conn1.closed = True
+
+    with pool.connection() as conn2:
+        pass
+
+    assert conn1 is not conn2
+    conn1.search.assert_not_called()
+
+
+def test_pool_communication_error(pool, connect_mock, monotonic_mock):
+    with pytest.raises(LDAPSessionTerminatedByServerError):
+        with pool.connection() as conn:
+            raise LDAPSessionTerminatedByServerError()
+
+    conn.unbind.assert_called_once()
+    assert pool.stats()['idle'] == 0
+    assert pool.stats()['errors'] == 1
+
+
+def test_pool_size(pool, connect_mock):
+    with pool.connection(), pool.connection():
+        with pytest.raises(ldap.LdapPoolTimeout):
+            with pool.connection():
+                pass
+
+    assert pool.stats()['timeouts'] == 1
+    assert connect_mock.call_count == 2
+
+
+def test_pool_wait(pool, connect_mock):
+    pool.acquire_timeout = 5
+    acquired = threading.Barrier(3)
+    released = threading.Event()
+
+    def hold_connection():
+        with pool.connection():
+            acquired.wait()
+            released.wait()
+
+    threads = [threading.Thread(target=hold_connection) for _ in range(2)]
+    for t in threads:
+        t.start()
+
+    acquired.wait()
+    threading.Timer(0.1, released.set).start()
+
+    with pool.connection():
+        pass
+
+    for t in threads:
+        t.join()
+
+    assert pool.stats()['waits'] == 1
+    assert connect_mock.call_count == 2
+
+
+def test_client_reconnect(mocker, connect_mock):
+    client = ldap.LdapClient({'server': 'ldap://ldap.example.com'})
+    client.pool.connect = connect_mock
+
+    broken_conn, new_conn = mocker.Mock(), mocker.Mock()
+    broken_conn.search.side_effect = LDAPSessionTerminatedByServerError()
+    new_conn.entries = ['entry']
+    connect_mock.side_effect = [broken_conn, new_conn]
+
+    assert client.get('uid=user,dc=example,dc=com') == ['entry']
+    assert connect_mock.call_count == 2
+    broken_conn.unbind.assert_called_once()
+
+
+@pytest.fixture
+def mock_ldap_client():
+    config = {
+        'server': 'ldap://ldap.example.com',
+        'users_base': 'ou=users,dc=example,dc=com',
+        'groups_base': 'ou=groups,dc=example,dc=com',
+        'user_attrs': {'name': 'uid', 'email': 'mail'},
+        'group_attrs': {'name': 'cn'},
+    }
+    client = ldap.LdapClient(config)
+
+    conn = ldap3.Connection(ldap3.Server('mock'), client_strategy=ldap3.MOCK_SYNC)
+    for i in range(3):
+        conn.strategy.add_entry(f'uid=user{i},ou=users,dc=example,dc=com', {
+            'objectClass': 'person',
+            'uid': f'user{i}',
+            'mail': f'user{i}@example.com',
+            'memberOf': ['cn=group,ou=groups,dc=example,dc=com'],
+            'modifyTimestamp': f'2024010{i + 1}120000Z',
+        })
+    conn.strategy.add_entry('cn=group,ou=groups,dc=example,dc=com', {
+        'objectClass': 'groupOfNames',
+        'cn': 'group',
+        'member': ['uid=user0,ou=users,dc=example,dc=com'],
+    })
+    conn.bind()
+
+    client.pool.connect = lambda: conn
+    yield client
+
+
+def test_search_users_paged(mock_ldap_client):
+    pages = list(mock_ldap_client.search_users_paged(page_size=2))
+
+    assert [len(page) for page in pages] == [2, 1]
+    users = sorted((user for page in pages for user in page), key=lambda i: i['name'])
+    assert users[0] == {
+        'ldap_dn': 'uid=user0,ou=users,dc=example,dc=com',
+        'name': 'user0',
+        'email': 'user0@example.com',
+        'groups': [{'ldap_dn': 'cn=group,ou=groups,dc=example,dc=com'}],
+        'modify_timestamp': datetime.datetime(2024, 1, 1, 12, 0, tzinfo=datetime.timezone.utc),
+    }
+
+    assert mock_ldap_client.pool_stats()['created'] == 1
+
+
+def test_search_groups_paged(mock_ldap_client):
+    pages = list(mock_ldap_client.search_groups_paged(page_size=2))
+
+    assert pages == [[{
+        'ldap_dn': 'cn=group,ou=groups,dc=example,dc=com',
+        'name': 'group',
+        'users': [{'ldap_dn': 'uid=user0,ou=users,dc=example,dc=com'}],
+        'modify_timestamp': None,
+    }]]
+
+
+def test_search_existing_users(mock_ldap_client):
+    existing = mock_ldap_client.search_existing_users(
+        ['user0', 'user2', 'deleted', 'in(jection)*'], chunk_size=2,
+    )
+    assert existing == {
+        'uid=user0,ou=users,dc=example,dc=com',
+        'uid=user2,ou=users,dc=example,dc=com',
+    }
+
+
+def test_modified_since():
+    timestamp = datetime.datetime(
+        2024, 1, 1, 14, 30, 15, 1234,
+        tzinfo=datetime.timezone(datetime.timedelta(hours=2)),
+    )
+    assert ldap.LdapClient.modified_since(timestamp) == '(modifyTimestamp>=20240101123015Z)'
+
+
+def test_search_users_paged_modified_since(mock_ldap_client):
+    query = mock_ldap_client.modified_since(
+        datetime.datetime(2024, 1, 2, 0, 0, tzinfo=datetime.timezone.utc)
+    )
+    pages = list(mock_ldap_client.search_users_paged(query))
+    assert sorted(user['name'] for page in pages for user in page) == ['user1', 'user2']
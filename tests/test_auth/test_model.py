@@ -0,0 +1,110 @@
+import pytest
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm.attributes import set_committed_value
+
+from rhub.auth import model
+
+
+class SessionStub:
+    def __init__(self, new=(), dirty=(), deleted=()):
+        self.new = set(new)
+        self.dirty = set(dirty)
+        self.deleted = set(deleted)
+        self.info = {}
+
+
+@pytest.fixture
+def group():
+    group = model.Group(id=2, name='testgroup')
+    set_committed_value(group, 'users', [])
+    return group
+
+
+@pytest.fixture
+def user(group):
+    user = model.User(id=1, name='testuser')
+    set_committed_value(user, 'ssh_keys', ['ssh-ed25519 AAAA'])
+    set_committed_value(user, 'deleted', False)
+    set_committed_value(user, 'groups', [group])
+    return user
+
+
+def _dirty_scopes(session):
+    model._authorized_keys_track(session, None)
+    return session.info.get(model._AUTHORIZED_KEYS_DIRTY, set())
+
+
+def test_authorized_keys_track_unchanged(user):
+    user.email = 'testuser@example.com'
+    assert _dirty_scopes(SessionStub(dirty=[user])) == set()
+
+
+def test_authorized_keys_track_ssh_keys(user):
+    user.ssh_keys = ['ssh-ed25519 BBBB']
+    assert _dirty_scopes(SessionStub(dirty=[user])) == {'all', 'group:2'}
+
+
+def test_authorized_keys_track_membership(user):
+    other_group = model.Group(id=3, name='othergroup')
+    user.groups.append(other_group)
+    assert _dirty_scopes(SessionStub(dirty=[user])) == {'group:3'}
+
+
+def test_authorized_keys_track_group_deleted(group):
+    assert _dirty_scopes(SessionStub(deleted=[group])) == {'group:2'}
+
+
+def test_authorized_keys_invalidate():
+    session = SessionStub()
+    model.authorized_keys_invalidate(session, group_ids=[1, 2])
+    model.authorized_keys_invalidate(session, all_users=True)
+    assert session.info[model._AUTHORIZED_KEYS_DIRTY] == {'all', 'group:1', 'group:2'}
+
+
+def _executed_sql(db_session_mock):
+    return [
+        str(call.args[0].compile(dialect=postgresql.dialect()))
+        for call in db_session_mock.execute.call_args_list
+    ]
+
+
+def test_authorized_keys_refresh_lock(mocker, db_session_mock):
+    mocker.patch.object(model.AuthorizedKeys, '_query_keys').return_value = ['ssh-ed25519 AAAA']
+
+    result = model.AuthorizedKeys.refresh({'all'})
+
+    assert result == {'all': ['ssh-ed25519 AAAA']}
+    lock_sql, upsert_sql = _executed_sql(db_session_mock)
+    assert 'pg_advisory_xact_lock(hashtext(' in lock_sql
+    assert upsert_sql.startswith('INSERT INTO auth_authorized_keys')
+
+
+def test_authorized_keys_commit_all_users_lazy(mocker):
+    session = mocker.Mock(info={})
+    refresh_mock = mocker.patch.object(model.AuthorizedKeys, 'refresh')
+    mark_dirty_mock = mocker.patch.object(model.AuthorizedKeys, 'mark_dirty')
+
+    model.authorized_keys_invalidate(session, group_ids=[2], all_users=True)
+    model._authorized_keys_refresh(session)
+
+    mark_dirty_mock.assert_called_once_with({'all'})
+    refresh_mock.assert_called_once_with({'group:2'})
+
+
+@pytest.mark.parametrize('dirty', [False, True])
+def test_authorized_keys_get_keys_dirty(mocker, db_session_mock, dirty):
+    mocker.patch.object(model.AuthorizedKeys, 'query').get.return_value = (
+        model.AuthorizedKeys(scope='all', keys=['ssh-ed25519 AAAA'], dirty=dirty)
+    )
+    refresh_mock = mocker.patch.object(model.AuthorizedKeys, 'refresh')
+    refresh_mock.return_value = {'all': ['ssh-ed25519 BBBB']}
+
+    keys = model.AuthorizedKeys.get_keys('all')
+
+    if dirty:
+        assert keys == ['ssh-ed25519 BBBB']
+        refresh_mock.assert_called_once_with(['all'])
+        db_session_mock.commit.assert_called_once()
+    else:
+        assert keys == ['ssh-ed25519 AAAA']
+        refresh_mock.assert_not_called()
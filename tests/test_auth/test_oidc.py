@@ -0,0 +1,95 @@
+import time
+
+import pytest
+from Cryptodome.PublicKey import RSA
+from jwkest import jwk, jws
+
+from rhub.auth import oidc
+
+
+ISSUER = 'https://sso.example.com/auth/realms/rhub'
+
+
+@pytest.fixture
+def signing_key():
+    yield jwk.RSAKey(key=RSA.generate(2048), kid='test-key')
+
+
+@pytest.fixture
+def provider(mocker, signing_key):
+    provider = oidc.OidcProvider(ISSUER, audience='rhub')
+
+    def refresh():
+        client = mocker.Mock()
+        client.issuer = ISSUER
+        keys = jwk.KEYS()
+        keys.append(signing_key)
+        provider._client = client
+        provider._keys = keys
+        provider._loaded_at = time.monotonic()
+
+    mocker.patch.object(provider, 'refresh', side_effect=refresh)
+    yield provider
+
+
+def make_token(key, **claims):
+    claims = {
+        'iss': ISSUER,
+        'aud': 'rhub',
+        'sub': '00000000-0000-0000-0000-000000000000',
+        'exp': int(time.time()) + 300,
+    } | claims
+    return jws.JWS(claims, alg='RS256').sign_compact([key])
+
+
+def test_verify_token(provider, signing_key):
+    claims = provider.verify_token(make_token(signing_key))
+    assert claims['sub'] == '00000000-0000-0000-0000-000000000000'
+
+    provider.verify_token(make_token(signing_key))
+    provider.refresh.assert_called_once()
+
+
+@pytest.mark.parametrize(
+    'claims',
+    [
+        {'exp': int(time.time()) - 3600},
+        {'iss': 'https://evil.example.com'},
+        {'aud': 'other-app'},
+        {'nbf': int(time.time()) + 3600},
+    ],
+    ids=['expired', 'issuer', 'audience', 'not-before'],
+)
+def test_verify_token_invalid_claims(provider, signing_key, claims):
+    with pytest.raises(ValueError):
+        provider.verify_token(make_token(signing_key, **claims))
+
+
+def test_verify_token_invalid_signature(provider):
+    other_key = jwk.RSAKey(key=RSA.generate(2048), kid='test-key')
+    with pytest.raises(Exception):
+        provider.verify_token(make_token(other_key))
+
+
+def test_verify_token_not_jwt(provider):
+    with pytest.raises(oidc.OidcError):
+        provider.verify_token('opaque-token')
+    provider.refresh.assert_not_called()
+
+
+def test_verify_token_unknown_key_reload(provider):
+    provider.refresh()
+    provider._loaded_at -= provider.min_refresh_interval
+
+    rotated_key = jwk.RSAKey(key=RSA.generate(2048), kid='rotated-key')
+
+    def refresh():
+        provider._keys = jwk.KEYS()
+        provider._keys.append(rotated_key)
+        provider._loaded_at = time.monotonic()
+
+    provider.refresh.side_effect = refresh
+
+    claims = provider.verify_token(make_token(rotated_key))
+    assert claims['iss'] == ISSUER
+    assert provider.refresh.call_count == 2
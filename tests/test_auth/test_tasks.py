@@ -1,8 +1,16 @@
+import datetime
 from unittest.mock import ANY
 import pytest
 from rhub.auth import model as auth_model
 from rhub.openstack import model as openstack_model
+from rhub.auth import ldap
 from rhub.auth import tasks as auth_tasks
+from rhub.dns import model as dns_model
+from rhub.lab import model as lab_model
+from rhub.satellite import model as satellite_model
+
+
+NOW = datetime.datetime(2024, 1, 2, 12, 0, tzinfo=datetime.timezone.utc)
 
 
 def test_cleanup_users(mocker, di_mock, ldap_client_mock, messaging_mock):
@@ -28,6 +36,7 @@ def test_cleanup_users(mocker, di_mock, ldap_client_mock, messaging_mock):
     mocker.patch('rhub.auth.tasks.di', new=di_mock)
 
     auth_model.User.query.filter.return_value = [user]
+    ldap_client_mock.search_existing_users.return_value = set()
     ldap_client_mock.get.return_value = []  # => user has been deleted from LDAP
 
     query_result_mock = mocker.Mock()
@@ -42,3 +51,363 @@ def test_cleanup_users(mocker, di_mock, ldap_client_mock, messaging_mock):
         {'owner_id': manager.id},
         synchronize_session='fetch',
     )
+
+
+def test_cleanup_users_invalidates_tokens(mocker, di_mock, ldap_client_mock):
+    user = auth_model.User(
+        id=1,
+        ldap_dn='uid=user,dc=example,dc=com',
+        name='user',
+        manager=auth_model.User(id=2, name='manager'),
+    )
+
+    mocker.patch('rhub.auth.tasks.di', new=di_mock)
+
+    auth_model.User.query.filter.return_value = [user]
+    ldap_client_mock.search_existing_users.return_value = set()
+    ldap_client_mock.get.return_value = []
+
+    auth_model.token_cache.clear()
+    auth_model.token_cache.set('user-token', auth_model.CachedToken(1, 1, None, False))
+    auth_model.token_cache.set('other-token', auth_model.CachedToken(2, 3, None, False))
+
+    auth_tasks.cleanup_users()
+
+    assert auth_model.token_cache.get('user-token') is None
+    assert auth_model.token_cache.get('other-token') is not None
+
+    auth_model.token_cache.clear()
+
+
+
+def test_cleanup_users_batched(mocker, di_mock, ldap_client_mock, messaging_mock):
+    manager = auth_model.User(id=10, name='manager')
+    users = [
+        auth_model.User(
+            id=i,
+            ldap_dn=f'uid=user{i},dc=example,dc=com',
+            name=f'user{i}',
+            manager_id=manager.id,
+            manager=manager,
+        )
+        for i in range(1, 6)
+    ]
+
+    mocker.patch('rhub.auth.tasks.di', new=di_mock)
+
+    auth_model.User.query.filter.return_value = users
+    # user1 and user2 found by batched search, user3 and user4 deleted from
+    # LDAP, user5 not found by name but exists (e.g. renamed)
+    ldap_client_mock.search_existing_users.side_effect = [
+        {'uid=user1,dc=example,dc=com', 'uid=user2,dc=example,dc=com'},
+        set(),
+        set(),
+    ]
+    ldap_client_mock.get.side_effect = lambda dn: ['entry'] if 'user5' in dn else []
+
+    query_result_mock = mocker.Mock()
+    openstack_model.Project.query.filter.return_value = query_result_mock
+    invalidate_mock = mocker.patch('rhub.lab.model.quota_usage_invalidate')
+
+    stats = auth_tasks.cleanup_users(chunk_size=2)
+
+    assert ldap_client_mock.search_existing_users.call_count == 3
+    assert ldap_client_mock.get.call_count == 3
+
+    assert [u.deleted for u in users] == [None, None, True, True, None]
+    assert messaging_mock.send.call_count == 2
+
+    query_result_mock.update.assert_called_once_with(
+        {'owner_id': manager.id},
+        synchronize_session='fetch',
+    )
+    invalidate_mock.assert_called_once_with(ANY, owner_ids=[3, 4, manager.id])
+
+    assert stats == {'checked': 5, 'removed': 2, 'duration': ANY}
+
+
+def test_cleanup_groups(mocker, di_mock, ldap_client_mock, db_session_mock):
+    admin_group = auth_model.Group(id=1, name='admins')
+    groups = [
+        auth_model.Group(id=i, ldap_dn=f'cn=group{i},dc=example,dc=com', name=f'group{i}')
+        for i in range(2, 5)
+    ]
+
+    mocker.patch('rhub.auth.tasks.di', new=di_mock)
+
+    auth_model.Group.query.filter.return_value.first.return_value = admin_group
+    auth_model.Group.query.filter.return_value.__iter__ = lambda _: iter(groups)
+    ldap_client_mock.search_existing_groups.return_value = {
+        'cn=group2,dc=example,dc=com',
+    }
+    ldap_client_mock.get.return_value = []
+
+    updated_models = []
+    for m in [lab_model.Region, openstack_model.Project, openstack_model.Cloud,
+              satellite_model.SatelliteServer, dns_model.DnsServer]:
+        m.query.filter.return_value.update.side_effect = (
+            lambda values, synchronize_session, m=m: updated_models.append((m, values))
+        )
+
+    stats = auth_tasks.cleanup_groups()
+
+    ldap_client_mock.search_existing_groups.assert_called_once_with(
+        ['group2', 'group3', 'group4'],
+    )
+    assert updated_models == [
+        (lab_model.Region, {'users_group_id': None}),
+        (lab_model.Region, {'owner_group_id': admin_group.id}),
+        (openstack_model.Project, {'group_id': None}),
+        (openstack_model.Cloud, {'owner_group_id': admin_group.id}),
+        (satellite_model.SatelliteServer, {'owner_group_id': admin_group.id}),
+        (dns_model.DnsServer, {'owner_group_id': admin_group.id}),
+    ]
+    assert [c.args[0] for c in db_session_mock.delete.call_args_list] == groups[1:]
+    db_session_mock.commit.assert_called_once()
+
+    assert stats == {'checked': 3, 'removed': 2, 'duration': ANY}
+
+
+
+def test_refresh_user(mocker, di_mock, ldap_client_mock, db_session_mock):
+    mocker.patch('rhub.auth.tasks.di', new=di_mock)
+    mocker.patch('rhub.auth.tasks.date_now').return_value = NOW
+
+    user = auth_model.User(
+        id=1,
+        ldap_dn='uid=user,dc=example,dc=com',
+        deleted=False,
+        updated_at=NOW - datetime.timedelta(days=1),
+    )
+    auth_model.User.query.get.return_value = user
+    update_from_ldap_mock = mocker.patch.object(auth_model.User, 'update_from_ldap')
+
+    auth_tasks.refresh_user.run(1)
+
+    update_from_ldap_mock.assert_called_once_with(ldap_client_mock)
+    assert user.updated_at == NOW
+    db_session_mock.commit.assert_called_once()
+
+
+def test_refresh_user_deleted(mocker, di_mock, db_session_mock):
+    mocker.patch('rhub.auth.tasks.di', new=di_mock)
+
+    auth_model.User.query.get.return_value = auth_model.User(
+        id=1, ldap_dn='uid=user,dc=example,dc=com', deleted=True,
+    )
+    update_from_ldap_mock = mocker.patch.object(auth_model.User, 'update_from_ldap')
+
+    auth_tasks.refresh_user.run(1)
+
+    update_from_ldap_mock.assert_not_called()
+    db_session_mock.commit.assert_not_called()
+
+@pytest.fixture
+def session_query_mock(mocker, db_session_mock):
+    """
+    Mock of `db.session.query`, results of queries are set in the returned
+    dict, keyed by tuple of queried entities.
+    """
+    results = {}
+
+    def query(*entities):
+        q = mocker.MagicMock()
+        rows = results.get(entities, [])
+        for chain in [q, q.filter.return_value, q.join.return_value.filter.return_value]:
+            chain.__iter__.side_effect = lambda: iter(rows)
+            chain.all.return_value = rows
+            del chain.keys  # dict() would treat the mock as a mapping
+        return q
+
+    db_session_mock.query.side_effect = query
+    yield results
+
+
+def test_update_users_bulk(mocker, di_mock, ldap_client_mock, db_session_mock,
+                           session_query_mock):
+    mocker.patch('rhub.auth.tasks.di', new=di_mock)
+
+    user = auth_model.User(
+        id=1,
+        ldap_dn='uid=user,dc=example,dc=com',
+        name='user',
+        email='old@example.com',
+        ssh_keys=[],
+        manager_id=2,
+    )
+    unchanged_user = auth_model.User(
+        id=3,
+        ldap_dn='uid=unchanged,dc=example,dc=com',
+        name='unchanged',
+        email='unchanged@example.com',
+        ssh_keys=[],
+        manager_id=None,
+    )
+
+    session_query_mock.update({
+        (auth_model.Group.ldap_dn, auth_model.Group.id): [
+            ('cn=new,dc=example,dc=com', 10),
+            ('cn=old,dc=example,dc=com', 11),
+        ],
+        (auth_model.User,): [user, unchanged_user],
+        (auth_model.User.ldap_dn, auth_model.User.id): [
+            ('uid=manager,dc=example,dc=com', 2),
+        ],
+        (auth_model.UserGroup.user_id, auth_model.UserGroup.group_id): [(1, 11)],
+    })
+
+    ldap_client_mock.search_users_paged.return_value = [[
+        {
+            'ldap_dn': 'uid=user,dc=example,dc=com',
+            'name': 'user',
+            'email': 'user@example.com',
+            'ssh_keys': [],
+            'manager': 'uid=manager,dc=example,dc=com',
+            'groups': [{'ldap_dn': 'cn=new,dc=example,dc=com'}],
+        },
+        {
+            'ldap_dn': 'uid=unchanged,dc=example,dc=com',
+            'name': 'unchanged',
+            'email': 'unchanged@example.com',
+            'ssh_keys': [],
+            'groups': [],
+        },
+    ]]
+
+    stats = auth_tasks.update_users(bulk=True)
+
+    ldap_client_mock.get.assert_not_called()
+    db_session_mock.bulk_update_mappings.assert_called_once_with(
+        auth_model.User,
+        [{'id': 1, 'updated_at': ANY, 'email': 'user@example.com'}],
+    )
+    assert db_session_mock.execute.call_count == 2  # insert + delete
+    db_session_mock.commit.assert_called_once()
+
+    assert stats == {
+        'users': 2,
+        'updated': 1,
+        'memberships_added': 1,
+        'memberships_removed': 1,
+        'modify_timestamp': None,
+    }
+
+
+def test_update_groups_bulk(mocker, di_mock, ldap_client_mock, db_session_mock,
+                            session_query_mock):
+    mocker.patch('rhub.auth.tasks.di', new=di_mock)
+
+    group = auth_model.Group(id=10, ldap_dn='cn=group,dc=example,dc=com', name='old')
+
+    session_query_mock.update({
+        (auth_model.Group,): [group],
+        (auth_model.User.ldap_dn, auth_model.User.id): [
+            ('uid=user,dc=example,dc=com', 1),
+        ],
+        (auth_model.UserGroup.user_id, auth_model.UserGroup.group_id): [(1, 10)],
+    })
+
+    ldap_client_mock.search_groups_paged.return_value = [[
+        {
+            'ldap_dn': 'cn=group,dc=example,dc=com',
+            'name': 'group',
+            'users': [
+                {'ldap_dn': 'uid=user,dc=example,dc=com'},
+                {'ldap_dn': 'uid=unknown,dc=example,dc=com'},
+            ],
+        },
+    ]]
+
+    stats = auth_tasks.update_groups(bulk=True)
+
+    db_session_mock.bulk_update_mappings.assert_called_once_with(
+        auth_model.Group, [{'id': 10, 'name': 'group'}],
+    )
+    db_session_mock.execute.assert_not_called()
+
+    assert stats == {
+        'groups': 1,
+        'updated': 1,
+        'memberships_added': 0,
+        'memberships_removed': 0,
+        'modify_timestamp': None,
+    }
+
+
+@pytest.fixture
+def ldap_sync_mocks(mocker, di_mock, ldap_client_mock, db_session_mock):
+    mocker.patch('rhub.auth.tasks.di', new=di_mock)
+    mocker.patch('rhub.auth.tasks.date_now').return_value = NOW
+    ldap_client_mock.config = {'server': 'ldap://ldap.example.com'}
+    ldap_client_mock.modified_since.side_effect = ldap.LdapClient.modified_since
+
+    mocks = {
+        name: mocker.patch(f'rhub.auth.tasks.{name}')
+        for name in ['cleanup_users', 'cleanup_groups',
+                     'update_users_bulk', 'update_groups_bulk']
+    }
+    mocks['update_users_bulk'].return_value = {
+        'modify_timestamp': NOW - datetime.timedelta(minutes=5),
+    }
+    mocks['update_groups_bulk'].return_value = {'modify_timestamp': None}
+    yield mocks
+
+
+def test_update_ldap_incremental_first_run(ldap_sync_mocks, db_session_mock):
+    auth_model.LdapSyncState.query.get.return_value = None
+
+    rv = auth_tasks.update_ldap_incremental()
+
+    assert rv['full_sync'] is True
+    ldap_sync_mocks['cleanup_users'].assert_called_once()
+    ldap_sync_mocks['cleanup_groups'].assert_called_once()
+    ldap_sync_mocks['update_users_bulk'].assert_called_once_with()
+    ldap_sync_mocks['update_groups_bulk'].assert_called_once_with()
+
+    state = db_session_mock.add.call_args.args[0]
+    assert state.server == 'ldap://ldap.example.com'
+    assert state.users_modify_timestamp == NOW - datetime.timedelta(minutes=5)
+    assert state.groups_modify_timestamp is None
+    assert state.last_full_sync == NOW
+    db_session_mock.commit.assert_called()
+
+
+def test_update_ldap_incremental(ldap_sync_mocks, db_session_mock):
+    state = auth_model.LdapSyncState(
+        server='ldap://ldap.example.com',
+        users_modify_timestamp=NOW - datetime.timedelta(hours=1),
+        groups_modify_timestamp=None,
+        last_full_sync=NOW - datetime.timedelta(hours=2),
+    )
+    auth_model.LdapSyncState.query.get.return_value = state
+
+    rv = auth_tasks.update_ldap_incremental()
+
+    assert rv['full_sync'] is False
+    ldap_sync_mocks['cleanup_users'].assert_not_called()
+    ldap_sync_mocks['cleanup_groups'].assert_not_called()
+    ldap_sync_mocks['update_users_bulk'].assert_called_once_with(
+        '(modifyTimestamp>=20240102110000Z)',
+    )
+    ldap_sync_mocks['update_groups_bulk'].assert_called_once_with(
+        '(modifyTimestamp>=20240102100000Z)',  # last full sync
+    )
+
+    assert state.users_modify_timestamp == NOW - datetime.timedelta(minutes=5)
+    assert state.last_full_sync == NOW - datetime.timedelta(hours=2)
+
+
+def test_update_ldap_incremental_full_sync_interval(ldap_sync_mocks):
+    auth_model.LdapSyncState.query.get.return_value = auth_model.LdapSyncState(
+        server='ldap://ldap.example.com',
+        users_modify_timestamp=NOW - datetime.timedelta(hours=1),
+        groups_modify_timestamp=NOW - datetime.timedelta(hours=1),
+        last_full_sync=NOW - datetime.timedelta(hours=2),
+    )
+
+    rv = auth_tasks.update_ldap_incremental(
+        full_sync_interval=datetime.timedelta(hours=2),
+    )
+
+    assert rv['full_sync'] is True
+    ldap_sync_mocks['cleanup_users'].assert_called_once()
@@ -1,4 +1,7 @@
 import pytest
+from werkzeug.exceptions import Forbidden
+
+from rhub.auth import model as auth_model
 from rhub.auth import utils as auth_utils
 
 
@@ -29,3 +32,83 @@ def test_normalize_ssh_key(original, normalized):
 def test_normalize_ssh_key_invalid(original):
     with pytest.raises(ValueError):
         auth_utils.normalize_ssh_key(original)
+
+
+@pytest.fixture
+def principal():
+    yield auth_utils.Principal(
+        auth_model.User(id=1, name='testuser'),
+        [
+            auth_model.Group(id=1, name='testgroup', roles=[]),
+            auth_model.Group(
+                id=2, name='clusteradmins', roles=[auth_model.Role.LAB_CLUSTER_ADMIN],
+            ),
+        ],
+    )
+
+
+@pytest.fixture
+def load_principal_mock(mocker, principal):
+    m = mocker.patch('rhub.auth.utils._load_principal')
+    m.return_value = principal
+    yield m
+
+
+def test_principal(principal):
+    assert principal.id == 1
+    assert principal.group_ids == {1, 2}
+    assert principal.group_names == {'testgroup', 'clusteradmins'}
+    assert not principal.is_admin
+    assert principal.is_cluster_admin
+    assert principal.has_role(auth_model.Role.LAB_CLUSTER_ADMIN)
+    assert not principal.has_role(auth_model.Role.ADMIN)
+
+
+def test_principal_admin():
+    principal = auth_utils.Principal(
+        auth_model.User(id=1, name='admin'),
+        [auth_model.Group(id=1, name='admins', roles=[auth_model.Role.ADMIN])],
+    )
+    assert principal.is_admin
+    assert principal.is_cluster_admin
+    assert principal.has_role(auth_model.Role.LAB_CLUSTER_ADMIN)
+
+
+def test_get_principal_request_scoped(client, load_principal_mock):
+    with client.application.test_request_context():
+        assert auth_utils.get_principal(1) is auth_utils.get_principal(1)
+        load_principal_mock.assert_called_once_with(1)
+
+    with client.application.test_request_context():
+        auth_utils.get_principal(1)
+    assert load_principal_mock.call_count == 2
+
+
+def test_get_principal_outside_request(load_principal_mock):
+    auth_utils.get_principal(1)
+    auth_utils.get_principal(1)
+    assert load_principal_mock.call_count == 2
+
+
+def test_user_group_ids(client, load_principal_mock):
+    with client.application.test_request_context():
+        group_ids = auth_utils.user_group_ids(1)
+        group_ids.add(100)
+        assert auth_utils.user_group_ids(1) == {1, 2}
+
+
+def test_route_require_role(client, load_principal_mock):
+    @auth_utils.route_require_role(auth_model.Role.LAB_CLUSTER_ADMIN)
+    def allowed(user):
+        return 'ok'
+
+    @auth_utils.route_require_role(auth_model.Role.ADMIN)
+    def forbidden(user):
+        return 'ok'
+
+    with client.application.test_request_context():
+        assert allowed(user=1) == 'ok'
+        with pytest.raises(Forbidden):
+            forbidden(user=1)
+
+    load_principal_mock.assert_called_once_with(1)
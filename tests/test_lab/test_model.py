@@ -0,0 +1,111 @@
+import pytest
+import sqlalchemy.orm
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm.attributes import set_committed_value
+
+from rhub.lab import model
+from rhub.openstack import model as openstack_model
+
+
+class SessionStub:
+    def __init__(self, new=(), dirty=(), deleted=()):
+        self.new = set(new)
+        self.dirty = set(dirty)
+        self.deleted = set(deleted)
+        self.info = {}
+
+
+@pytest.fixture
+def project():
+    project = openstack_model.Project(id=1, name='testproject')
+    set_committed_value(project, 'owner_id', 1)
+    return project
+
+
+@pytest.fixture
+def cluster():
+    cluster = model.Cluster(id=1, name='testcluster')
+    set_committed_value(cluster, 'region_id', 1)
+    set_committed_value(cluster, 'project_id', 1)
+    return cluster
+
+
+def _dirty(session):
+    model._quota_usage_track(session, None)
+    return session.info.get(model._QUOTA_USAGE_DIRTY)
+
+
+def test_quota_usage_track_host_added():
+    host = model.ClusterHost(id=1, cluster_id=1, fqdn='test0.localhost', num_vcpus=2)
+    assert _dirty(SessionStub(new=[host])) == {
+        'owner_ids': set(), 'cluster_ids': {1}, 'project_ids': set(),
+    }
+
+
+def test_quota_usage_track_host_moved():
+    host = model.ClusterHost(id=1, fqdn='test0.localhost')
+    set_committed_value(host, 'cluster_id', 1)
+    host.cluster_id = 2
+    assert _dirty(SessionStub(dirty=[host]))['cluster_ids'] == {1, 2}
+
+
+def test_quota_usage_track_cluster_unchanged(cluster):
+    cluster.description = 'changed'
+    assert _dirty(SessionStub(dirty=[cluster])) is None
+
+
+def test_quota_usage_track_cluster_deleted(cluster):
+    assert _dirty(SessionStub(deleted=[cluster]))['project_ids'] == {1}
+
+
+def test_quota_usage_track_project_owner(project):
+    project.owner_id = 2
+    assert _dirty(SessionStub(dirty=[project]))['owner_ids'] == {1, 2}
+
+
+def test_quota_usage_invalidate():
+    session = SessionStub()
+    model.quota_usage_invalidate(session, owner_ids=[1])
+    model.quota_usage_invalidate(session, cluster_ids=[2], project_ids=[3])
+    assert session.info[model._QUOTA_USAGE_DIRTY] == {
+        'owner_ids': {1}, 'cluster_ids': {2}, 'project_ids': {3},
+    }
+
+
+def test_quota_usage_verify(mocker):
+    mocker.patch.object(model.QuotaUsage, '_query_hosts_usage').return_value = [
+        (1, 1, 4, 8192, 2, 40),
+        (1, 2, 2, 4096, 1, 20),
+    ]
+    query_mock = mocker.patch.object(model.QuotaUsage, 'query')
+    query_mock.__iter__.return_value = [
+        model.QuotaUsage(region_id=1, owner_id=1, num_vcpus=4, ram_mb=8192,
+                         num_volumes=2, volumes_gb=40),
+        model.QuotaUsage(region_id=1, owner_id=2, num_vcpus=0, ram_mb=0,
+                         num_volumes=0, volumes_gb=0),
+        model.QuotaUsage(region_id=2, owner_id=3, num_vcpus=0, ram_mb=0,
+                         num_volumes=0, volumes_gb=0),
+    ]
+    refresh_mock = mocker.patch.object(model.QuotaUsage, 'refresh')
+    commit_mock = mocker.patch('rhub.lab.model.db.session.commit')
+
+    assert model.QuotaUsage.verify() == {(1, 2)}
+
+    refresh_mock.assert_called_once_with({2})
+    commit_mock.assert_called_once()
+
+
+def test_quota_usage_refresh_locks_owners(mocker):
+    execute_mock = mocker.patch('rhub.lab.model.db.session.execute')
+    mocker.patch.object(model.QuotaUsage, '_query_hosts_usage').return_value = (
+        sqlalchemy.orm.Query(model.ClusterHost)
+    )
+
+    model.QuotaUsage.refresh({3, 1})
+
+    lock, delete, insert = (c.args[0] for c in execute_mock.call_args_list)
+    sql = str(lock.compile(dialect=postgresql.dialect()))
+    assert sql.startswith('SELECT auth_user.id')
+    assert sql.endswith('ORDER BY auth_user.id FOR NO KEY UPDATE')
+    assert str(delete).startswith('DELETE FROM lab_quota_usage')
+    assert str(insert).startswith('INSERT INTO lab_quota_usage')
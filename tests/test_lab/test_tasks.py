@@ -0,0 +1,130 @@
+import datetime
+
+import pytest
+from celery.exceptions import Retry
+from dateutil.tz import tzutc
+
+from rhub.lab import model
+from rhub.lab import tasks as lab_tasks
+
+
+NOW = datetime.datetime(2021, 1, 1, 1, 0, 0, tzinfo=tzutc())
+
+
+@pytest.fixture
+def app_context(client, mocker):
+    mocker.patch.dict(client.application.config, {
+        'LAB_TOWER_LAUNCH_MAX_RETRIES': 3,
+        'LAB_TOWER_LAUNCH_RETRY_DELAY': 10,
+    })
+    with client.application.app_context():
+        yield
+
+
+@pytest.fixture
+def cluster(mocker):
+    cluster = model.Cluster(id=1, name='testcluster', status=model.ClusterStatus.QUEUED)
+    model.Cluster.query.get.return_value = cluster
+    mocker.patch('rhub.lab.tasks.date_now').return_value = NOW
+    yield cluster
+
+
+def test_launch_cluster_create(app_context, mocker, db_session_mock, cluster):
+    launch_mock = mocker.patch('rhub.lab.utils.launch_cluster_create')
+
+    lab_tasks.launch_cluster_create.run(1, 2)
+
+    launch_mock.assert_called_once_with(cluster, 2, launched_since=None)
+    db_session_mock.commit.assert_called_once()
+
+
+def test_launch_cluster_create_not_queued(app_context, mocker, db_session_mock, cluster):
+    cluster.status = model.ClusterStatus.ACTIVE
+    launch_mock = mocker.patch('rhub.lab.utils.launch_cluster_create')
+
+    lab_tasks.launch_cluster_create.run(1, 2)
+
+    launch_mock.assert_not_called()
+
+
+@pytest.mark.parametrize('retries, countdown', [(0, 10), (2, 40)])
+def test_launch_cluster_create_retry(app_context, mocker, db_session_mock, cluster,
+                                     retries, countdown):
+    exc = Exception('Tower is down')
+    mocker.patch('rhub.lab.utils.launch_cluster_create').side_effect = exc
+    retry_mock = mocker.patch.object(lab_tasks.launch_cluster_create, 'retry')
+    retry_mock.return_value = Retry()
+
+    lab_tasks.launch_cluster_create.push_request(retries=retries)
+    try:
+        with pytest.raises(Retry):
+            lab_tasks.launch_cluster_create.run(1, 2)
+    finally:
+        lab_tasks.launch_cluster_create.pop_request()
+
+    retry_mock.assert_called_once_with(
+        exc=exc, countdown=countdown, max_retries=3,
+        kwargs={'launched_since': NOW.isoformat()},
+    )
+    db_session_mock.rollback.assert_called_once()
+    assert cluster.status == model.ClusterStatus.QUEUED
+
+
+def test_launch_cluster_create_retry_launched_since(app_context, mocker, db_session_mock,
+                                                    cluster):
+    launch_mock = mocker.patch('rhub.lab.utils.launch_cluster_create')
+
+    lab_tasks.launch_cluster_create.push_request(retries=1)
+    try:
+        lab_tasks.launch_cluster_create.run(1, 2, launched_since='2021-01-01T00:30:00+00:00')
+    finally:
+        lab_tasks.launch_cluster_create.pop_request()
+
+    launch_mock.assert_called_once_with(
+        cluster, 2, launched_since=NOW - datetime.timedelta(minutes=30),
+    )
+
+
+def test_launch_cluster_create_retry_not_queued(app_context, mocker, db_session_mock,
+                                                cluster):
+    mocker.patch('rhub.lab.utils.launch_cluster_create').side_effect = Exception()
+    retry_mock = mocker.patch.object(lab_tasks.launch_cluster_create, 'retry')
+    retry_mock.side_effect = Exception('Broker is down')
+
+    lab_tasks.launch_cluster_create.run(1, 2)
+
+    retry_mock.assert_called_once()
+    assert cluster.status == model.ClusterStatus.CREATE_FAILED
+
+
+def test_launch_cluster_create_failed(app_context, mocker, db_session_mock, cluster):
+    mocker.patch('rhub.lab.utils.launch_cluster_create').side_effect = Exception()
+    retry_mock = mocker.patch.object(lab_tasks.launch_cluster_create, 'retry')
+
+    lab_tasks.launch_cluster_create.push_request(retries=3)
+    try:
+        lab_tasks.launch_cluster_create.run(1, 2)
+    finally:
+        lab_tasks.launch_cluster_create.pop_request()
+
+    retry_mock.assert_not_called()
+    assert cluster.status == model.ClusterStatus.CREATE_FAILED
+
+    event = db_session_mock.add.call_args.args[0]
+    assert isinstance(event, model.ClusterStatusChangeEvent)
+    assert event.old_value == model.ClusterStatus.QUEUED
+    assert event.new_value == model.ClusterStatus.CREATE_FAILED
+    db_session_mock.commit.assert_called_once()
+
+
+def test_launch_cluster_delete_failed(app_context, mocker, db_session_mock, cluster):
+    cluster.status = model.ClusterStatus.DELETION_QUEUED
+    mocker.patch('rhub.lab.utils.launch_cluster_delete').side_effect = Exception()
+
+    lab_tasks.launch_cluster_delete.push_request(retries=3)
+    try:
+        lab_tasks.launch_cluster_delete.run(1, 2)
+    finally:
+        lab_tasks.launch_cluster_delete.pop_request()
+
+    assert cluster.status == model.ClusterStatus.DELETE_FAILED
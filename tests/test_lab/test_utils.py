@@ -4,6 +4,7 @@ import pytest
 from dateutil.tz import tzutc
 
 from rhub.lab import model, utils
+from rhub.tower.client import TowerError
 
 
 @pytest.fixture
@@ -164,3 +165,128 @@ def test_calculate_cluster_usage(cluster, product_flavors, cluster_params, clust
     calculated_usage = utils.calculate_cluster_usage(cluster)
 
     assert calculated_usage == cluster_usage
+
+
+@pytest.fixture
+def tower_client(mocker, cluster):
+    cluster.region = model.Region(id=1, name='test', tower_id=1)
+    tower = mocker.patch.object(model.Region, 'tower')
+    mocker.patch.object(model.Cluster, 'tower_launch_extra_vars', {})
+    tower_client = tower.create_tower_client.return_value
+    tower_client.template_get.return_value = {'id': 123, 'name': 'dummy-create'}
+    tower_client.template_launch.return_value = {'id': 321}
+    yield tower_client
+
+
+def test_tower_template_get_cached(tower_client):
+    for _ in range(2):
+        assert utils.tower_template_get(1, tower_client, 'dummy-create') == {
+            'id': 123, 'name': 'dummy-create',
+        }
+    tower_client.template_get.assert_called_once_with(template_name='dummy-create')
+
+    utils.tower_template_get(2, tower_client, 'dummy-create')
+    assert tower_client.template_get.call_count == 2
+
+
+def test_tower_template_cache_invalidate(tower_client):
+    utils.tower_template_get(1, tower_client, 'dummy-create')
+    utils.tower_template_get(1, tower_client, 'dummy-delete')
+    utils.tower_template_get(2, tower_client, 'dummy-create')
+
+    utils.tower_template_cache_invalidate(['dummy-create'], tower_id=1)
+    assert len(utils.tower_template_cache) == 2
+
+    utils.tower_template_cache_invalidate(['dummy-create'])
+    assert len(utils.tower_template_cache) == 1
+
+    utils.tower_template_cache_invalidate()
+    assert len(utils.tower_template_cache) == 0
+
+
+def test_launch_cluster_create_cached_template(mocker, db_session_mock, cluster, tower_client):
+    mocker.patch('rhub.lab.utils.date_now')
+
+    utils.launch_cluster_create(cluster)
+    utils.launch_cluster_create(cluster)
+
+    tower_client.template_get.assert_called_once_with(template_name='dummy-create')
+    assert tower_client.template_launch.call_count == 2
+    assert cluster.status == model.ClusterStatus.QUEUED
+
+
+def test_launch_cluster_create_stale_template(mocker, db_session_mock, cluster, tower_client):
+    mocker.patch('rhub.lab.utils.date_now')
+    utils.tower_template_cache.set((1, 'dummy-create'), {'id': 100, 'name': 'dummy-create'})
+
+    response = mocker.Mock(status_code=404)
+    tower_client.template_launch.side_effect = [
+        TowerError('404 Error', response=response),
+        {'id': 321},
+    ]
+
+    utils.launch_cluster_create(cluster)
+
+    tower_client.template_get.assert_called_once_with(template_name='dummy-create')
+    assert [c.args[0] for c in tower_client.template_launch.call_args_list] == [100, 123]
+    assert utils.tower_template_cache.get((1, 'dummy-create'))['id'] == 123
+
+    cluster_event = db_session_mock.add.call_args.args[0]
+    assert cluster_event.tower_job_id == 321
+
+
+def test_launch_cluster_create_error(mocker, cluster, tower_client):
+    response = mocker.Mock(status_code=500)
+    tower_client.template_launch.side_effect = TowerError('500 Error', response=response)
+
+    with pytest.raises(TowerError):
+        utils.launch_cluster_create(cluster)
+
+    tower_client.template_launch.assert_called_once()
+
+
+@pytest.mark.parametrize(
+    'tower_jobs, launched',
+    [
+        pytest.param([], True, id='not-launched'),
+        pytest.param([{'id': 300, 'extra_vars': '{"rhub_cluster_id": 2}'}], True,
+                     id='other-cluster'),
+        pytest.param([{'id': 300, 'extra_vars': '{"rhub_cluster_id": 2}'},
+                      {'id': 299, 'extra_vars': '{"rhub_cluster_id": 1}'}], False,
+                     id='launched'),
+    ],
+)
+def test_launch_cluster_create_launched_since(mocker, db_session_mock, cluster, tower_client,
+                                              tower_jobs, launched):
+    mocker.patch('rhub.lab.utils.date_now')
+    tower_client.template_jobs_list.return_value = tower_jobs
+    launched_since = datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc)
+
+    utils.launch_cluster_create(cluster, launched_since=launched_since)
+
+    tower_client.template_jobs_list.assert_called_once_with(
+        123, {'created__gte': '2021-01-01T00:00:00+00:00', 'order_by': '-id'},
+    )
+    cluster_event = db_session_mock.add.call_args.args[0]
+    if launched:
+        tower_client.template_launch.assert_called_once()
+        assert cluster_event.tower_job_id == 321
+    else:
+        tower_client.template_launch.assert_not_called()
+        assert cluster_event.tower_job_id == 299
+
+
+def test_warm_tower_template_cache(mocker, product, tower_client):
+    tower = mocker.Mock()
+    tower.create_tower_client.return_value = tower_client
+    region_product = mocker.Mock(product=product)
+    region_product.region.tower_id = 1
+    region_product.region.tower = tower
+
+    query_mock = mocker.patch.object(model.RegionProduct, 'query')
+    query_mock.join.return_value.join.return_value.filter.return_value = [region_product]
+
+    utils.warm_tower_template_cache()
+
+    assert utils.tower_template_cache.get((1, 'dummy-create')) is not None
+    assert utils.tower_template_cache.get((1, 'dummy-delete')) is not None
@@ -0,0 +1,205 @@
+import pytest
+
+from rhub.tower import client
+
+
+@pytest.fixture
+def monotonic_mock(mocker):
+    m = mocker.patch('time.monotonic')
+    m.return_value = 1000.0
+    yield m
+
+
+@pytest.fixture
+def credentials():
+    yield {'username': 'user', 'password': 'pass'}
+
+
+@pytest.fixture
+def read_credentials(mocker, credentials):
+    yield mocker.Mock(side_effect=lambda: dict(credentials))
+
+
+@pytest.fixture
+def registry():
+    yield client.TowerClientRegistry(credentials_ttl=60)
+
+
+def _get(registry, read_credentials, server_id=1, url='https://tower.example.com'):
+    return registry.get(server_id, url, True, 'kv/test', read_credentials)
+
+
+def test_registry_reuse(registry, read_credentials, monotonic_mock):
+    tower1 = _get(registry, read_credentials)
+    tower2 = _get(registry, read_credentials)
+
+    assert tower1 is tower2
+    assert tower1.username == 'user'
+    assert tower1.adapter is registry._adapter
+    assert tower1._session.get_adapter('https://tower.example.com') is registry._adapter
+    read_credentials.assert_called_once()
+
+    stats = registry.stats()
+    assert stats['clients'] == 1
+    assert stats['misses'] == 1
+    assert stats['hits'] == 1
+    assert stats['credentials_reads'] == 1
+    assert stats['hit_rate'] == 0.5
+
+
+def test_registry_shared_pool(registry, read_credentials, monotonic_mock):
+    tower1 = _get(registry, read_credentials, server_id=1)
+    tower2 = _get(registry, read_credentials, server_id=2, url='https://tower2.example.com')
+
+    assert tower1 is not tower2
+    assert tower1.adapter is tower2.adapter
+
+
+def test_registry_credentials_unchanged(registry, read_credentials, monotonic_mock):
+    tower1 = _get(registry, read_credentials)
+
+    monotonic_mock.return_value += 61
+    tower2 = _get(registry, read_credentials)
+
+    assert tower1 is tower2
+    assert read_credentials.call_count == 2
+
+    monotonic_mock.return_value += 30
+    _get(registry, read_credentials)
+    assert read_credentials.call_count == 2
+
+
+def test_registry_credentials_changed(registry, read_credentials, credentials,
+                                      monotonic_mock):
+    tower1 = _get(registry, read_credentials)
+
+    credentials['password'] = 'new'
+    monotonic_mock.return_value += 61
+    tower2 = _get(registry, read_credentials)
+
+    assert tower1 is not tower2
+    assert tower2.password == 'new'
+    assert registry.stats()['rebuilds'] == 1
+
+
+def test_registry_server_changed(registry, read_credentials, monotonic_mock):
+    tower1 = _get(registry, read_credentials)
+    tower2 = _get(registry, read_credentials, url='https://new.example.com')
+
+    assert tower1 is not tower2
+    assert tower2.url == 'https://new.example.com'
+    assert registry.stats()['rebuilds'] == 1
+
+
+def test_registry_invalidate(registry, read_credentials, monotonic_mock):
+    tower1 = _get(registry, read_credentials)
+    registry.invalidate(1)
+    tower2 = _get(registry, read_credentials)
+
+    assert tower1 is not tower2
+    assert registry.stats()['misses'] == 2
+
+
+def test_registry_missing_credentials(registry, read_credentials, monotonic_mock):
+    read_credentials.side_effect = RuntimeError('Missing credentials')
+
+    with pytest.raises(RuntimeError):
+        _get(registry, read_credentials)
+
+    assert registry.stats()['clients'] == 0
+
+
+def test_registry_fork(registry, read_credentials, mocker, monotonic_mock):
+    tower1 = _get(registry, read_credentials)
+
+    mocker.patch('os.getpid').return_value = registry._pid + 1
+    tower2 = _get(registry, read_credentials)
+
+    assert tower1 is not tower2
+    assert tower1.adapter is not tower2.adapter
+
+
+def test_credentials_version():
+    assert (client.credentials_version({'username': 'a', 'password': 'b'})
+            == client.credentials_version({'password': 'b', 'username': 'a'}))
+    assert (client.credentials_version({'username': 'a', 'password': 'b'})
+            != client.credentials_version({'username': 'a', 'password': 'c'}))
+
+
+@pytest.fixture
+def tower():
+    yield client.Tower(url='https://tower.example.com', username='user', password='pass')
+
+
+def test_template_job_stdout_stream(tower, mocker):
+    response = mocker.Mock(ok=True)
+    response.iter_content.return_value = iter([b'a', b'b'])
+    request_mock = mocker.patch.object(tower._session, 'request')
+    request_mock.return_value = response
+
+    chunks = tower.template_job_stdout_stream(1)
+
+    assert request_mock.call_args.kwargs['params'] == {'format': 'txt_download'}
+    assert request_mock.call_args.kwargs['stream'] is True
+    response.close.assert_not_called()
+
+    assert list(chunks) == [b'a', b'b']
+    response.close.assert_called_once()
+
+
+@pytest.mark.parametrize(
+    'start_line, end_line, lines',
+    [
+        pytest.param(99990, None, range(99990, 100000), id='start'),
+        pytest.param(None, 10, range(0, 10), id='end'),
+        pytest.param(500, 1500, range(500, 1500), id='range'),
+        pytest.param(200000, None, [], id='past-end'),
+    ],
+)
+def test_template_job_stdout_stream_lines(tower, mocker, start_line, end_line, lines):
+    # Output too large for Tower to display in `txt` format, split to chunks
+    # in the middle of lines.
+    output = b''.join(f'line {i}\n'.encode() for i in range(100000))
+    consumed = []
+
+    def iter_content(chunk_size):
+        for i in range(0, len(output), 1000):
+            consumed.append(i)
+            yield output[i:i + 1000]
+
+    response = mocker.Mock(ok=True)
+    response.iter_content.side_effect = iter_content
+    request_mock = mocker.patch.object(tower._session, 'request')
+    request_mock.return_value = response
+
+    chunks = tower.template_job_stdout_stream(
+        1, start_line=start_line, end_line=end_line, chunk_size=4096,
+    )
+
+    assert request_mock.call_args.kwargs['params'] == {'format': 'txt_download'}
+    assert b''.join(chunks) == b''.join(f'line {i}\n'.encode() for i in lines)
+    response.close.assert_called_once()
+
+    if end_line is not None:
+        # Download is stopped at the end line.
+        assert len(consumed) < len(output) // 1000
+
+
+def test_template_job_stdout_stream_lines_no_trailing_newline(tower, mocker):
+    response = mocker.Mock(ok=True)
+    response.iter_content.return_value = iter([b'a\nb', b'\nc'])
+    mocker.patch.object(tower._session, 'request').return_value = response
+
+    chunks = tower.template_job_stdout_stream(1, start_line=1)
+
+    assert b''.join(chunks) == b'b\nc'
+
+
+def test_template_job_stdout_stream_error(tower, mocker):
+    response = mocker.Mock(ok=False, status_code=404)
+    mocker.patch.object(tower._session, 'request').return_value = response
+
+    with pytest.raises(client.TowerError):
+        tower.template_job_stdout_stream(1)
+
+    response.close.assert_called_once()
@@ -0,0 +1,43 @@
+import pytest
+
+from rhub.tower import model
+
+
+@pytest.mark.parametrize(
+    'processed, job_status, claimed',
+    [
+        ([], 'running', True),
+        ([], 'successful', True),
+        (['running'], 'successful', True),
+        (['pending', 'running'], 'failed', True),
+        (['running'], 'running', False),
+        (['successful'], 'successful', False),
+        (['successful'], 'running', False),
+        (['failed'], 'successful', False),
+        (['canceled'], 'pending', False),
+    ],
+)
+def test_processed_notification_claim(db_session_mock, processed, job_status, claimed):
+    db_session_mock.query.return_value.filter.return_value = [(s,) for s in processed]
+    db_session_mock.execute.return_value.rowcount = 1
+
+    assert model.ProcessedNotification.claim(1, 321, job_status) is claimed
+
+    # Advisory lock of the job, and insert if claimed.
+    assert db_session_mock.execute.call_count == (2 if claimed else 1)
+    lock = db_session_mock.execute.call_args_list[0].args[0]
+    assert 'pg_advisory_xact_lock' in str(lock)
+
+
+def test_processed_notification_claim_conflict(db_session_mock):
+    db_session_mock.query.return_value.filter.return_value = []
+    db_session_mock.execute.return_value.rowcount = 0
+
+    assert model.ProcessedNotification.claim(1, 321, 'successful') is False
+
+
+def test_processed_notification_claim_unknown_status(db_session_mock):
+    db_session_mock.query.return_value.filter.return_value = [('successful',)]
+    db_session_mock.execute.return_value.rowcount = 1
+
+    assert model.ProcessedNotification.claim(1, 321, 'unknown') is True
@@ -0,0 +1,212 @@
+import gzip
+import os
+
+import pytest
+
+from rhub.tower import output_cache
+
+
+OUTPUT = b''.join(f'line {i}\n'.encode() for i in range(10))
+
+
+@pytest.fixture
+def cache(tmp_path, mocker):
+    cache = output_cache.JobOutputCache(str(tmp_path), max_size=1024 * 1024, chunk_size=16)
+    mocker.patch.object(output_cache, 'job_output_cache', cache)
+    yield cache
+
+
+@pytest.fixture
+def server(mocker):
+    server = mocker.Mock(id=1)
+    tower_client = server.create_tower_client.return_value
+    tower_client.template_job_get.return_value = {'id': 1, 'finished': '2021-01-01T00:00:00Z'}
+    tower_client.template_job_stdout_stream.side_effect = (
+        lambda *args, **kwargs: iter([OUTPUT[:20], OUTPUT[20:]])
+    )
+    yield server
+
+
+def test_cache_store_read(cache):
+    chunks = cache.store(1, 1, iter([OUTPUT[:20], OUTPUT[20:]]))
+    assert cache.read(1, 1) is None
+
+    assert b''.join(chunks) == OUTPUT
+    assert b''.join(cache.read(1, 1)) == OUTPUT
+
+    with gzip.open(os.path.join(cache.directory, '1', '1.txt.gz')) as f:
+        assert f.read() == OUTPUT
+
+
+@pytest.mark.parametrize(
+    'start_line, end_line, expected',
+    [
+        (8, None, b'line 8\nline 9\n'),
+        (None, 2, b'line 0\nline 1\n'),
+        (3, 5, b'line 3\nline 4\n'),
+        (20, None, b''),
+    ],
+)
+def test_cache_read_lines(cache, start_line, end_line, expected):
+    for _ in cache.store(1, 1, iter([OUTPUT])):
+        pass
+
+    assert b''.join(cache.read(1, 1, start_line, end_line)) == expected
+
+
+@pytest.mark.parametrize(
+    'start_line, end_line',
+    [
+        pytest.param(None, None, id='all'),
+        pytest.param(3, None, id='lines'),
+    ],
+)
+@pytest.mark.parametrize(
+    'data',
+    [
+        pytest.param(gzip.compress(OUTPUT)[:-10], id='truncated'),
+        pytest.param(b'not gzip', id='not-gzip'),
+    ],
+)
+def test_cache_read_corrupted(cache, start_line, end_line, data):
+    path = os.path.join(cache.directory, '1', '1.txt.gz')
+    os.makedirs(os.path.dirname(path))
+    with open(path, 'wb') as f:
+        f.write(data)
+
+    for _ in cache.read(1, 1, start_line, end_line):
+        pass
+
+    assert not os.path.exists(path)
+    assert cache.read(1, 1) is None
+
+
+def test_cache_read_evicted(cache, mocker):
+    mocker.patch('os.utime', side_effect=FileNotFoundError)
+    gzip_open_mock = mocker.patch('gzip.open')
+
+    assert cache.read(1, 1) is None
+    gzip_open_mock.assert_not_called()
+
+
+def test_cache_store_incomplete(cache):
+    chunks = cache.store(1, 1, iter([OUTPUT[:20], OUTPUT[20:]]))
+    next(chunks)
+    chunks.close()
+
+    assert cache.read(1, 1) is None
+    assert os.listdir(os.path.join(cache.directory, '1')) == []
+
+
+def test_cache_store_not_started(cache):
+    cache.store(1, 1, iter([OUTPUT]))
+
+    assert not os.path.exists(os.path.join(cache.directory, '1'))
+
+
+def test_cache_store_size_total(cache, mocker):
+    walk_spy = mocker.spy(os, 'walk')
+
+    for job_id in range(3):
+        for _ in cache.store(1, job_id, iter([OUTPUT])):
+            pass
+
+    # Directory is scanned only to compute the initial total.
+    assert walk_spy.call_count == 1
+    size = os.path.getsize(os.path.join(cache.directory, '1', '0.txt.gz'))
+    assert cache._total_size == size * 3
+
+    cache.max_size = size * 3
+    for _ in cache.store(1, 3, iter([OUTPUT])):
+        pass
+
+    assert walk_spy.call_count == 2
+    assert cache._total_size == size * 3
+    assert len(os.listdir(os.path.join(cache.directory, '1'))) == 3
+
+
+def test_cache_evict_stale_tmp(cache):
+    os.makedirs(os.path.join(cache.directory, '1'))
+    stale = os.path.join(cache.directory, '1', '.1.stale.tmp')
+    fresh = os.path.join(cache.directory, '1', '.2.fresh.tmp')
+    for path in [stale, fresh]:
+        with open(path, 'wb') as f:
+            f.write(b'x')
+    os.utime(stale, (1000, 1000))
+
+    cache.evict()
+
+    assert os.listdir(os.path.join(cache.directory, '1')) == ['.2.fresh.tmp']
+
+
+def test_cache_evict_lru(cache):
+    for job_id in range(3):
+        for _ in cache.store(1, job_id, iter([OUTPUT])):
+            pass
+        path = os.path.join(cache.directory, '1', f'{job_id}.txt.gz')
+        os.utime(path, (1000 + job_id, 1000 + job_id))
+
+    # Read makes the job 0 the most recently used.
+    cache.read(1, 0)
+
+    size = os.path.getsize(os.path.join(cache.directory, '1', '0.txt.gz'))
+    cache.max_size = size * 2
+    cache.evict()
+
+    assert sorted(os.listdir(os.path.join(cache.directory, '1'))) == [
+        '0.txt.gz', '2.txt.gz',
+    ]
+
+
+def test_cache_disabled(tmp_path):
+    cache = output_cache.JobOutputCache(str(tmp_path), max_size=0)
+    assert not cache.enabled
+    assert cache.read(1, 1) is None
+
+
+def test_job_output_stream_finished(cache, server):
+    tower_client = server.create_tower_client.return_value
+
+    assert b''.join(output_cache.job_output_stream(server, 1)) == OUTPUT
+    assert b''.join(output_cache.job_output_stream(server, 1)) == OUTPUT
+    assert b''.join(output_cache.job_output_stream(server, 1, 9)) == b'line 9\n'
+
+    server.create_tower_client.assert_called_once()
+    tower_client.template_job_stdout_stream.assert_called_once_with(1)
+
+
+def test_job_output_stream_finished_lines(cache, server, mocker):
+    tower_client = server.create_tower_client.return_value
+    fill_spy = mocker.spy(cache, 'fill_in_background')
+
+    assert b''.join(output_cache.job_output_stream(server, 1, 1, 2)) == OUTPUT
+    fill_spy.spy_return.join()
+
+    # Requested lines are streamed from Tower, the whole output is stored in
+    # background.
+    tower_client.template_job_stdout_stream.assert_has_calls([
+        mocker.call(1),
+        mocker.call(1, start_line=1, end_line=2),
+    ], any_order=True)
+    assert b''.join(cache.read(1, 1)) == OUTPUT
+
+
+def test_job_output_stream_running(cache, server):
+    tower_client = server.create_tower_client.return_value
+    tower_client.template_job_get.return_value = {'id': 1, 'finished': None}
+
+    assert b''.join(output_cache.job_output_stream(server, 1, 5)) == OUTPUT
+
+    tower_client.template_job_stdout_stream.assert_called_once_with(
+        1, start_line=5, end_line=None,
+    )
+    assert cache.read(1, 1) is None
+
+
+def test_job_output_stream_cache_disabled(cache, server):
+    cache.max_size = 0
+    tower_client = server.create_tower_client.return_value
+
+    b''.join(output_cache.job_output_stream(server, 1))
+
+    tower_client.template_job_get.assert_not_called()
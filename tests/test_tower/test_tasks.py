@@ -0,0 +1,136 @@
+import datetime
+
+import pytest
+import requests
+import sqlalchemy.exc
+from celery.exceptions import Retry
+from dateutil.tz import tzutc
+
+from rhub.tower import model
+from rhub.tower import tasks as tower_tasks
+from rhub.tower.client import TowerError
+
+
+NOW = datetime.datetime(2021, 1, 1, 1, 0, 0, tzinfo=tzutc())
+
+
+@pytest.fixture
+def app_context(client, mocker):
+    mocker.patch.dict(client.application.config, {
+        'TOWER_WEBHOOK_MAX_RETRIES': 3,
+        'TOWER_WEBHOOK_RETRY_DELAY': 10,
+    })
+    with client.application.app_context():
+        yield
+
+
+@pytest.fixture
+def notification(mocker):
+    notification = model.WebhookNotification(
+        id=1,
+        tower_job_id=321,
+        job_status='successful',
+        payload={'id': 321, 'status': 'successful', 'extra_vars': '{"rhub_cluster_id": 1}'},
+    )
+    mocker.patch.object(model.WebhookNotification, 'query').get.return_value = notification
+    yield notification
+
+
+def _tower_error(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    return TowerError(response=response)
+
+
+@pytest.mark.parametrize(
+    'exc, retried',
+    [
+        pytest.param(_tower_error(503), True, id='tower-5xx'),
+        pytest.param(requests.ConnectionError(), True, id='connection'),
+        pytest.param(_tower_error(404), False, id='tower-4xx'),
+        pytest.param(ValueError(), False, id='other'),
+    ],
+)
+def test_process_webhook_notification_retry(app_context, mocker, db_session_mock,
+                                            notification, exc, retried):
+    mocker.patch('rhub.lab.model.Cluster.query').get.side_effect = exc
+    retry_mock = mocker.patch.object(tower_tasks.process_webhook_notification, 'retry')
+    retry_mock.return_value = Retry()
+
+    tower_tasks.process_webhook_notification.push_request(retries=1)
+    try:
+        if retried:
+            with pytest.raises(Retry):
+                tower_tasks.process_webhook_notification.run(1)
+        else:
+            tower_tasks.process_webhook_notification.run(1)
+    finally:
+        tower_tasks.process_webhook_notification.pop_request()
+
+    db_session_mock.rollback.assert_called_once()
+    assert notification.processed_at is None
+    if retried:
+        retry_mock.assert_called_once_with(exc=exc, countdown=20, max_retries=3)
+    else:
+        retry_mock.assert_not_called()
+
+
+def test_requeue_webhook_notifications(app_context, mocker, db_session_mock):
+    mocker.patch('rhub.tower.tasks.date_now').return_value = NOW
+    query = db_session_mock.query.return_value.filter.return_value
+    query.all.return_value = [(1, 'successful'), (2, 'running')]
+    apply_async_mock = mocker.patch(
+        'rhub.tower.tasks.process_webhook_notification.apply_async',
+    )
+
+    queued = tower_tasks.requeue_webhook_notifications(
+        min_age=datetime.timedelta(minutes=10),
+        max_age=datetime.timedelta(hours=24),
+    )
+
+    assert queued == 2
+    apply_async_mock.assert_has_calls([
+        mocker.call((1,), {'recheck': False}),
+        mocker.call((2,), {'recheck': True}),
+    ])
+
+
+def test_cleanup_webhook_notifications(app_context, mocker, db_session_mock):
+    mocker.patch('rhub.tower.tasks.date_now').return_value = NOW
+    notification_query = mocker.patch.object(model.WebhookNotification, 'query')
+    notification_query.filter.return_value.delete.return_value = 5
+    ledger_query = mocker.patch.object(model.ProcessedNotification, 'query')
+    ledger_query.filter.return_value.delete.return_value = 3
+
+    deleted = tower_tasks.cleanup_webhook_notifications(datetime.timedelta(days=30))
+
+    assert deleted == {'notifications': 5, 'ledger': 3}
+    db_session_mock.commit.assert_called_once()
+
+
+def test_process_webhook_notification_send_after_commit(
+    app_context, mocker, db_session_mock, di_mock, messaging_mock, notification,
+):
+    mocker.patch('rhub.tower.tasks.di', new=di_mock)
+    mocker.patch('rhub.lab.model.Cluster.query')
+    mocker.patch.object(model.ProcessedNotification, 'claim').return_value = True
+    handler_mock = mocker.patch('rhub.lab.utils.cluster_notification_handler')
+    handler_mock.return_value = [('lab.cluster.create', 'msg', {'cluster_id': 1})]
+    retry_mock = mocker.patch.object(tower_tasks.process_webhook_notification, 'retry')
+    retry_mock.return_value = Retry()
+
+    db_session_mock.commit.side_effect = [
+        sqlalchemy.exc.OperationalError('COMMIT', {}, Exception()),
+        None,
+    ]
+
+    with pytest.raises(Retry):
+        tower_tasks.process_webhook_notification.run(1)
+    messaging_mock.send.assert_not_called()
+
+    tower_tasks.process_webhook_notification.run(1)
+
+    assert handler_mock.call_count == 2
+    messaging_mock.send.assert_called_once_with(
+        'lab.cluster.create', 'msg', extra={'cluster_id': 1},
+    )